@@ -0,0 +1,361 @@
+import itertools
+import json
+import multiprocessing
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from utils.lru import LRUCache
+
+# Words of a query for the lightweight analysis, SpaCy and NLTK are only imported when a
+# model is needed
+WORD = re.compile(r"[^\W\d_]+")
+
+# Analyzer used by the worker processes, inherited from the parent when forking
+_worker_analyzer = None
+# Keys of the term and word caches of the worker already known to the parent
+_worker_sent = (set(), set())
+
+
+def _init_worker(lem_model, stem_model):
+    """
+    This function loads an analyzer in a worker process that could not inherit one.
+
+    :param str lem_model: the SpaCy model to use for lemmatization.
+    :param str stem_model: the Snowball stemmer to use for stemming.
+
+    """
+    global _worker_analyzer, _worker_sent
+    if _worker_analyzer is None:
+        _worker_analyzer = Analyzer(lem_model, stem_model)
+    # A forked worker starts with the caches of the parent
+    _worker_sent = (
+        {key for key, _ in _worker_analyzer.term_cache.items()},
+        {key for key, _ in _worker_analyzer.word_cache.items()},
+    )
+
+
+def _analyze_chunk(args):
+    """
+    This function analyzes a chunk of documents in a worker process.
+
+    :param tuple args: the documents and whether to stem them.
+    :return: the analyzed documents and the term and word cache entries computed for them.
+
+    """
+    docs, stem = args
+    analyzed_docs = _worker_analyzer.analyze(docs, stem=stem)
+    # The caches are kept across the chunks, only their new entries are sent
+    new_items = []
+    for cache, sent in zip(
+        (_worker_analyzer.term_cache, _worker_analyzer.word_cache), _worker_sent
+    ):
+        items = [(key, value) for key, value in cache.items() if key not in sent]
+        sent.update(key for key, _ in items)
+        new_items.append(items)
+    return (analyzed_docs, *new_items)
+
+
+class Analyzer:
+    def __init__(
+        self,
+        lem_model="fr_core_news_sm",
+        stem_model="french",
+        n_process=1,
+        batch_size=1000,
+        nlp=None,
+        cache_size=100000,
+    ):
+        """
+        This function initializes the Analyzer class, which turns texts into the lemmatized
+        and stemmed tokens stored in the indexes.
+
+        :param str lem_model: the SpaCy model to use for lemmatization.
+        :param str stem_model: the Snowball stemmer to use for stemming.
+        :param int n_process: the number of processes to analyze large collections with,
+            -1 to use all the cores.
+        :param int batch_size: the number of documents sent at once to each process.
+        :param spacy.Language nlp: an already loaded SpaCy pipeline to use instead of lem_model.
+            Otherwise, lem_model is only loaded when a text has to go through the pipeline.
+        :param int cache_size: the maximum number of entries of the term, word and query
+            caches.
+
+        """
+        self.lem_model = lem_model
+        self.stem_model = stem_model
+        self.n_process = os.cpu_count() if n_process == -1 else n_process
+        self.batch_size = batch_size
+        self._nlp = nlp
+        self._stemmer = None
+        self._lock = Lock()
+
+        # Natural language vocabularies are Zipfian, so most lemmas and queries repeat
+        self.term_cache = LRUCache(cache_size)  # {lemma: normalized term}
+        self.query_cache = LRUCache(cache_size)  # {query: [normalized terms]}
+        # {lowercased word: normalized term, "" for stop words}, filled while analyzing
+        # documents, so that most queries are analyzed without the pipeline
+        self.word_cache = LRUCache(cache_size)
+
+    @property
+    def nlp(self):
+        """
+        The SpaCy pipeline, loaded on first use.
+        """
+        if self._nlp is None:
+            self.load()
+        return self._nlp
+
+    @property
+    def stemmer(self):
+        """
+        The Snowball stemmer, loaded on first use, or None if there is no stem_model.
+        """
+        if self._stemmer is None and self.stem_model:
+            from nltk.stem import SnowballStemmer
+
+            self._stemmer = SnowballStemmer(self.stem_model)
+        return self._stemmer
+
+    @property
+    def loaded(self):
+        """
+        Whether the SpaCy pipeline is loaded.
+        """
+        return self._nlp is not None
+
+    def load(self):
+        """
+        This function loads the SpaCy model, downloading it if it is not installed.
+
+        """
+        with self._lock:
+            if self._nlp is not None:
+                return
+            import spacy
+
+            # Check if the SpaCy model is installed
+            if not spacy.util.is_package(self.lem_model):
+                print(f"Downloading {self.lem_model} model ...")
+                spacy.cli.download(self.lem_model)
+
+            # Load the SpaCy model
+            print(f"Loading {self.lem_model} model ...")
+            self._nlp = spacy.load(self.lem_model)
+
+    def normalize(self, lemma):
+        """
+        This function lowercases and stems a lemma, memoizing the result.
+
+        :param str lemma: the lemma of a token.
+        :return: the normalized term.
+
+        """
+        term = self.term_cache.get(lemma)
+        if term is None:
+            term = lemma.lower()
+            if self.stemmer:
+                term = self.stemmer.stem(term)
+            self.term_cache.put(lemma, term)
+        return term
+
+    def analyze(self, docs, stem=True):
+        """
+        This function lemmatizes, filters and stems a list of documents in a single pass.
+        Only alphabetic tokens that are not stop words are kept.
+
+        :param list docs: the documents to analyze.
+        :param bool stem: whether to stem the lemmas.
+        :return: the list of tokens of each document.
+
+        """
+        normalize = self.normalize if stem else str.lower
+        words = self.word_cache
+        analyzed_docs = []
+        for doc in self.nlp.pipe(
+            docs, disable=["parser", "ner"], batch_size=self.batch_size
+        ):
+            terms = []
+            for token in doc:
+                if not token.is_alpha:
+                    # Elisions such as "l'" are dropped, like their letters in a query
+                    if stem:
+                        for word in WORD.findall(token.lower_):
+                            if word not in words:
+                                words.put(word, "")
+                    continue
+                term = "" if token.is_stop else normalize(token.lemma_)
+                if term:
+                    terms.append(term)
+                # Remember the term of each word for the analysis of the queries
+                if stem and token.lower_ not in words:
+                    words.put(token.lower_, term)
+            analyzed_docs.append(terms)
+        return analyzed_docs
+
+    def analyze_words(self, text):
+        """
+        This function analyzes a text without the SpaCy pipeline, by looking up the term of
+        each of its words in the word cache.
+
+        :param str text: the text.
+        :return: the normalized terms of the text, or None if a word is not in the cache.
+
+        """
+        terms = []
+        for word in WORD.findall(text.lower()):
+            term = self.word_cache.get(word)
+            if term is None:
+                return None
+            if term:
+                terms.append(term)
+        return terms
+
+    def analyze_query(self, query):
+        """
+        This function analyzes a query, memoizing the result so that repeated queries do
+        not go through the SpaCy pipeline again. The queries whose words were all seen
+        while indexing are always analyzed with the word cache, whether the pipeline is
+        loaded or not, so that a query is analyzed the same way before and after the model
+        is preloaded.
+
+        :param str query: the query.
+        :return: the normalized terms of the query.
+
+        """
+        terms = self.query_cache.get(query)
+        if terms is None:
+            terms = self.analyze_words(query)
+            if terms is None:
+                terms = self.analyze([query])[0]
+            self.query_cache.put(query, terms)
+        return list(terms)
+
+    def cache_stats(self):
+        """
+        This function returns the usage statistics of the caches.
+
+        :return: a dictionary with the statistics of the term, word and query caches.
+
+        """
+        return {
+            "term": self.term_cache.stats(),
+            "word": self.word_cache.stats(),
+            "query": self.query_cache.stats(),
+        }
+
+    def save_cache(self, path):
+        """
+        This function saves the term and word caches, e.g. next to the indexes.
+
+        :param str path: the path to the JSON file.
+
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"terms": self.term_cache.items(), "words": self.word_cache.items()},
+                f,
+                ensure_ascii=False,
+            )
+
+    def load_cache(self, path):
+        """
+        This function warms the term and word caches with a file saved by save_cache.
+
+        :param str path: the path to the JSON file.
+
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if isinstance(cache, list):
+            # Term cache saved before the word cache existed
+            cache = {"terms": cache}
+        self.term_cache.update(cache.get("terms", []))
+        self.word_cache.update(cache.get("words", []))
+
+    def analyze_parallel(self, docs, stem=True):
+        """
+        This function analyzes a list of documents across n_process processes. The output
+        is the same as analyze.
+
+        :param list docs: the documents to analyze.
+        :param bool stem: whether to stem the lemmas.
+        :return: the list of tokens of each document.
+
+        """
+        return list(self.analyze_stream(docs, stem=stem))
+
+    def analyze_stream(self, docs, stem=True):
+        """
+        This function analyzes a stream of documents in chunks of batch_size, spread across
+        n_process processes. At most two chunks per process are in flight, so that memory
+        does not grow with the number of documents, and the documents are yielded in order.
+
+        :param iterable docs: the documents to analyze.
+        :param bool stem: whether to stem the lemmas.
+        :return: an iterator over the list of tokens of each document.
+
+        """
+        chunks = self._chunks(docs)
+        first_chunk = next(chunks, None)
+        second_chunk = next(chunks, None)
+        if self.n_process <= 1 or second_chunk is None:
+            for chunk in (first_chunk, second_chunk):
+                if chunk is not None:
+                    yield from self.analyze(chunk, stem=stem)
+            for chunk in chunks:
+                yield from self.analyze(chunk, stem=stem)
+            return
+
+        global _worker_analyzer
+        # Forked workers inherit the loaded model, others load it again
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        if context.get_start_method() == "fork":
+            self.load()
+            _worker_analyzer = self
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.n_process,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.lem_model, self.stem_model),
+            ) as executor:
+                pending = deque()
+                for chunk in itertools.chain((first_chunk, second_chunk), chunks):
+                    pending.append(executor.submit(_analyze_chunk, (chunk, stem)))
+                    if len(pending) >= 2 * self.n_process:
+                        yield from self._collect(pending.popleft())
+                while pending:
+                    yield from self._collect(pending.popleft())
+        finally:
+            _worker_analyzer = None
+
+    def _chunks(self, docs):
+        """
+        This function splits a stream of documents in lists of batch_size documents.
+
+        :param iterable docs: the documents.
+        :return: an iterator over the chunks.
+
+        """
+        docs = iter(docs)
+        while True:
+            chunk = list(itertools.islice(docs, self.batch_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _collect(self, future):
+        """
+        This function waits for a chunk analyzed by a worker and merges its term and word
+        caches.
+
+        :param concurrent.futures.Future future: the result of _analyze_chunk.
+        :return: the analyzed documents of the chunk.
+
+        """
+        analyzed_chunk, term_items, word_items = future.result()
+        self.term_cache.update(term_items)
+        self.word_cache.update(word_items)
+        return analyzed_chunk
@@ -1,23 +1,136 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from threading import Lock, Thread
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from backend.ranker import Ranker
+from utils import metrics
+from utils.logs import setup_logs
+from utils.pool import BoundedPool, PoolSaturated
+import json
+import time
 import yaml
 
-
-max_lengths = {"title": 50, "url": 30, "content": 100}
+# The content is already cut to a snippet by the ranker, along with its highlights
+max_lengths = {"title": 50, "url": 30}
 
 # Read the Yaml configuration file
 with open("config.yml", "r") as f:
     config = yaml.safe_load(f)
 
 ranker_config = config["ranker-config"]
-ranker = Ranker(
-    pages_file=ranker_config["pages-file"],
-    fields=ranker_config["fields"],
-    lem_model=ranker_config["lem-model"],
+api_config = config.get("api-config", {})
+
+global_config = config.get("global-config", {})
+metrics.registry.enabled = global_config.get("metrics", False)
+REQUEST_SECONDS = metrics.registry.histogram(
+    "noodle_api_request_seconds", "Seconds spent answering a request, by endpoint."
+)
+REJECTED = metrics.registry.counter(
+    "noodle_api_rejected_total", "Searches rejected because the search pool was full."
+)
+# Requests sending this header get the time of each stage of their search in the
+# Server-Timing header of the response, whether the metrics are enabled or not
+PROFILE_HEADER = "x-noodle-profile"
+
+# The ranker is loaded in the background at startup, so that the server answers at once
+# and /ready tells when the searches can be served
+ranker = None
+ranker_lock = Lock()
+
+
+def get_ranker():
+    """
+    This function returns the ranker, loading it on first use.
+
+    :return: the Ranker.
+
+    """
+    global ranker
+    with ranker_lock:
+        if ranker is None:
+            ranker = Ranker(
+                pages_file=ranker_config["pages-file"],
+                fields=ranker_config["fields"],
+                lem_model=ranker_config["lem-model"],
+                term_cache=ranker_config.get("term-cache"),
+                manifest=ranker_config.get("manifest"),
+                scoring=ranker_config.get("scoring", "bm25f"),
+                k1=ranker_config.get("k1", 1.2),
+                b=ranker_config.get("b", 0.75),
+                proximity=ranker_config.get("proximity", 0.0),
+                proximity_depth=ranker_config.get("proximity-depth", 100),
+                result_cache_size=ranker_config.get("result-cache-size", 1000),
+                result_cache_ttl=ranker_config.get("result-cache-ttl", 60.0),
+                result_window=ranker_config.get("result-window", 100),
+                doc_cache_size=ranker_config.get("doc-cache-size", 1000),
+                snippet_length=ranker_config.get("snippet-length", 200),
+                shards=ranker_config.get("shards"),
+                shard_processes=ranker_config.get("shard-processes"),
+            )
+    return ranker
+
+
+def warm_up():
+    """
+    This function loads the ranker, then the SpaCy model if preload-model is set, which is
+    only needed by the queries containing words unseen while indexing.
+
+    """
+    starting_time = time.perf_counter()
+    get_ranker()
+    print(f"Ranker ready in {time.perf_counter() - starting_time:.2f} seconds.")
+    if api_config.get("preload-model", True):
+        ranker.analyzer.load()
+
+
+def search_pages(query, offset, limit):
+    """
+    This function searches the webpages with the ranker.
+
+    :param str query: the query.
+    :param int offset: the number of results to skip.
+    :param int limit: the number of results to return, or None to return them all.
+    :return: the ranked webpages.
+
+    """
+    return get_ranker().search(query, offset, limit)
+
+
+def stream_pages(query, offset, limit):
+    """
+    This function ranks the webpages of a query with the ranker, without fetching them.
+
+    :param str query: the query.
+    :param int offset: the number of results to skip.
+    :param int limit: the number of results to return, or None to return them all.
+    :return: an iterator over the ranked webpages, fetched as they are read.
+
+    """
+    return get_ranker().search_stream(query, offset, limit)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # The worker processes started by uvicorn apply the global configuration themselves,
+    # when the app starts rather than when the module is imported
+    setup_logs(
+        verbose=global_config.get("verbose", True),
+        logs=global_config.get("logs", False),
+        logs_file=global_config.get("logs-file", "logs.log"),
+    )
+    Thread(target=warm_up, daemon=True).start()
+    yield
+
+
+# The searches run in a bounded thread pool, so that the event loop keeps serving other
+# requests, and the requests beyond search-queue are rejected with a 503
+search_pool = BoundedPool(
+    n_threads=api_config.get("search-threads", 4),
+    max_pending=api_config.get("search-queue", 64),
 )
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for all origins
 app.add_middleware(
@@ -26,15 +139,123 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
 
+def server_timing(stages):
+    """
+    This function formats the time of the stages of a request as a Server-Timing header.
+
+    :param dict stages: the seconds spent in each stage.
+    :return: the value of the header, e.g. "analyze;dur=0.42, score;dur=1.30".
+
+    """
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in stages.items()
+    )
+
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    # Skip the timing when nobody reads it
+    profiled = request.headers.get(PROFILE_HEADER, "") not in ("", "0")
+    if not profiled and not metrics.registry.enabled:
+        return await call_next(request)
+
+    token = metrics.profile.set({} if profiled else None)
+    starting_time = time.perf_counter()
+    try:
+        response = await call_next(request)
+        stages = metrics.profile.get()
+    finally:
+        metrics.profile.reset(token)
+    elapsed = time.perf_counter() - starting_time
+    # The unknown paths share a series, so that scans do not create one per path
+    path = request.url.path
+    endpoint = path if path in endpoints else "other"
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+    if profiled:
+        response.headers["Server-Timing"] = server_timing({**stages, "total": elapsed})
+    return response
+
+
+def shorten(page):
+    """
+    This function shortens the fields of a webpage to match max_lengths, without modifying
+    the webpage held by the ranker.
+
+    :param dict page: the webpage.
+    :return: a shortened copy of the webpage.
+
+    """
+    page = dict(page)
+    for field, max_length in max_lengths.items():
+        if len(page.get(field, "")) > max_length:
+            page[field] = page[field][:max_length] + "..."
+    return page
+
+
+async def run_search(query, offset, limit, function=search_pages):
+    """
+    This function runs a search in the search pool.
+
+    :param str query: the query.
+    :param int offset: the number of results to skip.
+    :param int limit: the number of results to return, or None to return them all.
+    :param callable function: the search, search_pages or stream_pages.
+    :return: the ranked webpages.
+    :raises HTTPException: 503 if the search pool is saturated.
+
+    """
+    try:
+        return await search_pool.run(function, query, offset, limit)
+    except PoolSaturated:
+        REJECTED.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Too many pending searches, retry later.",
+            headers={"Retry-After": "1"},
+        )
+
+
 @app.get("/search")
-async def search(query: str):
-    pages = ranker.run(query)
-    # Shorten the content of the pages to match max_lengths
-    for page in pages:
-        for field in max_lengths.keys():
-            if len(page[field]) > max_lengths[field]:
-                page[field] = page[field][: max_lengths[field]] + "..."
-    return pages
+async def search(
+    query: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+):
+    pages = await run_search(query, offset, limit)
+    return [shorten(page) for page in pages]
+
+
+@app.get("/search/stream")
+async def search_stream(
+    query: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1),
+):
+    # Export-style results, one JSON webpage per line. The ranking runs in the search
+    # pool, each webpage is then fetched and cut to its snippet as it is sent
+    pages = await run_search(query, offset, limit, stream_pages)
+    lines = (json.dumps(page, ensure_ascii=False) + "\n" for page in pages)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text format, the metrics are per process when there are several workers
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get("/ready")
+async def ready():
+    # Readiness probe: 503 until the ranker is loaded
+    if ranker is None:
+        return JSONResponse({"ready": False}, status_code=503)
+    return {"ready": True, "model_loaded": ranker.analyzer.loaded}
+
+
+endpoints = {route.path for route in app.routes}
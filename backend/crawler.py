@@ -1,10 +1,27 @@
+import os
 import time
 import json
+import asyncio
+import httpx
 import requests
-from bs4 import BeautifulSoup
 from lxml import etree
-from threading import Thread
-from urllib import robotparser, error, parse
+from backend.dedup import SimHashIndex, simhash
+from backend.extract import decode_html, extract_page
+from backend.frontier import Frontier, get_host
+from backend.pages import PageLog, page_files
+from backend.robots import RobotsCache
+from backend.sitemap import fetch_sitemap
+from threading import Lock
+from urllib import error, parse
+from utils import metrics
+
+STAGE_SECONDS = metrics.registry.histogram(
+    "noodle_crawler_stage_seconds",
+    "Seconds spent in each stage of the crawl of a page.",
+)
+PAGES = metrics.registry.counter(
+    "noodle_crawler_pages_total", "Crawled pages, by outcome of the crawl."
+)
 
 
 class Crawler:
@@ -15,6 +32,12 @@ class Crawler:
         n_threads=3,
         politeness_delay=3,
         max_url_per_page=None,
+        bloom_capacity=None,
+        robots_ttl=3600,
+        page_log=None,
+        checkpoint_file=None,
+        checkpoint_interval=60,
+        near_duplicate_distance=None,
     ):
         """
         Initializes the WebCrawler.
@@ -24,37 +47,69 @@ class Crawler:
         :param int n_threads: the number of threads to use for crawling.
         :param int politeness_delay: the politeness delay in seconds.
         :param int max_url_per_page: the maximum number of URLs to extract from a page.
+        :param int bloom_capacity: if set, the frontier deduplicates URLs with a Bloom filter
+            sized for this number of URLs instead of an exact set.
+        :param float robots_ttl: the number of seconds a robots.txt file is cached.
+        :param str page_log: if set, the crawled pages are appended to this JSON Lines file
+            (compressed if it ends with .gz) as they are fetched, instead of being kept in
+            memory.
+        :param str checkpoint_file: if set, the frontier is saved to this JSON file every
+            checkpoint_interval seconds, so that a stopped crawl can be resumed.
+        :param float checkpoint_interval: the number of seconds between two checkpoints.
+        :param int near_duplicate_distance: if set, the pages whose SimHash differs by at
+            most this number of bits from the one of an already crawled page are
+            near-duplicates, e.g. URL variants or mirrors, whose content is not saved. Their
+            links are still followed.
 
         """
         self.base_url = base_url
         self.max_urls = max_urls
-        self.visited_urls = {}  # {url: {title, content, time}}
-        self.urls_to_crawl = [base_url]
+        self.visited_urls = {}  # {url: {title, content, time}}, only the time if logged
+        self.bloom_capacity = bloom_capacity
+        self.urls_to_crawl = Frontier(politeness_delay, bloom_capacity)
         self.visited_sitemaps = set()
+        self.sitemaps_lock = Lock()
         self.n_threads = n_threads
-        self.robots_parsers = {}
+        self.robots = RobotsCache(ttl=robots_ttl)
         self.politeness_delay = politeness_delay
         self.max_url_per_page = max_url_per_page
+        self.urls_in_flight = set()
+        self.stopped = False  # Set to stop the workers after their current page
+        self.page_log_file = page_log
+        self.page_log = None
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_interval = checkpoint_interval
+        self.near_duplicate_distance = near_duplicate_distance
+        self.fingerprints = (
+            SimHashIndex(near_duplicate_distance)
+            if near_duplicate_distance is not None
+            else None
+        )
+        # Seconds spent in each stage of the processing of the pages
+        self.stage_times = dict.fromkeys(
+            ["robots", "fetch", "decode", "parse", "dedup", "links"], 0.0
+        )
+        self.n_processed = 0
+        self.stats_lock = Lock()
+        self.add_url_to_crawl(base_url)
 
         print(
             f"Initialized WebCrawler with base URL {base_url} and {max_urls} max URLs."
         )
 
-    def add_url_to_crawl(self, url):
+    def add_url_to_crawl(self, url, priority=0):
         """
-        Adds a URL to the list of URLs to crawl if it hasn't been visited or added already.
+        Adds a URL to the frontier if it hasn't been seen already.
         Do not add XML URLs to avoid parsing sitemaps twice
 
         :param str url: the URL to add to the list of URLs to crawl.
+        :param float priority: the priority of the URL within its host.
+        :return: True if the URL was added.
 
         """
-        if not len(self.visited_urls) + len(self.urls_to_crawl) >= self.max_urls:
-            if (
-                url not in self.visited_urls
-                and url not in self.urls_to_crawl
-                and not url.endswith(".xml")
-            ):
-                self.urls_to_crawl.append(url)
+        if self.urls_to_crawl.n_seen >= self.max_urls or url.endswith(".xml"):
+            return False
+        return self.urls_to_crawl.add(url, priority)
 
     def parse_robots(self, url, thread_prefix=""):
         """
@@ -67,82 +122,293 @@ class Crawler:
         """
         # Checking if the URL can be crawled
         print(f"{thread_prefix}Checking if {url} can be crawled.")
-        robots_url = parse.urljoin(url, "/robots.txt")
-        if robots_url in self.robots_parsers:
-            rp = self.robots_parsers[robots_url]
-        else:
-            rp = robotparser.RobotFileParser()
-            rp.set_url(robots_url)
-            rp.read()
-            self.robots_parsers[robots_url] = rp
-
-        # Checking if a sitemap is available
-        sitemaps = []
-        robots_content = requests.get(robots_url).text
-        for line in robots_content.split("\n"):
-            if line.startswith("Sitemap:"):
-                pass  # sitemaps.append(line.split(": ")[1].strip())
-
-        # Parsing sitemaps
-        for sitemap_url in sitemaps:
-            if sitemap_url in self.visited_sitemaps:
-                continue
+        starting_time = time.perf_counter()
+        robots = self.robots.get(url)
+        self.time_stage("robots", starting_time)
+
+        # Parsing the sitemaps of the host
+        self.parse_sitemaps(robots.sitemaps, thread_prefix)
+
+        # Return True if the URL can be crawled
+        return robots.can_fetch(url)
+
+    def parse_sitemaps(self, sitemap_urls, thread_prefix=""):
+        """
+        Streams the sitemaps and adds their URLs to the frontier, the most recently modified
+        first. Sitemap indexes are followed and each sitemap is only parsed once.
+
+        :param list sitemap_urls: the URLs of the sitemaps.
+        :param str thread_prefix: the prefix to add to the log messages.
+
+        """
+        sitemap_urls = list(sitemap_urls)
+        while sitemap_urls:
+            sitemap_url = sitemap_urls.pop()
+            with self.sitemaps_lock:
+                if sitemap_url in self.visited_sitemaps:
+                    continue
+                self.visited_sitemaps.add(sitemap_url)
 
-            self.visited_sitemaps.add(sitemap_url)
             print(f"{thread_prefix}Found sitemap {sitemap_url}. Parsing sitemap...")
-            sitemap_content = requests.get(sitemap_url).content
-            xml_parser = etree.XMLParser(recover=True)
-            root = etree.fromstring(sitemap_content, parser=xml_parser)
-
-            # Extracting URLs from the sitemap
-            urls = [
-                loc.text
-                for loc in root.findall(
-                    ".//{http://www.sitemaps.org/schemas/sitemap/0.9}loc"
-                )
+            time.sleep(max(0, self.urls_to_crawl.reserve(sitemap_url)))
+            n_urls = 0
+            try:
+                for kind, loc, lastmod in fetch_sitemap(sitemap_url):
+                    if kind == "sitemap":
+                        sitemap_urls.append(loc)
+                    elif self.add_url_to_crawl(loc, priority=lastmod):
+                        n_urls += 1
+            except (requests.RequestException, etree.LxmlError) as e:
+                print(f"{thread_prefix}Error while parsing sitemap {sitemap_url}: {e}")
+            print(f"{thread_prefix}Found {n_urls} URLs in the sitemap {sitemap_url}.")
+
+    def run(self, resume=False):
+        """
+        Initiates the crawling process.
+
+        :param bool resume: whether to continue the crawl saved in the page log and the
+            checkpoint file instead of starting a new one.
+
+        """
+        if self.page_log_file:
+            if not resume:
+                # A new crawl replaces the shards of a previous partitioned crawl
+                for path in page_files(self.page_log_file):
+                    if path != self.page_log_file:
+                        os.remove(path)
+            self.page_log = PageLog(self.page_log_file, resume)
+            if resume:
+                self.restore()
+        elif resume:
+            print("Resuming a crawl requires a page log, starting a new crawl...")
+        try:
+            asyncio.run(self.crawl())
+        finally:
+            if self.page_log:
+                self.save_checkpoint()
+                self.page_log.close()
+
+    def restore(self):
+        """
+        Restores the state of a stopped crawl: the pages of the page log are visited, and
+        the frontier is reloaded from the last checkpoint.
+
+        """
+        self.urls_to_crawl = Frontier(self.politeness_delay, self.bloom_capacity)
+        if self.fingerprints is not None:
+            self.fingerprints = SimHashIndex(self.near_duplicate_distance)
+            for url, fingerprint in self.page_log.fingerprints.items():
+                self.fingerprints.add(fingerprint, url)
+        checkpoint = None
+        if self.checkpoint_file and os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        if checkpoint is None:
+            print("No checkpoint found, restarting from the base URL...")
+            self.add_url_to_crawl(self.base_url)
+
+        for url, page_time in self.page_log.visited.items():
+            self.visited_urls[url] = {"time": page_time}
+            self.urls_to_crawl.mark_seen(url)
+        if checkpoint is not None:
+            for url, priority in checkpoint["queued"]:
+                self.urls_to_crawl.add(url, priority)
+        print(
+            f"Resuming the crawl with {len(self.visited_urls)} visited and "
+            f"{len(self.urls_to_crawl)} queued URLs."
+        )
+
+    def save_checkpoint(self):
+        """
+        Saves the frontier to the checkpoint file, after flushing the page log so that
+        every page missing from the log is still in the frontier. The URLs being downloaded
+        are saved as queued.
+
+        """
+        self.page_log.flush()
+        if not self.checkpoint_file:
+            return
+        queued = [
+            (url, 0) for url in self.urls_in_flight if url not in self.visited_urls
+        ]
+        checkpoint = {
+            "time": time.time(),
+            "n_visited": len(self.visited_urls),
+            "queued": queued + self.urls_to_crawl.queued(),
+        }
+        tmp_file = f"{self.checkpoint_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def background_tasks(self):
+        """
+        Lists the tasks running alongside the workers until the end of the crawl.
+
+        :return: a list of coroutines.
+
+        """
+        return [self.checkpoint_periodically()] if self.page_log else []
+
+    def is_finished(self):
+        """
+        Tells whether the crawl is over once the frontier is empty and no page is being
+        downloaded, which is always the case unless other crawlers may still send URLs.
+
+        :return: True if the workers can stop.
+
+        """
+        return True
+
+    async def checkpoint_periodically(self):
+        """
+        Saves a checkpoint every checkpoint_interval seconds until cancelled.
+
+        """
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            self.save_checkpoint()
+            print(f"Saved a checkpoint after {len(self.visited_urls)} pages.")
+
+    async def crawl(self):
+        """
+        Crawls the website with a pool of asynchronous workers sharing one HTTP client.
+        Each worker picks the next URL as soon as it is done with the previous one, and
+        the politeness delay is enforced per host rather than globally.
+
+        """
+        starting_time = time.time()
+        limits = httpx.Limits(
+            max_connections=self.n_threads, max_keepalive_connections=self.n_threads
+        )
+        async with httpx.AsyncClient(
+            limits=limits, timeout=10, follow_redirects=True
+        ) as client:
+            print(f"Starting {self.n_threads} worker(s)...")
+            workers = [
+                asyncio.create_task(self.worker(client, f"{i+1}/{self.n_threads}"))
+                for i in range(self.n_threads)
             ]
-            print(
-                f"{thread_prefix}Found {len(urls)} URLs in the sitemap {sitemap_url}."
+            background = [
+                asyncio.create_task(coroutine) for coroutine in self.background_tasks()
+            ]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for task in background:
+                    task.cancel()
+
+        elapsed = time.time() - starting_time
+        pages_per_sec = len(self.visited_urls) / elapsed if elapsed else 0
+        print(
+            f"Crawled {len(self.visited_urls)} pages in {elapsed:.1f} seconds "
+            f"({pages_per_sec:.2f} pages/sec)."
+        )
+        if self.n_processed:
+            stages = ", ".join(
+                f"{stage} {seconds / self.n_processed * 1000:.2f}ms"
+                for stage, seconds in self.stage_times.items()
             )
+            print(f"Time per page: {stages}.")
 
-            for url in urls:
-                self.add_url_to_crawl(url)
+    def time_stage(self, stage, starting_time):
+        """
+        Adds the time elapsed since the start of a stage to the time of the stage, and to
+        the noodle_crawler_stage_seconds histogram if the metrics are enabled.
 
-        # Return True if the URL can be crawled
-        return rp.can_fetch("*", url)
+        :param str stage: the stage, a key of stage_times.
+        :param float starting_time: the time.perf_counter() at the start of the stage.
+        :return: the current time.perf_counter(), the start of the next stage.
 
-    def run(self):
         """
-        Initiates the crawling process.
+        now = time.perf_counter()
+        with self.stats_lock:
+            self.stage_times[stage] += now - starting_time
+        STAGE_SECONDS.observe(now - starting_time, stage=stage)
+        return now
 
+    async def worker(self, client, worker_name):
         """
-        while self.urls_to_crawl and len(self.visited_urls) < self.max_urls:
-            # Compute number of threads to start
-            n_current_threads = min(self.n_threads, len(self.urls_to_crawl))
-            n_current_threads = min(
-                n_current_threads, self.max_urls - len(self.visited_urls)
-            )
-            current_urls = self.urls_to_crawl[:n_current_threads]
-            self.urls_to_crawl = self.urls_to_crawl[n_current_threads:]
-            print(f"Starting {n_current_threads} thread(s)...")
-
-            # Start the threads
-            threads = []
-            for i in range(n_current_threads):
-                thread_name = f"{i+1}/{n_current_threads}"
-                thread = Thread(
-                    target=self.parse_page, args=(current_urls[i], thread_name)
+        Crawls URLs until there is nothing left to crawl.
+
+        :param httpx.AsyncClient client: the HTTP client shared by the workers.
+        :param str worker_name: the name of the worker.
+
+        """
+        while len(self.visited_urls) < self.max_urls and not self.stopped:
+            url, wait = self.urls_to_crawl.pop()
+            if url is None:
+                # Other workers may still discover new URLs
+                if wait is None and not self.urls_in_flight and self.is_finished():
+                    return
+                await asyncio.sleep(min(wait or 0.05, 0.5))
+                continue
+
+            self.urls_in_flight.add(url)
+            try:
+                await self.fetch_page(client, url, worker_name)
+            except httpx.HTTPError as e:
+                PAGES.inc(outcome="error")
+                print(f"[Worker {worker_name}] Error while downloading {url}: {e}")
+            except Exception as e:
+                # A page that cannot be processed must not stop the crawl
+                PAGES.inc(outcome="error")
+                print(
+                    f"[Worker {worker_name}] Error while processing {url}: "
+                    f"{type(e).__name__}: {e}"
                 )
-                thread.start()
-                threads.append(thread)
+            finally:
+                self.urls_in_flight.discard(url)
 
-            # Wait for the threads to finish
-            for thread in threads:
-                thread.join(10)
+    async def can_fetch(self, client, url):
+        """
+        Checks if the URL can be crawled based on the robots.txt rules of its host.
 
-            # Respect the politeness policy
-            print("Waiting for 3 seconds to respect the politeness policy...")
-            time.sleep(self.politeness_delay)
+        :param httpx.AsyncClient client: the HTTP client.
+        :param str url: the URL to check.
+        :return: True if the URL can be crawled.
+
+        """
+        robots = self.robots.lookup(url)
+        if robots is None:
+            # robots.txt is fetched in the slot reserved for the page, which then
+            # waits for the next slot of the host
+            starting_time = time.perf_counter()
+            robots = await self.robots.aget(client, url)
+            self.time_stage("robots", starting_time)
+            if robots.crawl_delay:
+                self.urls_to_crawl.set_delay(get_host(url), float(robots.crawl_delay))
+            if robots.sitemaps:
+                await asyncio.to_thread(self.parse_sitemaps, robots.sitemaps)
+            await asyncio.sleep(self.urls_to_crawl.reserve(url))
+        return robots.can_fetch(url)
+
+    async def fetch_page(self, client, url, worker_name):
+        """
+        Downloads a page and extracts its links.
+
+        :param httpx.AsyncClient client: the HTTP client.
+        :param str url: the URL to download.
+        :param str worker_name: the name of the worker.
+
+        """
+        worker_prefix = f"[Worker {worker_name}] "
+        if not await self.can_fetch(client, url):
+            print(f"{worker_prefix}Skipping {url} based on robots.txt rules.")
+            PAGES.inc(outcome="disallowed")
+            return
+
+        print(f"{worker_prefix}Downloading HTML from {url}.")
+        starting_time = time.perf_counter()
+        response = await client.get(url)
+        self.time_stage("fetch", starting_time)
+        self.process_page(
+            url,
+            response.content,
+            worker_prefix,
+            response.headers.get("content-type"),
+            str(response.url),
+        )
 
     def parse_page(self, current_url, thread_name=None):
         """
@@ -160,46 +426,101 @@ class Crawler:
         # Chesck if the URL can be crawled based on robots.txt rules
         if not self.parse_robots(current_url, thread_prefix):
             print(f"{thread_prefix}Skipping {current_url} based on robots.txt rules.")
+            PAGES.inc(outcome="disallowed")
             return
 
         # Download the page
         print(f"{thread_prefix}Downloading HTML from {current_url}.")
 
-        # Download the page with encoding utf-8
-        page_content = requests.get(current_url).content.decode("utf-8")
+        # Download the page, it is decoded with its own charset
+        starting_time = time.perf_counter()
+        response = requests.get(current_url)
+        self.time_stage("fetch", starting_time)
+        self.process_page(
+            current_url,
+            response.content,
+            thread_prefix,
+            response.headers.get("content-type"),
+            response.url,
+        )
+
+    def process_page(
+        self,
+        current_url,
+        page_content,
+        thread_prefix="",
+        content_type=None,
+        final_url=None,
+    ):
+        """
+        Extracts the title, the main text and the links of a downloaded page in a single
+        pass, and marks it as visited.
+
+        :param str current_url: the URL of the page.
+        :param page_content: the HTML of the page, as bytes if it still has to be decoded.
+        :param str thread_prefix: the prefix to add to the log messages.
+        :param str content_type: the Content-Type header of the response, giving the charset
+            of the page.
+        :param str final_url: the URL the page was downloaded from after the redirects,
+            against which the relative links are resolved. Defaults to current_url.
 
+        """
         if page_content:
-            # Extract links from the page
-            soup = BeautifulSoup(page_content, "html.parser")
-            links_on_page = [a_tag["href"] for a_tag in soup.find_all("a", href=True)]
-            links_on_page = links_on_page[: self.max_url_per_page]
-            added_links = 0
+            starting_time = time.perf_counter()
+            if isinstance(page_content, bytes):
+                page_content = decode_html(page_content, content_type)
+            starting_time = self.time_stage("decode", starting_time)
+            title, content, links_on_page = extract_page(
+                page_content, final_url or current_url
+            )
+            starting_time = self.time_stage("parse", starting_time)
+
+            # The first crawled page of a set of near-duplicates is the canonical one
+            fingerprint, duplicate_of = None, None
+            if self.fingerprints is not None:
+                fingerprint = simhash(f"{title} {content}")
+                duplicate_of = self.fingerprints.find_or_add(fingerprint, current_url)
+            starting_time = self.time_stage("dedup", starting_time)
 
             # Add new links to the list of URLs to crawl
-            for link in links_on_page:
-                absolute_link = (
-                    link if link.startswith("http") else self.base_url + link
-                )
-                if (
-                    absolute_link not in self.visited_urls
-                    and absolute_link not in self.urls_to_crawl
-                ):
-                    self.add_url_to_crawl(absolute_link)
+            added_links = 0
+            for link in links_on_page[: self.max_url_per_page]:
+                if self.add_url_to_crawl(link):
                     added_links += 1
-
-            # Mark the current URL as visited
-            self.visited_urls[current_url] = {
-                "title": soup.title.string,
-                "content": soup.find("p").text,
-                "time": time.time(),
-            }
+            self.time_stage("links", starting_time)
+            with self.stats_lock:
+                self.n_processed += 1
+
+            if duplicate_of is not None:
+                # Only the URL is remembered, and logged so that a resumed crawl does not
+                # download the page again
+                page = {"time": time.time(), "duplicate_of": duplicate_of}
+                if self.page_log:
+                    self.page_log.write({"url": current_url, **page})
+                self.visited_urls[current_url] = page
+                PAGES.inc(outcome="duplicate")
+                print(
+                    f"{thread_prefix}Skipping {current_url}, a near-duplicate of {duplicate_of}. Added {added_links} new links."
+                )
+                return
+
+            # Mark the current URL as visited, with the whole main text of the page from
+            # which the snippets of the results are built, and its fingerprint from which
+            # the indexer finds the near-duplicates again
+            page = {"title": title, "content": content, "time": time.time()}
+            if fingerprint is not None:
+                page["simhash"] = fingerprint
+            if self.page_log:
+                self.page_log.write({"url": current_url, **page})
+                page = {"time": page["time"]}
+            self.visited_urls[current_url] = page
+            PAGES.inc(outcome="crawled")
             print(
                 f"{thread_prefix}Successfully downloaded HTML from {current_url}. Added {added_links} new links."
             )
         else:
-            logging.error(
-                f"{thread_prefix}Error while downloading HTML from {current_url}."
-            )
+            PAGES.inc(outcome="empty")
+            print(f"{thread_prefix}Error while downloading HTML from {current_url}.")
 
     def save_visited_urls(self, json_file):
         """
@@ -210,8 +531,14 @@ class Crawler:
         """
         # Convert the visited URLs to a list
         result_list = [
-            {"url": url, "title": data["title"], "content": str(data["content"])}
+            {
+                "url": url,
+                "title": data["title"],
+                "content": str(data["content"]),
+                "time": data.get("time"),
+            }
             for url, data in self.visited_urls.items()
+            if "duplicate_of" not in data
         ]
 
         # Save the list to a JSON file
@@ -0,0 +1,168 @@
+import re
+import zlib
+import numpy as np
+from threading import Lock
+
+WORD_PATTERN = re.compile(r"\w+")
+N_BITS = 64
+
+
+def mix64(values):
+    """
+    This function scrambles 64-bit integers with the finalizer of SplitMix64, so that every
+    bit of the result depends on every bit of the input.
+
+    :param numpy.ndarray values: the uint64 integers.
+    :return: the scrambled integers.
+
+    """
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def simhash(text, shingle_size=3):
+    """
+    This function computes the SimHash of a text: each bit is the majority bit of the
+    hashes of its shingles, the sequences of shingle_size consecutive words. Near-duplicate
+    texts share most of their shingles, hence differ by a few bits of their SimHash. The
+    hashes are stable across processes, so that the crawler and the indexer agree.
+
+    :param str text: the text.
+    :param int shingle_size: the number of words of a shingle.
+    :return: the 64-bit fingerprint, 0 for a text without words.
+
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if not words:
+        return 0
+    hashes = np.fromiter(
+        (zlib.crc32(word.encode("utf-8")) for word in words),
+        dtype=np.uint64,
+        count=len(words),
+    )
+    # A text shorter than a shingle is a single shingle
+    n_shingles = max(len(words) - shingle_size + 1, 1)
+    shingles = np.zeros(n_shingles, dtype=np.uint64)
+    for i in range(min(shingle_size, len(words))):
+        shingles = mix64(shingles + hashes[i : i + n_shingles])
+    bits = np.unpackbits(shingles.astype("<u8").view(np.uint8).reshape(-1, 8), axis=1)
+    majority = (bits.sum(axis=0, dtype=np.int64) * 2 > n_shingles).astype(np.uint8)
+    return int(np.packbits(majority).view("<u8")[0])
+
+
+def page_fingerprint(page):
+    """
+    This function returns the SimHash of the title and the content of a webpage, or the
+    one saved with it by the crawler.
+
+    :param dict page: the webpage.
+    :return: the 64-bit fingerprint.
+
+    """
+    fingerprint = page.get("simhash")
+    if fingerprint is None:
+        fingerprint = simhash(f"{page.get('title', '')} {page.get('content', '')}")
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    """
+    This function counts the bits that differ between two fingerprints.
+
+    :param int a: the first fingerprint.
+    :param int b: the second fingerprint.
+    :return: the number of differing bits.
+
+    """
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex:
+    """
+    Index of SimHash fingerprints finding a near-duplicate of a fingerprint, i.e. a
+    fingerprint differing by at most max_distance bits, without comparing it to all of
+    them. The bits are split into max_distance + 1 bands, and two near-duplicates have at
+    least one identical band, so only the fingerprints sharing a band are compared.
+    """
+
+    def __init__(self, max_distance=3):
+        """
+        Initializes the SimHashIndex.
+
+        :param int max_distance: the maximum number of differing bits of near-duplicates.
+
+        """
+        if not 0 <= max_distance < N_BITS:
+            raise ValueError(
+                f"The maximum distance must be between 0 and {N_BITS - 1}."
+            )
+        self.max_distance = max_distance
+        n_bands = max_distance + 1
+        # (shift, mask) of each band, the first bands get the remaining bits
+        self.bands = []
+        shift = 0
+        for i in range(n_bands):
+            width = N_BITS // n_bands + (i < N_BITS % n_bands)
+            self.bands.append((shift, (1 << width) - 1))
+            shift += width
+        self.tables = [{} for _ in self.bands]  # {band value: [entry]} per band
+        self.fingerprints = []
+        self.keys = []
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def find(self, fingerprint):
+        """
+        This function looks for a near-duplicate of a fingerprint.
+
+        :param int fingerprint: the fingerprint.
+        :return: the key of the first near-duplicate added, or None.
+
+        """
+        best = None
+        for (shift, mask), table in zip(self.bands, self.tables):
+            # The entries of a band are in the order they were added
+            for entry in table.get((fingerprint >> shift) & mask, ()):
+                if best is not None and entry >= best:
+                    break
+                distance = hamming_distance(fingerprint, self.fingerprints[entry])
+                if distance <= self.max_distance:
+                    best = entry
+                    break
+        return None if best is None else self.keys[best]
+
+    def add(self, fingerprint, key):
+        """
+        This function adds a fingerprint to the index.
+
+        :param int fingerprint: the fingerprint.
+        :param key: the key returned for its near-duplicates, e.g. the URL of the webpage.
+
+        """
+        entry = len(self.keys)
+        self.fingerprints.append(fingerprint)
+        self.keys.append(key)
+        for (shift, mask), table in zip(self.bands, self.tables):
+            table.setdefault((fingerprint >> shift) & mask, []).append(entry)
+
+    def find_or_add(self, fingerprint, key):
+        """
+        This function returns the key of a near-duplicate of a fingerprint, or adds the
+        fingerprint if it has none, atomically so that two threads adding near-duplicates
+        at once agree on the first one.
+
+        :param int fingerprint: the fingerprint.
+        :param key: the key of the fingerprint.
+        :return: the key of the first near-duplicate added, or None if it was added.
+
+        """
+        with self._lock:
+            duplicate = self.find(fingerprint)
+            if duplicate is None:
+                self.add(fingerprint, key)
+            return duplicate
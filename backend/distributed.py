@@ -0,0 +1,387 @@
+import asyncio
+import os
+import sqlite3
+import subprocess
+import time
+import zlib
+from threading import Lock
+from backend.crawler import Crawler
+from backend.frontier import BloomFilter, get_host, normalize_url
+from backend.pages import page_files, shard_path
+
+
+def partition_of(url, n_partitions):
+    """
+    This function returns the partition of a URL. The URLs are partitioned by host, so that
+    every URL of a host is crawled by the same crawler, which enforces the politeness delay
+    and caches the robots.txt file of the host on its own.
+
+    :param str url: the normalized URL.
+    :param int n_partitions: the number of partitions.
+    :return: the partition, between 0 and n_partitions - 1.
+
+    """
+    # CRC32 is stable across processes, unlike hash()
+    return zlib.crc32(get_host(url).encode("utf-8")) % n_partitions
+
+
+class LinkQueue:
+    """
+    SQLite queue through which the crawlers of a partitioned crawl send each other the
+    links they find to hosts of other partitions, and agree on the end of the crawl. Every
+    exchange of a crawler is a single transaction, so that the crawl only ends once every
+    crawler is idle and no link is left in the queue.
+    """
+
+    def __init__(self, path):
+        """
+        Initializes the LinkQueue and creates its tables if needed.
+
+        :param str path: the path to the SQLite database, shared by the crawlers.
+
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The exchanges run in a thread of the event loop of the crawler
+        self.connection = sqlite3.connect(
+            path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS links (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                partition INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                priority REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS links_by_partition ON links (partition, id);
+            CREATE TABLE IF NOT EXISTS crawlers (
+                partition INTEGER PRIMARY KEY,
+                n_visited INTEGER NOT NULL,
+                idle INTEGER NOT NULL,
+                time REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value);
+            """)
+        self._lock = Lock()
+
+    def _transaction(self, function, *args):
+        # BEGIN IMMEDIATE takes the write lock at once, so that concurrent exchanges are
+        # serialized instead of failing to upgrade their lock
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = function(*args)
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+            return result
+
+    def _setting(self, key, default=None):
+        row = self.connection.execute(
+            "SELECT value FROM settings WHERE key = ?", (key,)
+        ).fetchone()
+        return default if row is None else row[0]
+
+    def _set(self, key, value):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def reset(self, n_partitions, max_urls, keep_links=False):
+        """
+        This function starts a new partitioned crawl.
+
+        :param int n_partitions: the number of partitions.
+        :param int max_urls: the maximum number of pages crawled by all the crawlers.
+        :param bool keep_links: whether to keep the links left in the queue by a stopped
+            crawl, to resume it.
+
+        """
+
+        def reset():
+            if not keep_links:
+                self.connection.execute("DELETE FROM links")
+            self.connection.execute("DELETE FROM crawlers")
+            self.connection.execute("DELETE FROM settings")
+            self._set("n_partitions", n_partitions)
+            self._set("max_urls", max_urls)
+            self._set("stopped", 0)
+
+        self._transaction(reset)
+
+    def join(self, partition, n_partitions, max_urls):
+        """
+        This function registers a crawler as busy, which restarts a stopped crawl. The
+        settings of the crawl are only set if no coordinator did, e.g. when the crawlers
+        are started on several nodes.
+
+        :param int partition: the partition of the crawler.
+        :param int n_partitions: the number of partitions.
+        :param int max_urls: the maximum number of pages crawled by all the crawlers.
+
+        """
+
+        def join():
+            if self._setting("n_partitions") is None:
+                self._set("n_partitions", n_partitions)
+                self._set("max_urls", max_urls)
+            self._set("stopped", 0)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO crawlers VALUES (?, 0, 0, ?)",
+                (partition, time.time()),
+            )
+
+        self._transaction(join)
+
+    def exchange(self, partition, outgoing, n_visited, idle, limit=1000):
+        """
+        This function sends the links found by a crawler, receives the links sent to it,
+        records its state, and stops the crawl once every crawler is idle with no link left
+        in the queue, or once max_urls pages have been crawled.
+
+        :param int partition: the partition of the crawler.
+        :param list outgoing: the (partition, url, priority) triples of the links to send.
+        :param int n_visited: the number of pages crawled by the crawler.
+        :param bool idle: whether the crawler has nothing to crawl.
+        :param int limit: the maximum number of links received.
+        :return: the list of (url, priority) pairs received, and whether the crawl stopped.
+
+        """
+
+        def exchange():
+            self.connection.executemany(
+                "INSERT INTO links (partition, url, priority) VALUES (?, ?, ?)",
+                outgoing,
+            )
+            rows = self.connection.execute(
+                "SELECT id, url, priority FROM links WHERE partition = ? "
+                "ORDER BY id LIMIT ?",
+                (partition, limit),
+            ).fetchall()
+            if rows:
+                self.connection.execute(
+                    "DELETE FROM links WHERE partition = ? AND id <= ?",
+                    (partition, rows[-1][0]),
+                )
+            # A crawler receiving links is busy until it has crawled them
+            self.connection.execute(
+                "INSERT OR REPLACE INTO crawlers VALUES (?, ?, ?, ?)",
+                (partition, n_visited, int(idle and not rows), time.time()),
+            )
+
+            stopped = bool(self._setting("stopped", 0))
+            if not stopped:
+                n_crawlers, n_idle, total = self.connection.execute(
+                    "SELECT COUNT(*), SUM(idle), SUM(n_visited) FROM crawlers"
+                ).fetchone()
+                pending = self.connection.execute(
+                    "SELECT EXISTS (SELECT 1 FROM links)"
+                ).fetchone()[0]
+                n_partitions = self._setting("n_partitions")
+                all_idle = n_crawlers == n_partitions == n_idle and not pending
+                stopped = all_idle or total >= self._setting("max_urls")
+                if stopped:
+                    self._set("stopped", 1)
+            return [(url, priority) for _, url, priority in rows], stopped
+
+        return self._transaction(exchange)
+
+    def n_visited(self):
+        """
+        This function counts the pages crawled by all the crawlers.
+
+        :return: the number of pages.
+
+        """
+        row = self.connection.execute("SELECT SUM(n_visited) FROM crawlers").fetchone()
+        return row[0] or 0
+
+    def close(self):
+        """
+        This function closes the database.
+
+        """
+        self.connection.close()
+
+
+class PartitionedCrawler(Crawler):
+    """
+    Crawler of one partition of a partitioned crawl. It only crawls the hosts of its
+    partition and sends the links to the other hosts to their crawlers through the link
+    queue. Each crawler writes its own shard of the page log and of the checkpoint, which
+    the indexer reads as a single page log.
+    """
+
+    def __init__(
+        self,
+        partition,
+        n_partitions,
+        link_queue,
+        *args,
+        exchange_interval=0.5,
+        **kwargs,
+    ):
+        """
+        Initializes the PartitionedCrawler.
+
+        :param int partition: the partition of the crawler, between 0 and
+            n_partitions - 1.
+        :param int n_partitions: the number of partitions.
+        :param str link_queue: the path to the SQLite link queue shared by the crawlers.
+        :param float exchange_interval: the number of seconds between two exchanges of
+            links with the other crawlers.
+        :param args: the arguments of the Crawler.
+        :param kwargs: the keyword arguments of the Crawler. The page log and the
+            checkpoint file are sharded by partition.
+
+        """
+        self.partition = partition
+        self.n_partitions = n_partitions
+        self.link_queue = LinkQueue(link_queue)
+        self.exchange_interval = exchange_interval
+        # Links to send, and the links already sent so that each one is sent only once
+        self.outgoing = []
+        bloom_capacity = kwargs.get("bloom_capacity")
+        self.sent_urls = BloomFilter(bloom_capacity) if bloom_capacity else set()
+        self.sent_lock = Lock()
+        for key in ["page_log", "checkpoint_file"]:
+            if kwargs.get(key):
+                kwargs[key] = shard_path(kwargs[key], partition)
+        super().__init__(*args, **kwargs)
+        self.link_queue.join(partition, n_partitions, self.max_urls)
+
+    def add_url_to_crawl(self, url, priority=0):
+        """
+        Adds a URL to the frontier if it belongs to the partition of the crawler, else
+        sends it to the crawler of its partition.
+
+        :param str url: the URL to add to the list of URLs to crawl.
+        :param float priority: the priority of the URL within its host.
+        :return: True if the URL was added or sent.
+
+        """
+        url = normalize_url(url)
+        partition = partition_of(url, self.n_partitions)
+        if partition == self.partition:
+            return super().add_url_to_crawl(url, priority)
+        if url.endswith(".xml"):
+            return False
+        with self.sent_lock:
+            if url in self.sent_urls:
+                return False
+            self.sent_urls.add(url)
+            self.outgoing.append((partition, url, priority))
+        return True
+
+    def is_finished(self):
+        """
+        Tells whether the crawl is over: the other crawlers may still send URLs until all
+        of them are idle.
+
+        :return: True if the workers can stop.
+
+        """
+        return self.stopped
+
+    def background_tasks(self):
+        """
+        Lists the tasks running alongside the workers, including the exchange of links.
+
+        :return: a list of coroutines.
+
+        """
+        return super().background_tasks() + [self.exchange_periodically()]
+
+    async def exchange(self):
+        """
+        Sends the pending links to the other crawlers and queues the links received.
+
+        """
+        # Idle is checked before taking the links: an idle crawler does not find new ones
+        idle = not len(self.urls_to_crawl) and not self.urls_in_flight
+        with self.sent_lock:
+            outgoing, self.outgoing = self.outgoing, []
+        incoming, stopped = await asyncio.to_thread(
+            self.link_queue.exchange,
+            self.partition,
+            outgoing,
+            len(self.visited_urls),
+            idle,
+        )
+        for url, priority in incoming:
+            super().add_url_to_crawl(url, priority)
+        self.stopped = stopped
+
+    async def exchange_periodically(self):
+        """
+        Exchanges links every exchange_interval seconds until the crawl is stopped. The
+        links found by the last pages are sent when the crawler stops, so that a resumed
+        crawl does not lose them.
+
+        """
+        try:
+            while not self.stopped:
+                await self.exchange()
+                await asyncio.sleep(self.exchange_interval)
+        finally:
+            with self.sent_lock:
+                outgoing, self.outgoing = self.outgoing, []
+            if outgoing:
+                self.link_queue.exchange(
+                    self.partition, outgoing, len(self.visited_urls), True, limit=0
+                )
+
+
+def coordinate(
+    n_partitions, link_queue, max_urls, command, page_log=None, resume=False
+):
+    """
+    This function runs a partitioned crawl with one crawler process per partition on this
+    node, and waits for them to finish.
+
+    :param int n_partitions: the number of partitions.
+    :param str link_queue: the path to the SQLite link queue shared by the crawlers.
+    :param int max_urls: the maximum number of pages crawled by all the crawlers.
+    :param list command: the command running the crawler of a partition, to which the
+        --partition option is appended, e.g. ["python", "main.py", "-c"].
+    :param str page_log: the path to the page log, whose shards are written by the
+        crawlers.
+    :param bool resume: whether to resume the crawl saved in the shards.
+
+    """
+    queue = LinkQueue(link_queue)
+    queue.reset(n_partitions, max_urls, keep_links=resume)
+    if page_log and not resume:
+        # A new crawl replaces the page log of the previous one and all its shards
+        for path in page_files(page_log):
+            os.remove(path)
+
+    print(f"Starting {n_partitions} crawler processes...")
+    starting_time = time.time()
+    processes = [
+        subprocess.Popen(
+            command + ["--partition", str(partition)] + (["--resume"] if resume else [])
+        )
+        for partition in range(n_partitions)
+    ]
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.wait()
+        raise
+    finally:
+        n_visited = queue.n_visited()
+        queue.close()
+
+    elapsed = time.time() - starting_time
+    pages_per_sec = n_visited / elapsed if elapsed else 0
+    print(
+        f"Crawled {n_visited} pages with {n_partitions} processes in {elapsed:.1f} "
+        f"seconds ({pages_per_sec:.2f} pages/sec)."
+    )
@@ -0,0 +1,285 @@
+import bisect
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from backend.segment import decode_varints, encode_varints
+from backend.snippets import encode_offsets
+from utils.lru import LRUCache
+
+# Doc store layout (little-endian):
+#   header  | magic, version, n_docs, doc_ids_pos, offsets_pos
+#   records | for each document: the byte length of the record as uint32, then the
+#           | zlib-compressed fields of RECORD_FIELDS, each prefixed by its byte length as
+#           | a varint: the UTF-8 url, title and content, and the offsets of the words of
+#           | the content
+#   doc ids | the sorted ids of the documents as uint32
+#   offsets | the offset of the record of each document as uint64, in doc id order
+MAGIC = b"NOODLDOC"
+VERSION = 2
+HEADER = struct.Struct("<8sIIQQ")
+LENGTH = struct.Struct("<I")
+RECORD_FIELDS = ("url", "title", "content", "offsets")
+
+
+def encode_record(page, stored_length=20000):
+    """
+    This function encodes the stored fields of a webpage, along with the offsets of the
+    words of its content used to build the snippets.
+
+    :param dict page: the webpage.
+    :param int stored_length: the maximum number of characters of the content.
+    :return: the compressed record.
+
+    """
+    content = page.get("content", "")[:stored_length]
+    fields = [
+        page.get("url", "").encode("utf-8"),
+        page.get("title", "").encode("utf-8"),
+        content.encode("utf-8"),
+        encode_offsets(content),
+    ]
+    buf = bytearray()
+    for field in fields:
+        encode_varints([len(field)], buf)
+        buf += field
+    return zlib.compress(bytes(buf))
+
+
+def decode_record(record):
+    """
+    This function decodes a record encoded with encode_record.
+
+    :param bytes record: the compressed record.
+    :return: the stored fields of the webpage, the offsets being left encoded.
+
+    """
+    buf = zlib.decompress(record)
+    page, pos = {}, 0
+    for field in RECORD_FIELDS:
+        (length,), pos = decode_varints(buf, pos, 1)
+        value = buf[pos : pos + length]
+        page[field] = value if field == "offsets" else value.decode("utf-8")
+        pos += length
+    return page
+
+
+class DocStoreWriter:
+    """
+    Writes the stored fields of the documents of a segment. Documents may be added in any
+    order, the offset table is sorted by doc id when the store is closed.
+    """
+
+    def __init__(self, path, stored_length=20000):
+        """
+        Initializes the DocStoreWriter and opens the output file.
+
+        :param str path: the path to the doc store to write.
+        :param int stored_length: the maximum number of characters of the stored content.
+
+        """
+        self.path = path
+        self.stored_length = stored_length
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(b"\0" * HEADER.size)
+        self._offsets = {}  # {doc_id: offset of the record}
+
+    def add(self, doc_id, page):
+        """
+        This function writes the stored fields of a webpage.
+
+        :param int doc_id: the id of the webpage.
+        :param dict page: the webpage.
+
+        """
+        self.add_record(doc_id, encode_record(page, self.stored_length))
+
+    def add_record(self, doc_id, record):
+        """
+        This function writes an already encoded record, e.g. copied from another store.
+
+        :param int doc_id: the id of the document.
+        :param bytes record: the compressed record.
+
+        """
+        self._offsets[doc_id] = self._file.tell()
+        self._file.write(LENGTH.pack(len(record)))
+        self._file.write(record)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def close(self):
+        """
+        This function writes the offset table, then moves the store to its final path.
+
+        """
+        doc_ids = sorted(self._offsets)
+        # Align the tables so that they can be viewed in place
+        padding = -self._file.tell() % 8
+        self._file.write(b"\0" * padding)
+        offsets_pos = self._file.tell()
+        self._write_table("Q", [self._offsets[doc_id] for doc_id in doc_ids])
+        doc_ids_pos = self._file.tell()
+        self._write_table("I", doc_ids)
+
+        self._file.seek(0)
+        self._file.write(
+            HEADER.pack(MAGIC, VERSION, len(doc_ids), doc_ids_pos, offsets_pos)
+        )
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def _write_table(self, typecode, values):
+        """
+        This function writes little-endian integers.
+
+        :param str typecode: the array typecode of the integers.
+        :param list values: the integers to write.
+
+        """
+        values = array(typecode, values)
+        if sys.byteorder == "big":
+            values.byteswap()
+        self._file.write(values.tobytes())
+
+
+class DocStore:
+    """
+    Read-only view of a doc store. The file is memory-mapped and a document costs a binary
+    search in the doc ids and the decompression of its record, whatever the size of the
+    store. Hot documents can be kept decompressed in a small LRU cache.
+    """
+
+    def __init__(self, path, cache_size=0):
+        """
+        Initializes the DocStore and maps the file in memory.
+
+        :param str path: the path to the doc store.
+        :param int cache_size: the number of decoded documents to cache, 0 to disable the
+            cache.
+
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.n_docs, doc_ids_pos, offsets_pos = HEADER.unpack_from(
+            self._mm, 0
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a Noodle doc store of version {VERSION}.")
+        self._views = []
+        self.doc_ids = self._table("I", doc_ids_pos)
+        self._offsets = self._table("Q", offsets_pos)
+        self.cache = LRUCache(cache_size) if cache_size else None
+
+    def _table(self, typecode, pos):
+        """
+        This function views a table of n_docs integers of the store.
+
+        :param str typecode: the typecode of the integers, "I" or "Q".
+        :param int pos: the offset of the table.
+        :return: a sequence of integers, backed by the mapped file on little-endian machines.
+
+        """
+        size = array(typecode).itemsize * self.n_docs
+        view = memoryview(self._mm)[pos : pos + size]
+        if sys.byteorder == "big":
+            table = array(typecode, view.tobytes())
+            table.byteswap()
+            view.release()
+            return table
+        table = view.cast(typecode)
+        self._views += [table, view]
+        return table
+
+    def __len__(self):
+        return self.n_docs
+
+    def __contains__(self, doc_id):
+        i = bisect.bisect_left(self.doc_ids, doc_id)
+        return i < self.n_docs and self.doc_ids[i] == doc_id
+
+    def record(self, doc_id):
+        """
+        This function returns the compressed record of a document.
+
+        :param int doc_id: the id of the document.
+        :return: the record, or None if the document is not in the store.
+
+        """
+        i = bisect.bisect_left(self.doc_ids, doc_id)
+        if i == self.n_docs or self.doc_ids[i] != doc_id:
+            return None
+        offset = self._offsets[i]
+        (length,) = LENGTH.unpack_from(self._mm, offset)
+        start = offset + LENGTH.size
+        return self._mm[start : start + length]
+
+    def get(self, doc_id):
+        """
+        This function returns the stored fields of a document.
+
+        :param int doc_id: the id of the document.
+        :return: a dictionary with the fields of RECORD_FIELDS, or None if the document is
+            not in the store.
+
+        """
+        if self.cache is not None:
+            page = self.cache.get(doc_id)
+            if page is not None:
+                return page
+        record = self.record(doc_id)
+        if record is None:
+            return None
+        page = decode_record(record)
+        if self.cache is not None:
+            self.cache.put(doc_id, page)
+        return page
+
+    def items(self):
+        """
+        This function iterates over the records of the store.
+
+        :return: an iterator over (doc_id, record) pairs sorted by doc id.
+
+        """
+        for doc_id in self.doc_ids:
+            yield doc_id, self.record(doc_id)
+
+    def close(self):
+        """
+        This function unmaps the store.
+
+        """
+        for view in self._views:
+            view.release()
+        self._mm.close()
+
+
+def merge_stores(paths, deleted, output_path):
+    """
+    This function merges doc stores into a single one, dropping the deleted documents. The
+    records are copied without being decompressed.
+
+    :param list paths: the paths to the doc stores to merge.
+    :param list deleted: the set of deleted doc ids of each store.
+    :param str output_path: the path to the merged doc store.
+    :return: the number of documents of the merged store.
+
+    """
+    writer = DocStoreWriter(output_path)
+    for path, store_deleted in zip(paths, deleted):
+        store = DocStore(path)
+        try:
+            for doc_id, record in store.items():
+                if doc_id not in store_deleted:
+                    writer.add_record(doc_id, record)
+        finally:
+            store.close()
+    n_docs = len(writer)
+    writer.close()
+    return n_docs
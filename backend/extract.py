@@ -0,0 +1,218 @@
+import codecs
+import re
+from lxml import etree
+from urllib import parse
+
+# Elements that do not hold the main text of a page
+BOILERPLATE_TAGS = {
+    "head",
+    "title",
+    "script",
+    "style",
+    "noscript",
+    "template",
+    "svg",
+    "nav",
+    "header",
+    "footer",
+    "aside",
+    "form",
+}
+# Elements separating words, the text of the other elements is joined as is, since lxml
+# splits the text around entities and inline elements, e.g. caf&eacute; or <b>ENS</b>AI
+BLOCK_TAGS = {
+    "address",
+    "article",
+    "blockquote",
+    "body",
+    "br",
+    "caption",
+    "dd",
+    "div",
+    "dl",
+    "dt",
+    "figcaption",
+    "figure",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "hr",
+    "img",
+    "li",
+    "main",
+    "ol",
+    "p",
+    "pre",
+    "section",
+    "table",
+    "td",
+    "th",
+    "tr",
+    "ul",
+} | BOILERPLATE_TAGS
+# Elements holding the main text of a page, the first kind found wins over the body
+MAIN_TAGS = ("main", "article")
+CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:-]+)""", re.IGNORECASE)
+BOMS = [
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+def charset_of(content_type):
+    """
+    This function reads the charset of a Content-Type header.
+
+    :param str content_type: the value of the header, e.g. "text/html; charset=utf-8".
+    :return: the charset, or None if the header does not set one.
+
+    """
+    for parameter in (content_type or "").split(";")[1:]:
+        name, _, value = parameter.partition("=")
+        if name.strip().lower() == "charset":
+            return value.strip().strip("\"'") or None
+    return None
+
+
+def decode_html(content, content_type=None):
+    """
+    This function decodes a downloaded page. The charset is taken from the byte order mark,
+    then the Content-Type header, then the <meta> declaration of the page. Pages without
+    a valid declaration are decoded as UTF-8 if they are valid UTF-8, else as Windows-1252,
+    the usual charset of undeclared Western European pages.
+
+    :param bytes content: the body of the response.
+    :param str content_type: the Content-Type header of the response.
+    :return: the HTML of the page.
+
+    """
+    for bom, encoding in BOMS:
+        if content.startswith(bom):
+            return content.decode(encoding, errors="replace")
+
+    match = CHARSET.search(content[:4096])
+    for encoding in [charset_of(content_type), match and match.group(1).decode()]:
+        if not encoding:
+            continue
+        try:
+            return content.decode(encoding, errors="replace")
+        except LookupError:
+            continue  # Unknown charset
+
+    try:
+        return content.decode("utf-8")
+    except UnicodeDecodeError:
+        return content.decode("cp1252", errors="replace")
+
+
+class PageExtractor:
+    """
+    Parser target collecting the title, the main text and the links of a page while lxml
+    tokenizes it, so that a page is parsed in a single pass without building a tree.
+    """
+
+    def __init__(self, url):
+        """
+        Initializes the PageExtractor.
+
+        :param str url: the URL of the page, against which the links are resolved.
+
+        """
+        self.url = url
+        self.title = None
+        self.links = []
+        self.texts = {"body": []}  # {"body" or main tag: text parts}
+        self._title_parts = None
+        self._skipped = 0  # Depth within boilerplate elements
+        self._main = dict.fromkeys(MAIN_TAGS, 0)  # Depth within each main tag
+
+    def start(self, tag, attrib):
+        if tag == "a":
+            href = attrib.get("href")
+            if href:
+                self.links.append(href.strip())
+        elif tag == "base" and attrib.get("href"):
+            # The links of the page are relative to its <base>
+            self.url = parse.urljoin(self.url, attrib["href"].strip())
+        elif tag == "title" and self.title is None:
+            self._title_parts = []
+        if tag in BLOCK_TAGS:
+            self.separate()
+        if tag in BOILERPLATE_TAGS:
+            self._skipped += 1
+        elif tag in self._main:
+            self._main[tag] += 1
+
+    def end(self, tag):
+        if tag == "title" and self._title_parts is not None:
+            self.title = " ".join("".join(self._title_parts).split())
+            self._title_parts = None
+        if tag in BOILERPLATE_TAGS:
+            self._skipped = max(0, self._skipped - 1)
+        elif self._main.get(tag):
+            self._main[tag] -= 1
+        if tag in BLOCK_TAGS:
+            self.separate()
+
+    def data(self, text):
+        if self._title_parts is not None:
+            self._title_parts.append(text)
+        if self._skipped:
+            return
+        self.texts["body"].append(text)
+        for tag, depth in self._main.items():
+            if depth:
+                self.texts.setdefault(tag, []).append(text)
+
+    def separate(self):
+        """
+        This function ends the current word of the texts, at the boundaries of a block.
+
+        """
+        self.texts["body"].append(" ")
+        for tag, depth in self._main.items():
+            if depth:
+                self.texts.setdefault(tag, []).append(" ")
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        """
+        This function ends the extraction.
+
+        :return: the title, the main text with its whitespace collapsed, and the absolute
+            HTTP(S) links of the page.
+
+        """
+        parts = next(
+            (self.texts[tag] for tag in MAIN_TAGS if tag in self.texts),
+            self.texts["body"],
+        )
+        links = []
+        for href in self.links:
+            link = parse.urljoin(self.url, href)
+            if link.startswith(("http://", "https://")):
+                links.append(link)
+        return self.title or "", " ".join("".join(parts).split()), links
+
+
+def extract_page(html, url):
+    """
+    This function extracts the title, the main text and the links of a page in a single
+    pass of the lxml HTML tokenizer. The main text is the text of the <main> elements, or
+    else of the <article> elements, or else of the whole page, without its scripts, menus
+    and footers.
+
+    :param str html: the HTML of the page.
+    :param str url: the URL of the page.
+    :return: the title, the main text and the absolute links of the page.
+
+    """
+    parser = etree.HTMLParser(target=PageExtractor(url), no_network=True)
+    parser.feed(html)
+    return parser.close()
@@ -0,0 +1,259 @@
+import hashlib
+import heapq
+import math
+import time
+from threading import Lock
+from urllib import parse
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    """
+    Normalizes a URL so that equivalent URLs are only crawled once: the scheme and host
+    are lowercased, default ports and fragments are removed, an empty path becomes "/"
+    and the query parameters are sorted.
+
+    :param str url: the URL to normalize.
+    :return: the normalized URL.
+
+    """
+    parts = parse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc += f":{parts.port}"
+    if parts.username:
+        netloc = f"{parts.username}@{netloc}"
+    path = parts.path or "/"
+    query = parse.urlencode(
+        sorted(parse.parse_qsl(parts.query, keep_blank_values=True))
+    )
+    return parse.urlunsplit((scheme, netloc, path, query, ""))
+
+
+def get_host(url):
+    """
+    Returns the host of a URL, used as the unit of politeness.
+
+    :param str url: the URL.
+    :return: the host and port of the URL.
+
+    """
+    return parse.urlsplit(url).netloc
+
+
+class BloomFilter:
+    """
+    Space-efficient set of strings with a tunable false positive rate. A false positive
+    makes the crawler skip a URL it has never seen, which is acceptable for very large
+    crawls where an exact seen-set would not fit in memory.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        """
+        Initializes the BloomFilter.
+
+        :param int capacity: the expected number of elements.
+        :param float error_rate: the false positive rate at full capacity.
+
+        """
+        self.n_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+
+    def _positions(self, item):
+        """
+        Computes the bits of an element with double hashing.
+
+        :param str item: the element.
+        :return: an iterator over the bit positions.
+
+        """
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.n_bits for i in range(self.n_hashes))
+
+    def add(self, item):
+        """
+        Adds an element to the filter.
+
+        :param str item: the element.
+
+        """
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class Frontier:
+    """
+    Thread-safe crawl frontier. URLs are normalized and deduplicated with a seen-set,
+    queued in one queue per host, and handed out host by host as soon as the politeness
+    window of the host has expired. Within a host, URLs are served by decreasing
+    priority, then in FIFO order.
+    """
+
+    def __init__(self, politeness_delay=0, bloom_capacity=None):
+        """
+        Initializes the Frontier.
+
+        :param float politeness_delay: the minimum delay in seconds between two requests to
+            the same host.
+        :param int bloom_capacity: if set, a Bloom filter sized for this number of URLs is used
+            as the seen-set instead of an exact set.
+
+        """
+        self.politeness_delay = politeness_delay
+        self.seen = BloomFilter(bloom_capacity) if bloom_capacity else set()
+        self.n_seen = 0
+        self.queues = {}  # {host: heap of (-priority, sequence number, url)}
+        self.ready_hosts = []  # Heap of (ready time, host) for hosts with queued URLs
+        self.next_fetch_times = {}  # {host: earliest time of the next request}
+        self.host_delays = {}  # {host: politeness delay overriding the default one}
+        self.n_queued = 0
+        self.n_added = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return self.n_queued
+
+    def __contains__(self, url):
+        return normalize_url(url) in self.seen
+
+    def mark_seen(self, url):
+        """
+        Marks a URL as seen without queuing it.
+
+        :param str url: the URL.
+        :return: False if the URL had already been seen.
+
+        """
+        url = normalize_url(url)
+        with self.lock:
+            if url in self.seen:
+                return False
+            self.seen.add(url)
+            self.n_seen += 1
+            return True
+
+    def add(self, url, priority=0):
+        """
+        Queues a URL if it has not been seen before.
+
+        :param str url: the URL.
+        :param float priority: the priority of the URL within its host, e.g. the lastmod
+            timestamp of a sitemap entry.
+        :return: True if the URL was queued.
+
+        """
+        url = normalize_url(url)
+        host = get_host(url)
+        with self.lock:
+            if url in self.seen:
+                return False
+            self.seen.add(url)
+            self.n_seen += 1
+            self.n_queued += 1
+
+            queue = self.queues.get(host)
+            if queue is None:
+                queue = self.queues[host] = []
+                ready_time = self.next_fetch_times.get(host, 0)
+                heapq.heappush(self.ready_hosts, (ready_time, host))
+            heapq.heappush(queue, (-priority, self.n_added, url))
+            self.n_added += 1
+            return True
+
+    def queued(self):
+        """
+        Lists the queued URLs, e.g. to checkpoint the crawl.
+
+        :return: a list of (url, priority) pairs, in the order they were added.
+
+        """
+        with self.lock:
+            entries = [entry for queue in self.queues.values() for entry in queue]
+        entries.sort(key=lambda entry: entry[1])
+        return [(url, -priority) for priority, _, url in entries]
+
+    def set_delay(self, host, delay):
+        """
+        Overrides the politeness delay of a host, e.g. with its robots.txt Crawl-delay.
+
+        :param str host: the host.
+        :param float delay: the delay in seconds.
+
+        """
+        with self.lock:
+            self.host_delays[host] = max(delay, self.politeness_delay)
+
+    def _reserve(self, host, now):
+        """
+        Reserves the next request slot of a host. Must be called with the lock held.
+
+        :param str host: the host.
+        :param float now: the current time.
+        :return: the time of the reserved slot.
+
+        """
+        fetch_time = max(now, self.next_fetch_times.get(host, now))
+        delay = self.host_delays.get(host, self.politeness_delay)
+        self.next_fetch_times[host] = fetch_time + delay
+        return fetch_time
+
+    def reserve(self, url):
+        """
+        Reserves a request slot on the host of a URL that is fetched outside of the
+        frontier, such as robots.txt.
+
+        :param str url: the URL about to be requested.
+        :return: the number of seconds to wait before sending the request.
+
+        """
+        now = time.monotonic()
+        host = get_host(url)
+        with self.lock:
+            fetch_time = self._reserve(host, now)
+        return fetch_time - now
+
+    def pop(self):
+        """
+        Takes the next URL of the host whose politeness window expires first.
+
+        :return: a (url, wait) tuple. If no host is ready yet, url is None and wait is the
+            number of seconds until one is. If the frontier is empty, both are None.
+
+        """
+        now = time.monotonic()
+        with self.lock:
+            while self.ready_hosts:
+                ready_time, host = self.ready_hosts[0]
+
+                # The host may have been reserved since it was pushed, e.g. for robots.txt
+                next_fetch_time = self.next_fetch_times.get(host, 0)
+                if next_fetch_time > ready_time:
+                    heapq.heapreplace(self.ready_hosts, (next_fetch_time, host))
+                    continue
+                if ready_time > now:
+                    return None, ready_time - now
+
+                heapq.heappop(self.ready_hosts)
+                queue = self.queues[host]
+                _, _, url = heapq.heappop(queue)
+                self.n_queued -= 1
+                self._reserve(host, now)
+                if queue:
+                    heapq.heappush(
+                        self.ready_hosts, (self.next_fetch_times[host], host)
+                    )
+                else:
+                    del self.queues[host]
+                return url, 0
+            return None, None
@@ -1,92 +1,503 @@
 import json
-import spacy
+import os
+import shutil
 import time
+from array import array
 from threading import Thread
-from nltk.stem import SnowballStemmer
+from backend.analyzer import Analyzer
+from backend.dedup import SimHashIndex, page_fingerprint
+from backend.docstore import DocStoreWriter, merge_stores
+from backend.manifest import (
+    MANIFEST_FILE,
+    REGISTRY_FILE,
+    SHARDS_FILE,
+    IndexView,
+    merge_segments,
+    page_hash,
+    read_json,
+    shard_of,
+    write_json,
+)
+from backend.pages import iter_pages
+from backend.segment import SegmentWriter, load_index
+from backend.spimi import SpimiBuilder
+from utils import metrics
+
+STAGE_SECONDS = metrics.registry.histogram(
+    "noodle_indexer_stage_seconds",
+    "Seconds spent in each stage of the indexing of a field, per webpage for the analysis "
+    "and the inversion, per segment for the writing.",
+)
 
 
 class Indexer:
-    def __init__(self, lem_model="fr_core_news_sm", stem_model="french", limit=None):
+    def __init__(
+        self,
+        lem_model="fr_core_news_sm",
+        stem_model="french",
+        limit=None,
+        n_process=1,
+        batch_size=1000,
+        nlp=None,
+        memory_budget=512,
+        max_segments=8,
+        stored_length=20000,
+        near_duplicate_distance=None,
+    ):
         """
         This function initializes the Indexer class.
 
         :param str lem_model: the SpaCy model to use for lemmatization.
         :param str stem_model: the Snowball stemmer to use for stemming.
         :param int limit: the maximum number of webpages to index.
+        :param int n_process: the number of processes used to analyze the webpages, -1 to
+            use all the cores.
+        :param int batch_size: the number of webpages sent at once to each process.
+        :param spacy.Language nlp: an already loaded SpaCy pipeline to use instead of lem_model.
+        :param float memory_budget: the estimated size in MB of the in-memory index of each
+            field above which it is flushed to a sorted run on disk.
+        :param int max_segments: the number of segments above which the smallest segments
+            are merged in the background after an incremental run.
+        :param int stored_length: the number of characters of the content kept in the doc
+            store, which holds the fields shown with the results and their snippets.
+        :param int near_duplicate_distance: if set, a webpage whose SimHash differs by at
+            most this number of bits from the one of a previous webpage of the input file is
+            a near-duplicate, which is not indexed, or is deleted if it was indexed before.
 
         """
         self.limit = limit
+        self.memory_budget = memory_budget
+        self.max_segments = max_segments
+        self.stored_length = stored_length
+        self.near_duplicate_distance = near_duplicate_distance
+        self._merge_thread = None
+        self.analyzer = Analyzer(
+            lem_model, stem_model, n_process=n_process, batch_size=batch_size, nlp=nlp
+        )
 
-        # Check if the SpaCy model is installed
-        if not spacy.util.is_package(lem_model):
-            print(f"Downloading {lem_model} model ...")
-            spacy.cli.download(lem_model)
-
-        # Load the SpaCy model
-        print(f"Loading {lem_model} model ...")
-        self.nlp = spacy.load(lem_model)
-
-        # Load the stemmer
-        if stem_model:
-            self.stemmer = SnowballStemmer(stem_model)
-
-    def run(self, input_file, output_dir, fields, use_pos=False, use_stem=False):
+    def run(
+        self,
+        input_file,
+        output_dir,
+        fields,
+        use_pos=False,
+        use_stem=False,
+        index_format="binary",
+        incremental=False,
+        delete_missing=True,
+        n_shards=1,
+        shard=None,
+    ):
         """
         This function indexes the crawled webpages and saves the indexs in the output directory.
 
-        :param str input_file: the path to the file containing the webpages. It must be a JSON file
-            containing a list of dictionaries that must contain the fields to be indexed.
+        :param str input_file: the path to the file containing the webpages, either a JSON
+            list of dictionaries holding the fields to index, or the JSON Lines page log of
+            the crawler (.jsonl or .jsonl.gz). The file is streamed, and the postings are
+            flushed to sorted runs on disk whenever the memory budget is reached, then
+            merged.
         :param str output_dir: the directory where to save the indexs.
         :param list fields: a list of fields to index.
         :param bool use_pos: whether to use a positional index.
         :param bool use_stem: whether to stem the lemmatized content.
+        :param str index_format: the format of the indexs, either "binary" for memory-mappable
+            segments or "json".
+        :param bool incremental: whether to only index the new and modified webpages into a
+            new segment, instead of rebuilding the whole index. The webpages are identified
+            by their URL, and are modified if the hash of their fields changed.
+        :param bool delete_missing: whether to delete the webpages that are no longer in the
+            input file when indexing incrementally.
+        :param int n_shards: the number of shards. Above 1, the webpages are split by URL
+            into n_shards indexes written to output_dir/shard<i>, one after the other,
+            and listed in the shards file of output_dir.
+        :param int shard: the only shard to index, used by the runs of each shard.
 
         """
-        print(f"Opening {input_file}...")
-        # Parse JSON file
-        with open(input_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if self.limit:
-            data = data[: self.limit]
+        if n_shards > 1 and shard is None:
+            for i in range(n_shards):
+                print(f"Indexing shard {i + 1}/{n_shards}...")
+                os.makedirs(f"{output_dir}/shard{i}", exist_ok=True)
+                self.run(
+                    input_file,
+                    f"{output_dir}/shard{i}",
+                    fields,
+                    use_pos,
+                    use_stem,
+                    index_format,
+                    incremental,
+                    delete_missing,
+                    n_shards,
+                    shard=i,
+                )
+            # Publish the new version of every shard at once
+            shards_file = f"{output_dir}/{SHARDS_FILE}"
+            previous = read_json(shards_file)
+            shards = {
+                "version": previous["version"] + 1 if previous else 1,
+                "shards": [f"shard{i}/{MANIFEST_FILE}" for i in range(n_shards)],
+            }
+            write_json(shards_file, shards)
+            self.analyzer.save_cache(f"{output_dir}/term_cache.json")
+            return
 
-        # Indexing the webpages
+        # A merge started by the previous run must not race with this one
+        self.wait_for_merge()
+
+        manifest_file = f"{output_dir}/{MANIFEST_FILE}"
+        registry_file = f"{output_dir}/{REGISTRY_FILE}"
+        previous_manifest = read_json(manifest_file)
+        manifest = previous_manifest if incremental else None
+        if incremental and index_format != "binary":
+            raise ValueError("Incremental indexing requires the binary index format.")
+        if manifest and (
+            manifest["fields"] != fields or manifest["positional"] != use_pos
+        ):
+            print("The indexed fields changed, rebuilding the whole index...")
+            manifest = None
+        if manifest is None:
+            manifest = {
+                "version": previous_manifest["version"] if previous_manifest else 0,
+                "fields": fields,
+                "positional": use_pos,
+                "next_doc_id": 0,
+                "next_segment": 0,
+                "segments": [],
+            }
+            registry = {}
+        else:
+            registry = read_json(registry_file, {})
+
+        print(f"Opening {input_file}...")
         starting_time = time.time()
-        avg_tokens_per_field = {}
-        for field in fields:
-            # Lemmatize the content of the field
-            print(f"Lemmatizing {field}...")
-            lemma_docs = self.lemmatize([page[field] for page in data])
+        builders = {
+            field: SpimiBuilder(use_pos, self.memory_budget, run_dir=output_dir)
+            for field in fields
+        }
+        # The fields shown with the results are stored along with the new segment
+        name = f"{manifest['next_segment']:05d}"
+        store_file = f"docs.{name}.store"
+        store = DocStoreWriter(f"{output_dir}/{store_file}", self.stored_length)
+        doc_lengths = {field: array("I") for field in fields}
+        doc_ids = array("I")  # Doc id of each analyzed webpage
+        replaced_ids = set()  # Doc ids of the modified webpages
+        seen_urls = set()
+        # Every webpage of the input file is fingerprinted, including the ones of the other
+        # shards, so that the same webpage of a set of near-duplicates is indexed
+        fingerprints = (
+            SimHashIndex(self.near_duplicate_distance)
+            if self.near_duplicate_distance is not None
+            else None
+        )
+        duplicate_urls = set()
+
+        def changed_pages():
+            # Skip the webpages whose indexed fields did not change, the others keep
+            # their doc id or get a new one
+            for page in iter_pages(input_file, self.limit):
+                url = page["url"]
+                if url in seen_urls or url in duplicate_urls:
+                    continue
+                if fingerprints is not None:
+                    duplicate_of = fingerprints.find_or_add(page_fingerprint(page), url)
+                    if duplicate_of not in (None, url):
+                        duplicate_urls.add(url)
+                        continue
+                if shard is not None and shard_of(url, n_shards) != shard:
+                    continue
+                seen_urls.add(url)
+                entry = registry.get(url)
+                page_time = page.get("time")
+                if entry and page_time is not None and entry[2] == page_time:
+                    continue  # Not fetched again since it was indexed
+                digest = page_hash(page, fields)
+                if entry and entry[1] == digest:
+                    entry[2] = page_time
+                    continue
+                if entry:
+                    doc_id = entry[0]
+                    replaced_ids.add(doc_id)
+                else:
+                    doc_id = manifest["next_doc_id"]
+                    manifest["next_doc_id"] += 1
+                registry[url] = [doc_id, digest, page_time]
+                doc_ids.append(doc_id)
+                store.add(doc_id, page)
+                yield page
+
+        # Analyze every field of every webpage in a single streaming pass
+        print(f"Lemmatizing {', '.join(fields)}...")
+        texts = (page[field] for page in changed_pages() for field in fields)
+        n_docs = 0
+        # The stages are only timed when the metrics are enabled, the analysis time
+        # includes the reading of the webpages
+        timed = metrics.registry.enabled
+        tick = time.perf_counter()
+        for i, tokens in enumerate(self.analyzer.analyze_stream(texts)):
+            rank, field_rank = divmod(i, len(fields))
+            field = fields[field_rank]
+            if timed:
+                now = time.perf_counter()
+                STAGE_SECONDS.observe(now - tick, stage="analyze", field=field)
+                tick = now
+            builders[field].add(doc_ids[rank], tokens)
+            doc_lengths[field].append(len(tokens))
+            if timed:
+                now = time.perf_counter()
+                STAGE_SECONDS.observe(now - tick, stage="invert", field=field)
+                tick = now
+            n_docs = rank + 1
+            if field_rank == len(fields) - 1 and n_docs % 10000 == 0:
+                print(f"Analyzed {n_docs} webpages...")
+        analysis_time = time.time() - starting_time
+        docs_per_sec = n_docs / analysis_time if analysis_time else 0
+        print(
+            f"Analyzed {n_docs} webpages in {analysis_time:.2f} seconds "
+            f"({docs_per_sec:.1f} docs/sec)."
+        )
+        if duplicate_urls:
+            print(f"Skipped {len(duplicate_urls)} near-duplicate webpages.")
 
-            # Stem the lemmatized content
-            if self.stemmer:
-                for i, doc in enumerate(lemma_docs):
-                    lemma_docs[i] = [self.stemmer.stem(token) for token in doc]
+        # The webpages that were not crawled again or became near-duplicates are deleted
+        deleted_ids = set(replaced_ids)
+        for url in duplicate_urls & registry.keys():
+            deleted_ids.add(registry.pop(url)[0])
+        if delete_missing:
+            for url in [url for url in registry if url not in seen_urls]:
+                deleted_ids.add(registry.pop(url)[0])
 
-            # Create the index
-            print(f"Creating index for {field}...")
-            index = self.create_index(lemma_docs, use_pos)
+        if manifest["segments"] and not n_docs and not deleted_ids:
+            for builder in builders.values():
+                builder.close()
+            store.close()
+            os.remove(store.path)
+            if shard is None:
+                self.remove_shards(output_dir)
+            print("The index is already up to date.")
+            return
 
-            # Saving the index
+        # Record the tombstones in the segments holding the old versions
+        for segment in manifest["segments"]:
+            segment_ids = self._segment_doc_ids(output_dir, segment)
+            tombstones = set(segment["deleted"])
+            tombstones.update(doc_id for doc_id in deleted_ids if doc_id in segment_ids)
+            segment["deleted"] = sorted(tombstones)
+
+        # Merging the runs and saving the new segment
+        store.close()
+        prefix = "pos_" if use_pos else "non_pos_"
+        order = sorted(range(n_docs), key=doc_ids.__getitem__)
+        sorted_ids = [doc_ids[i] for i in order]
+        dense = sorted_ids == list(range(n_docs))
+        files = {}
+        for field in fields:
             print(f"Saving index for {field}...")
-            prefix = "pos_" if use_pos else "non_pos_"
-            filename = f"{output_dir}/{field}.{prefix}index.json"
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(index, f, ensure_ascii=False)
+            builder = builders[field]
+            # The first segment of a full build keeps the historical file names
+            suffix = "" if not manifest["segments"] else f".{name}"
+            with STAGE_SECONDS.time(stage="write", field=field):
+                if index_format == "json":
+                    files[field] = f"{field}.{prefix}index{suffix}.json"
+                    self.write_json_index(
+                        f"{output_dir}/{files[field]}", builder.merge()
+                    )
+                else:
+                    files[field] = f"{field}.{prefix}index{suffix}.seg"
+                    writer = SegmentWriter(
+                        f"{output_dir}/{files[field]}", positional=use_pos
+                    )
+                    for term, postings in builder.merge():
+                        writer.add(term, postings)
+                    lengths = [doc_lengths[field][i] for i in order]
+                    writer.close(lengths, None if dense else sorted_ids)
+            builder.close()
+        manifest["segments"].append(
+            {
+                "name": name,
+                "files": files,
+                "store": store_file,
+                "n_docs": n_docs,
+                "deleted": [],
+            }
+        )
+        manifest["next_segment"] += 1
+        self.commit(output_dir, manifest, registry, previous_manifest)
+        if shard is None:
+            self.remove_shards(output_dir)
+
+        # Saving statistics
+        self.write_metadata(output_dir)
+
+        # Saving the term cache so that the Ranker can start warm
+        self.analyzer.save_cache(f"{output_dir}/term_cache.json")
+        print(f"Term cache: {self.analyzer.term_cache.stats()}")
+        print(f"Indexing completed in {time.time() - starting_time} seconds.")
+
+        # Compact the segments in the background
+        if index_format == "binary":
+            self._merge_thread = Thread(target=self.merge_segments, args=(output_dir,))
+            self._merge_thread.start()
+
+    @staticmethod
+    def remove_shards(output_dir):
+        """
+        This function removes the sharded index of a previous run, once the single index
+        replacing it is published, so that the Ranker no longer prefers it.
+
+        :param str output_dir: the directory of the index.
+
+        """
+        shards = read_json(f"{output_dir}/{SHARDS_FILE}")
+        if shards is None:
+            return
+        # The Ranker reads the shards file first, the shards are removed afterwards
+        os.remove(f"{output_dir}/{SHARDS_FILE}")
+        for path in shards["shards"]:
+            shutil.rmtree(os.path.dirname(f"{output_dir}/{path}"), ignore_errors=True)
+
+    @staticmethod
+    def _segment_doc_ids(output_dir, segment):
+        """
+        This function returns the doc ids of a segment.
+
+        :param str output_dir: the directory of the index.
+        :param dict segment: the entry of the segment in the manifest.
+        :return: the set of doc ids of the segment.
+
+        """
+        filename = next(iter(segment["files"].values()))
+        index = load_index(f"{output_dir}/{filename}")
+        doc_ids = set(index.doc_ids)
+        index.close()
+        return doc_ids
+
+    def commit(self, output_dir, manifest, registry, previous_manifest=None):
+        """
+        This function publishes a new version of the index. The registry is written before
+        the manifest, which is what the Ranker watches, and the segment files that are no
+        longer listed are removed.
+
+        :param str output_dir: the directory of the index.
+        :param dict manifest: the new manifest.
+        :param dict registry: the new registry, or None if it did not change.
+        :param dict previous_manifest: the manifest being replaced.
+
+        """
+        manifest["version"] += 1
+        if registry is not None:
+            write_json(f"{output_dir}/{REGISTRY_FILE}", registry)
+        write_json(f"{output_dir}/{MANIFEST_FILE}", manifest)
 
-            avg_tokens_per_field[field] = sum([len(doc) for doc in lemma_docs]) / len(
-                lemma_docs
+        # The Ranker keeps the old segments mapped until it reloads the manifest
+        files = {f for s in manifest["segments"] for f in self._segment_files(s)}
+        for segment in previous_manifest["segments"] if previous_manifest else []:
+            for filename in self._segment_files(segment):
+                if filename not in files and os.path.exists(f"{output_dir}/{filename}"):
+                    os.remove(f"{output_dir}/{filename}")
+
+    @staticmethod
+    def _segment_files(segment):
+        """
+        This function lists the files of a segment.
+
+        :param dict segment: the entry of the segment in the manifest.
+        :return: the list of file names.
+
+        """
+        files = list(segment["files"].values())
+        if segment.get("store"):
+            files.append(segment["store"])
+        return files
+
+    def merge_segments(self, output_dir):
+        """
+        This function compacts the segments of the index: the segments whose documents are
+        all deleted are dropped, and when there are more than max_segments segments the
+        smallest ones are merged into one, without their deleted documents. Doc ids are
+        stable, so the registry does not change.
+
+        :param str output_dir: the directory of the index.
+
+        """
+        previous_manifest = read_json(f"{output_dir}/{MANIFEST_FILE}")
+        manifest = json.loads(json.dumps(previous_manifest))
+        segments = [s for s in manifest["segments"] if len(s["deleted"]) < s["n_docs"]]
+        to_merge = []
+        if len(segments) > self.max_segments:
+            n_merged = len(segments) - self.max_segments + 1
+            by_size = sorted(segments, key=lambda s: s["n_docs"] - len(s["deleted"]))
+            to_merge = by_size[:n_merged]
+        if len(segments) == len(manifest["segments"]) and not to_merge:
+            return
+
+        if to_merge:
+            starting_time = time.time()
+            name = f"{manifest['next_segment']:05d}"
+            prefix = "pos_" if manifest["positional"] else "non_pos_"
+            files = {}
+            for field in manifest["fields"]:
+                files[field] = f"{field}.{prefix}index.{name}.seg"
+                n_docs = merge_segments(
+                    [f"{output_dir}/{s['files'][field]}" for s in to_merge],
+                    [set(s["deleted"]) for s in to_merge],
+                    f"{output_dir}/{files[field]}",
+                    manifest["positional"],
+                )
+            merged = {"name": name, "files": files, "n_docs": n_docs, "deleted": []}
+            if all(s.get("store") for s in to_merge):
+                merged["store"] = f"docs.{name}.store"
+                merge_stores(
+                    [f"{output_dir}/{s['store']}" for s in to_merge],
+                    [set(s["deleted"]) for s in to_merge],
+                    f"{output_dir}/{merged['store']}",
+                )
+            # Keep the merged segment at the position of the oldest merged one
+            position = segments.index(to_merge[0])
+            segments = [s for s in segments if s not in to_merge]
+            segments.insert(position, merged)
+            manifest["next_segment"] += 1
+            print(
+                f"Merged {len(to_merge)} segments into {name} "
+                f"in {time.time() - starting_time:.2f} seconds."
             )
+        manifest["segments"] = segments
+        self.commit(output_dir, manifest, None, previous_manifest)
 
-        # Saving statistics
+    def wait_for_merge(self):
+        """
+        This function waits for the background merge of the segments to complete.
+
+        """
+        if self._merge_thread is not None:
+            self._merge_thread.join()
+            self._merge_thread = None
+
+    def write_metadata(self, output_dir):
+        """
+        This function saves the statistics of the live documents of the index.
+
+        :param str output_dir: the directory of the index.
+
+        """
+        view = IndexView(f"{output_dir}/{MANIFEST_FILE}")
+        n_terms = {field: view.n_terms(field) for field in view.fields}
         statistics = {
-            "n_docs": len(lemma_docs),
-            "n_total_tokens": len(index),
-            "avg_tokens_per_doc": avg_tokens_per_field,
+            "n_docs": view.n_docs,
+            "n_total_tokens": n_terms[view.fields[-1]],
+            "avg_tokens_per_doc": view.avg_lengths,
+            # Collection statistics used by the BM25 scoring of the Ranker
+            "version": view.version,
+            "fields": {
+                field: {
+                    "n_terms": n_terms[field],
+                    "n_tokens": view.n_field_tokens[field],
+                    "avg_tokens": view.avg_lengths[field],
+                }
+                for field in view.fields
+            },
         }
+        view.close()
         output_file = f"{output_dir}/metadata.json"
-        with open(output_file, "w", encoding="utf-8") as file:
-            file.write(json.dumps(statistics, ensure_ascii=False))
-        print(f"Indexing completed in {time.time() - starting_time} seconds.")
+        self.write_atomically(output_file, json.dumps(statistics, ensure_ascii=False))
 
     def lemmatize(self, docs):
         """
@@ -96,14 +507,53 @@ class Indexer:
         :return: the lemmatized documents.
 
         """
-        docs = list(self.nlp.pipe(docs, disable=["parser", "ner"]))
-        lemma_docs = []
-        for i, doc in enumerate(docs):
-            lemma_docs.append([])
-            for token in doc:
-                if token.is_alpha and not token.is_stop:
-                    lemma_docs[i].append(token.lemma_.lower())
-        return lemma_docs
+        return self.analyzer.analyze(docs, stem=False)
+
+    @staticmethod
+    def write_json_index(filename, items):
+        """
+        This function writes an index in the JSON format, one term at a time.
+
+        :param str filename: the path to the JSON file.
+        :param iterable items: the (term, postings) pairs of the index, where postings is a
+            list of (doc_id, positions or term frequency) pairs.
+        :return: the number of terms written.
+
+        """
+        n_terms = 0
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as f:
+            f.write("{")
+            for term, postings in items:
+                if postings and isinstance(postings[0][1], int):
+                    # Non-positional index: one doc id per occurrence
+                    value = [doc_id for doc_id, tf in postings for _ in range(tf)]
+                else:
+                    value = {str(doc_id): positions for doc_id, positions in postings}
+                if n_terms:
+                    f.write(", ")
+                f.write(json.dumps(term, ensure_ascii=False))
+                f.write(": ")
+                f.write(json.dumps(value, ensure_ascii=False))
+                n_terms += 1
+            f.write("}")
+        os.replace(tmp_filename, filename)
+        return n_terms
+
+    @staticmethod
+    def write_atomically(filename, content):
+        """
+        This function writes a file through a temporary file so that readers such as the
+        Ranker never see a partially written file.
+
+        :param str filename: the path to the file to write.
+        :param str content: the content to write.
+
+        """
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_filename, filename)
 
     @staticmethod
     def create_index(docs, use_pos):
@@ -0,0 +1,321 @@
+import hashlib
+import heapq
+import json
+import os
+import zlib
+import numpy as np
+from backend.docstore import DocStore
+from backend.segment import SegmentWriter, load_index
+
+# The manifest lists the segments making up the index of each field:
+#   {
+#     "version": 3,                   incremented at every commit
+#     "fields": ["title"],
+#     "positional": true,
+#     "next_doc_id": 120,             doc ids are never reused
+#     "next_segment": 3,
+#     "segments": [
+#       {"name": "00000", "files": {"title": "title.pos_index.seg"},
+#        "store": "docs.00000.store", the fields shown with the results
+#        "n_docs": 100,
+#        "deleted": [4, 17]},         tombstones of the replaced or removed webpages
+#       ...
+#     ]
+#   }
+# The registry (docs.json) maps the URL of each indexed webpage to [doc_id, hash, time].
+# A sharded index splits the webpages by URL into shards, each being a segmented index
+# of its own directory. The shards file lists the manifests of the shards, and is
+# rewritten once every shard is indexed:
+#   {"version": 2, "shards": ["shard0/manifest.json", "shard1/manifest.json"]}
+MANIFEST_FILE = "manifest.json"
+REGISTRY_FILE = "docs.json"
+SHARDS_FILE = "shards.json"
+
+
+def shard_of(url, n_shards):
+    """
+    This function returns the shard of a webpage in a sharded index.
+
+    :param str url: the URL of the webpage.
+    :param int n_shards: the number of shards.
+    :return: the shard, between 0 and n_shards - 1.
+
+    """
+    return zlib.crc32(url.encode("utf-8")) % n_shards
+
+
+def page_hash(page, fields):
+    """
+    This function hashes the indexed fields of a webpage, to detect modified webpages.
+
+    :param dict page: the webpage.
+    :param list fields: the indexed fields.
+    :return: the hexadecimal digest.
+
+    """
+    content = json.dumps([page.get(field) for field in fields], ensure_ascii=False)
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def read_json(path, default=None):
+    """
+    This function reads a JSON file if it exists.
+
+    :param str path: the path to the JSON file.
+    :param default: the value to return if the file does not exist.
+    :return: the parsed content of the file or default.
+
+    """
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json(path, content):
+    """
+    This function writes a JSON file through a temporary file, so that readers never see a
+    partially written file.
+
+    :param str path: the path to the JSON file.
+    :param content: the content to write.
+
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(content, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _tag_items(segment, deleted):
+    """
+    This function iterates over the postings of a segment along with its tombstones.
+
+    :param Segment segment: the segment.
+    :param set deleted: the deleted doc ids of the segment.
+    :return: an iterator over (term, postings, deleted) tuples sorted by term.
+
+    """
+    for term, postings in segment.items():
+        yield term, postings, deleted
+
+
+def merge_segments(paths, deleted, output_path, positional):
+    """
+    This function merges segments into a single one, dropping the deleted documents. The
+    terms are merged with a k-way merge, so that only the postings of one term at a time
+    are held in memory.
+
+    :param list paths: the paths to the segments to merge.
+    :param list deleted: the set of deleted doc ids of each segment.
+    :param str output_path: the path to the merged segment.
+    :param bool positional: whether the segments are positional.
+    :return: the number of documents of the merged segment.
+
+    """
+    segments = [load_index(path) for path in paths]
+    try:
+        streams = [
+            _tag_items(segment, segment_deleted)
+            for segment, segment_deleted in zip(segments, deleted)
+        ]
+        writer = SegmentWriter(output_path, positional)
+        current_term, current_postings = None, []
+        merged = heapq.merge(*streams, key=lambda item: item[0])
+        for term, postings, segment_deleted in merged:
+            if term != current_term:
+                if current_postings:
+                    current_postings.sort(key=lambda posting: posting[0])
+                    writer.add(current_term, current_postings)
+                current_term, current_postings = term, []
+            current_postings.extend(p for p in postings if p[0] not in segment_deleted)
+        if current_postings:
+            current_postings.sort(key=lambda posting: posting[0])
+            writer.add(current_term, current_postings)
+
+        docs = sorted(
+            (doc_id, length)
+            for segment, segment_deleted in zip(segments, deleted)
+            for doc_id, length in zip(segment.doc_ids, segment.doc_lengths)
+            if doc_id not in segment_deleted
+        )
+        writer.close([length for _, length in docs], [doc_id for doc_id, _ in docs])
+    finally:
+        for segment in segments:
+            segment.close()
+    return len(docs)
+
+
+class IndexView:
+    """
+    Consistent snapshot of a segmented index: the segments listed by a manifest, their
+    tombstones and the URLs of the documents.
+    """
+
+    def __init__(self, manifest_path, doc_cache_size=0):
+        """
+        Initializes the IndexView and opens the segments.
+
+        :param str manifest_path: the path to the manifest.
+        :param int doc_cache_size: the number of decoded documents cached by each doc store.
+
+        """
+        self.directory = os.path.dirname(manifest_path)
+        manifest = read_json(manifest_path)
+        if manifest is None:
+            raise FileNotFoundError(manifest_path)
+        self.version = manifest["version"]
+        self.fields = manifest["fields"]
+        self.positional = manifest["positional"]
+
+        # [({field: Segment}, sorted array of the deleted doc ids), ...]
+        self.segments = []
+        # [(DocStore, sorted array of the deleted doc ids), ...], newest first
+        self.stores = []
+        for segment in manifest["segments"]:
+            indexes = {
+                field: load_index(os.path.join(self.directory, filename))
+                for field, filename in segment["files"].items()
+            }
+            deleted = np.array(segment["deleted"], dtype=np.int64)
+            self.segments.append((indexes, deleted))
+            if segment.get("store"):
+                store_path = os.path.join(self.directory, segment["store"])
+                self.stores.insert(0, (DocStore(store_path, doc_cache_size), deleted))
+        # Indexes written before the doc stores need the pages file
+        self.has_stores = len(self.stores) == len(self.segments)
+
+        registry = read_json(os.path.join(self.directory, REGISTRY_FILE), {})
+        self.doc_urls = {entry[0]: url for url, entry in registry.items()}
+        self.n_docs = len(self.doc_urls)
+
+        # Statistics of the live documents, and of all the documents of the segments
+        # (deleted ones included) which are the ones used for scoring
+        self.n_indexed_docs = sum(s["n_docs"] for s in manifest["segments"])
+        self.n_field_tokens, self.avg_lengths, self.indexed_avg_lengths = {}, {}, {}
+        for field in self.fields:
+            n_tokens, n_deleted_tokens = self.n_tokens(field)
+            self.n_field_tokens[field] = n_tokens - n_deleted_tokens
+            self.avg_lengths[field] = self.n_field_tokens[field] / (self.n_docs or 1)
+            self.indexed_avg_lengths[field] = n_tokens / (self.n_indexed_docs or 1)
+
+    def n_tokens(self, field):
+        """
+        This function counts the tokens of a field over the documents of the segments.
+
+        :param str field: the field.
+        :return: the number of tokens of all the documents and of the deleted ones.
+
+        """
+        total = deleted_total = 0
+        for indexes, deleted in self.segments:
+            index = indexes[field]
+            total += sum(index.doc_lengths)
+            deleted_total += sum(index.doc_length(d) for d in deleted.tolist())
+        return total, deleted_total
+
+    def document(self, doc_id):
+        """
+        This function returns the stored fields of a live document.
+
+        :param int doc_id: the id of the document.
+        :return: the stored fields, or None if the document is not stored or deleted.
+
+        """
+        for store, deleted in self.stores:
+            if doc_id in store:
+                i = np.searchsorted(deleted, doc_id)
+                if i < len(deleted) and deleted[i] == doc_id:
+                    continue
+                return store.get(doc_id)
+        return None
+
+    def n_terms(self, field):
+        """
+        This function counts the distinct terms of a field across the segments.
+
+        :param str field: the field.
+        :return: the number of terms.
+
+        """
+        terms = heapq.merge(*(indexes[field].terms() for indexes, _ in self.segments))
+        n_terms, previous = 0, None
+        for term in terms:
+            if term != previous:
+                n_terms += 1
+                previous = term
+        return n_terms
+
+    def close(self):
+        """
+        This function closes the segments.
+
+        """
+        for indexes, _ in self.segments:
+            for index in indexes.values():
+                index.close()
+        for store, _ in self.stores:
+            store.close()
+
+
+class ShardedView:
+    """
+    Consistent snapshot of a sharded index: the IndexView of each shard, and the
+    statistics of the whole index. The documents get global ids, doc_id * n_shards + shard,
+    from the ids they have in their shard.
+    """
+
+    def __init__(self, shards_path, doc_cache_size=0):
+        """
+        Initializes the ShardedView and opens the shards.
+
+        :param str shards_path: the path to the shards file.
+        :param int doc_cache_size: the number of decoded documents cached by each doc store.
+
+        """
+        shards = read_json(shards_path)
+        if shards is None:
+            raise FileNotFoundError(shards_path)
+        directory = os.path.dirname(shards_path)
+        self.manifests = [os.path.join(directory, path) for path in shards["shards"]]
+        self.views = [IndexView(path, doc_cache_size) for path in self.manifests]
+        self.n_shards = len(self.views)
+        self.version = (shards["version"],) + tuple(v.version for v in self.views)
+        self.fields = self.views[0].fields
+        self.has_stores = all(view.has_stores for view in self.views)
+        # The segments of every shard, only to count the documents containing a term
+        self.all_segments = [s for view in self.views for s in view.segments]
+        self.doc_urls = {
+            doc_id * self.n_shards + shard: url
+            for shard, view in enumerate(self.views)
+            for doc_id, url in view.doc_urls.items()
+        }
+        self.n_docs = sum(view.n_docs for view in self.views)
+        self.n_indexed_docs = sum(view.n_indexed_docs for view in self.views)
+        self.indexed_avg_lengths = {
+            field: sum(
+                view.indexed_avg_lengths[field] * view.n_indexed_docs
+                for view in self.views
+            )
+            / (self.n_indexed_docs or 1)
+            for field in self.fields
+        }
+
+    def document(self, doc_id):
+        """
+        This function returns the stored fields of a live document.
+
+        :param int doc_id: the global id of the document.
+        :return: the stored fields, or None if the document is not stored or deleted.
+
+        """
+        shard_doc_id, shard = divmod(doc_id, self.n_shards)
+        return self.views[shard].document(shard_doc_id)
+
+    def close(self):
+        """
+        This function closes the shards.
+
+        """
+        for view in self.views:
+            view.close()
@@ -0,0 +1,247 @@
+import gzip
+import json
+import os
+import re
+
+
+def iter_json_array(f, chunk_size=1 << 16):
+    """
+    This function parses a JSON array incrementally and yields its elements one by one,
+    so that only one element at a time has to be held in memory.
+
+    :param f: the text file containing the JSON array.
+    :param int chunk_size: the number of characters read at once.
+    :return: an iterator over the elements of the array.
+
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    started = False
+    eof = False
+
+    while True:
+        # Skip the separators between the elements
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if not started and pos < len(buffer):
+            if buffer[pos] != "[":
+                raise ValueError("The file does not contain a JSON array.")
+            started = True
+            pos += 1
+            continue
+        if started and pos < len(buffer) and buffer[pos] == "]":
+            return
+
+        if pos < len(buffer):
+            try:
+                element, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield element
+                continue
+
+        # Read more content, dropping what was already parsed
+        if eof:
+            if started:
+                raise ValueError("Unexpected end of the JSON array.")
+            return
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+def is_page_log(path):
+    """
+    This function tells whether a file of webpages is a page log, in the JSON Lines format,
+    rather than a JSON array.
+
+    :param str path: the path to the file.
+    :return: True if the file is a page log.
+
+    """
+    return path.endswith((".jsonl", ".jsonl.gz"))
+
+
+def open_text(path, mode="r"):
+    """
+    This function opens a UTF-8 text file, compressed with gzip if its name ends with .gz.
+
+    :param str path: the path to the file.
+    :param str mode: "r", "w" or "a".
+    :return: the file object.
+
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def iter_json_lines(f):
+    """
+    This function parses a JSON Lines file line by line. A log cut in the middle of a line,
+    e.g. by a crash of the crawler, ends at its last complete line.
+
+    :param f: the text file containing one JSON value per line.
+    :return: an iterator over the values.
+
+    """
+    try:
+        for line in f:
+            if not line.endswith("\n"):
+                return  # Truncated last line
+            if line.strip():
+                yield json.loads(line)
+    except EOFError:
+        return  # Truncated gzip stream
+
+
+def shard_path(path, shard):
+    """
+    This function returns the path of a shard of a file, written by one of the crawlers of
+    a partitioned crawl, e.g. data/crawled_pages.part2.jsonl.gz.
+
+    :param str path: the path to the file.
+    :param int shard: the number of the shard.
+    :return: the path to the shard, with the extensions of the file.
+
+    """
+    directory, name = os.path.split(path)
+    stem, dot, extensions = name.partition(".")
+    return os.path.join(directory, f"{stem}.part{shard}{dot}{extensions}")
+
+
+def page_files(path):
+    """
+    This function lists the existing files holding the webpages saved at a path: the file
+    itself and its shards, in the order of the shards.
+
+    :param str path: the path to the file.
+    :return: the paths to the files.
+
+    """
+    directory, name = os.path.split(path)
+    stem, dot, extensions = name.partition(".")
+    pattern = re.compile(rf"{re.escape(stem)}\.part(\d+){re.escape(dot + extensions)}")
+    shards = []
+    if os.path.isdir(directory or "."):
+        for file_name in os.listdir(directory or "."):
+            match = pattern.fullmatch(file_name)
+            if match:
+                shards.append((int(match.group(1)), os.path.join(directory, file_name)))
+    files = [path] if os.path.exists(path) else []
+    return files + [shard for _, shard in sorted(shards)]
+
+
+def iter_pages(input_file, limit=None):
+    """
+    This function streams the webpages saved by the crawler. The webpages saved in shards
+    by a partitioned crawl are read one shard after the other, and the near-duplicates
+    logged without their content are skipped.
+
+    :param str input_file: the path to the JSON file containing the list of webpages, or
+        to the page log of the crawler.
+    :param int limit: the maximum number of webpages to read.
+    :return: an iterator over the webpages.
+
+    """
+    n_pages = 0
+    for path in page_files(input_file) or [input_file]:
+        with open_text(path) as f:
+            pages = iter_json_lines(f) if is_page_log(path) else iter_json_array(f)
+            for page in pages:
+                if "duplicate_of" in page:
+                    continue
+                if limit and n_pages >= limit:
+                    return
+                n_pages += 1
+                yield page
+
+
+class PageLog:
+    """
+    Append-only JSON Lines log of the crawled webpages, compressed with gzip if its name
+    ends with .gz. The webpages are written as soon as they are crawled instead of being
+    kept in memory, and the log is flushed at each checkpoint of the crawl, so that a
+    stopped crawl keeps every webpage logged before its last checkpoint. The near-duplicate
+    webpages are logged as {"url", "time", "duplicate_of"}, without their content.
+    """
+
+    def __init__(self, path, resume=False):
+        """
+        Initializes the PageLog and opens the log.
+
+        :param str path: the path to the log.
+        :param bool resume: whether to append to an existing log instead of starting a new
+            one.
+
+        """
+        self.path = path
+        # {url: time} of the webpages already in the log, duplicates too
+        self.visited = {}
+        self.fingerprints = {}  # {url: SimHash} of the webpages logged with one
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if resume and os.path.exists(path):
+            self.recover()
+        self._file = open_text(path, "a" if resume else "w")
+
+    def recover(self):
+        """
+        This function reads the webpages of an existing log. If the log ends with a partly
+        written webpage, it is rewritten without it so that new webpages can be appended.
+
+        """
+        n_pages, complete = 0, True
+        with open_text(self.path) as f:
+            try:
+                for line in f:
+                    if not line.endswith("\n"):
+                        complete = False
+                    elif line.strip():
+                        page = json.loads(line)
+                        self.visited[page["url"]] = page.get("time")
+                        if page.get("simhash") is not None:
+                            self.fingerprints[page["url"]] = page["simhash"]
+                        n_pages += 1
+            except EOFError:
+                complete = False
+        if not complete:
+            print(f"Dropping the truncated end of {self.path}...")
+            # The temporary log keeps the extension, hence the compression, of the log
+            directory, name = os.path.split(self.path)
+            tmp_path = os.path.join(directory, f"tmp.{name}")
+            with open_text(self.path) as source, open_text(tmp_path, "w") as f:
+                for page in iter_json_lines(source):
+                    f.write(json.dumps(page, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+        print(f"Found {n_pages} webpages in {self.path}.")
+
+    def write(self, page):
+        """
+        This function appends a webpage to the log.
+
+        :param dict page: the webpage.
+
+        """
+        self._file.write(json.dumps(page, ensure_ascii=False) + "\n")
+
+    def flush(self):
+        """
+        This function writes the buffered webpages to the disk.
+
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        """
+        This function flushes and closes the log.
+
+        """
+        self.flush()
+        self._file.close()
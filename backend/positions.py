@@ -0,0 +1,153 @@
+import re
+import numpy as np
+
+# A position is encoded with its document in a single sortable key: doc_id << 32 | position
+POSITION_BITS = 32
+PHRASE = re.compile(r'"([^"]*)"?')
+
+
+def parse_query(query):
+    """
+    This function extracts the quoted phrases of a query.
+
+    :param str query: the query, e.g. 'inscription "page introuvable"'.
+    :return: the text outside of the quotes and the list of the quoted phrases.
+
+    """
+    phrases = [phrase.strip() for phrase in PHRASE.findall(query) if phrase.strip()]
+    return PHRASE.sub(" ", query).strip(), phrases
+
+
+def position_keys(doc_ids, tfs, positions, shift=0):
+    """
+    This function merges the doc ids and the positions of a term into sorted keys.
+
+    :param numpy.ndarray doc_ids: the sorted doc ids.
+    :param numpy.ndarray tfs: the number of positions of each document.
+    :param numpy.ndarray positions: the sorted positions of each document, concatenated.
+    :param int shift: a number subtracted from the positions, the positions lower than it
+        are dropped.
+    :return: the sorted keys.
+
+    """
+    keys = (np.repeat(doc_ids, tfs) << POSITION_BITS) + positions - shift
+    return keys[positions >= shift]
+
+
+def intersect_sorted(a, b):
+    """
+    This function intersects two sorted arrays of unique integers. Each element of the
+    smaller array is searched in the larger one with a binary search, so the cost is
+    O(m log n) like a galloping merge, instead of O(m + n).
+
+    :param numpy.ndarray a: a sorted array.
+    :param numpy.ndarray b: a sorted array.
+    :return: the sorted common elements.
+
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return a
+    found = np.searchsorted(b, a)
+    found[found == len(b)] = 0
+    return a[b[found] == a]
+
+
+def phrase_matches(term_positions):
+    """
+    This function finds the occurrences of a phrase, i.e. the positions where each term of
+    the phrase directly follows the previous one.
+
+    :param list term_positions: the (doc_ids, tfs, positions) arrays of each term of the
+        phrase, in the order of the phrase.
+    :return: the sorted ids of the documents containing the phrase and the number of
+        occurrences in each of them.
+
+    """
+    # Align the positions of every term on the start of the phrase, and intersect them
+    # starting from the rarest term
+    keys = [
+        position_keys(doc_ids, tfs, positions, shift)
+        for shift, (doc_ids, tfs, positions) in enumerate(term_positions)
+    ]
+    keys.sort(key=len)
+    starts = keys[0]
+    for other in keys[1:]:
+        if not len(starts):
+            break
+        starts = intersect_sorted(starts, other)
+    return np.unique(starts >> POSITION_BITS, return_counts=True)
+
+
+def min_distances(first, second):
+    """
+    This function computes, in each document containing two terms, the smallest distance
+    between an occurrence of the first term and one of the second term. The sorted
+    positions of both terms are merged, so that the closest occurrences are neighbors.
+
+    :param tuple first: the (doc_ids, tfs, positions) arrays of the first term.
+    :param tuple second: the (doc_ids, tfs, positions) arrays of the second term.
+    :return: the sorted ids of the documents containing both terms and the distances.
+
+    """
+    keys = np.concatenate([position_keys(*first), position_keys(*second)])
+    tags = np.repeat([0, 1], [len(keys) - len(second[2]), len(second[2])])
+    # Both halves are sorted, so the stable sort merges them
+    order = np.argsort(keys, kind="stable")
+    keys, tags = keys[order], tags[order]
+
+    docs = keys >> POSITION_BITS
+    neighbors = (tags[1:] != tags[:-1]) & (docs[1:] == docs[:-1])
+    if not neighbors.any():
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    docs = docs[1:][neighbors]
+    distances = (keys[1:] - keys[:-1])[neighbors]
+    doc_ids, starts = np.unique(docs, return_index=True)
+    return doc_ids, np.minimum.reduceat(distances, starts)
+
+
+def match_phrases(phrases, segments, fields):
+    """
+    This function finds the documents containing every phrase in one of their fields. The
+    documents containing all the terms of a phrase are found first, then only their
+    positions are decoded and intersected.
+
+    :param list phrases: the normalized terms of each phrase.
+    :param list segments: the ({field: index}, deleted doc ids array) pairs to search.
+    :param list fields: the fields to search.
+    :return: the sorted ids of the matching documents, or None if no field is positional.
+
+    """
+    matched = None
+    positional = False
+    for phrase in phrases:
+        found = []
+        for indexes, deleted in segments:
+            for field in fields:
+                index = indexes[field]
+                if not index.positional:
+                    continue
+                positional = True
+                # Start from the rarest term, and only decode the blocks of the other
+                # terms that hold candidates
+                terms = sorted(set(phrase), key=index.doc_freq)
+                candidates = index.postings_array(terms[0])[0]
+                if matched is not None:
+                    candidates = intersect_sorted(candidates, matched)
+                for term in terms[1:]:
+                    if not len(candidates):
+                        break
+                    candidates = index.postings_among(term, candidates)[0]
+                if not len(candidates):
+                    continue
+                term_positions = [
+                    index.positions_array(term, candidates) for term in phrase
+                ]
+                ids, _ = phrase_matches(term_positions)
+                found.append(ids[~np.isin(ids, deleted)])
+        if not positional:
+            return None
+        found = np.unique(np.concatenate(found)) if found else np.zeros(0, np.int64)
+        matched = found if matched is None else intersect_sorted(matched, found)
+    return matched
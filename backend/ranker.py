@@ -1,13 +1,157 @@
 import json
-import spacy
+import os
 import time
-from threading import Thread
-from nltk.stem import SnowballStemmer
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from threading import Lock, Thread
+from backend.analyzer import Analyzer
+from backend.manifest import IndexView, ShardedView
+from backend.pages import iter_pages
+from backend.positions import match_phrases, min_distances, parse_query
+from backend.scoring import Scorer
+from backend.segment import load_index
+from backend.snippets import SnippetGenerator, encode_offsets
+from utils import metrics
+from utils.lru import LRUCache
+from utils.reloadable import ReloadableFile
+
+# The score stage includes the postings stage, timed by the Scorer
+STAGE_SECONDS = metrics.registry.histogram(
+    "noodle_ranker_stage_seconds", "Seconds spent in each stage of a search."
+)
+SEARCHES = metrics.registry.counter(
+    "noodle_ranker_searches_total", "Searches, by whether the result cache held them."
+)
+
+
+def load_pages_by_url(path):
+    """
+    This function loads the webpages saved by the crawler, keyed by URL.
+
+    :param str path: the path to the JSON file containing the list of webpages, or to the
+        page log of the crawler.
+    :return: a dictionary {url: webpage}.
+
+    """
+    return {page["url"]: page for page in iter_pages(path)}
+
+
+# Rankers of the shards of a sharded index scored by this process, {manifest: Ranker}
+_shard_rankers = {}
+# Versions of the shards scored by this process, {manifest: {version: IndexView}}
+_shard_views = {}
+_shard_rankers_lock = Lock()
+# Versions of a shard kept by each process of the shard pool, for the Rankers that did
+# not reload the sharded index yet
+MAX_SHARD_VERSIONS = 4
+
+
+class StaleShardError(Exception):
+    """
+    Raised when a shard of a sharded index is no longer available in the version of the
+    sharded index loaded by the Ranker, which must reload it.
+    """
+
+
+def shard_view(ranker, manifest, version):
+    """
+    This function returns a version of a shard of a sharded index, loading it if it is
+    newer than the versions already loaded. The previous versions are kept open, so that
+    the shards are scored in the version the Ranker maps the documents with.
+
+    :param Ranker ranker: the Ranker of the shard.
+    :param str manifest: the path to the manifest of the shard.
+    :param int version: the version of the shard.
+    :return: the IndexView of the shard.
+
+    """
+    views = _shard_views.setdefault(manifest, {})
+    current = ranker.index.get()
+    views.setdefault(current.version, current)
+    if version not in views and version > current.version:
+        ranker.index.reload()
+        current = ranker.index.get()
+        views.setdefault(current.version, current)
+    view = views.get(version)
+    # The oldest versions are closed, unless they are the current one
+    for old_version in sorted(views)[:-MAX_SHARD_VERSIONS]:
+        if views[old_version] is not current:
+            views.pop(old_version).close()
+    if view is None:
+        raise StaleShardError(f"Version {version} of {manifest} is not available.")
+    return view
+
+
+def search_shard(
+    manifest,
+    version,
+    settings,
+    lemma_query,
+    n_results,
+    phrases,
+    statistics,
+    doc_freqs,
+):
+    """
+    This function ranks the documents of a shard of a sharded index with the statistics of
+    the whole index. It runs in the processes of the shard pool of the Ranker, each of
+    which keeps a Ranker per shard with the shard mapped in memory.
+
+    :param str manifest: the path to the manifest of the shard.
+    :param int version: the version of the shard in the sharded index loaded by the
+        Ranker, which maps the documents it returns to their shard with this version.
+    :param dict settings: the keyword arguments of the Ranker of the shard.
+    :param list lemma_query: the lemmatized and stemmed query.
+    :param int n_results: the number of documents to return, or None to return them all.
+    :param list phrases: the lemmatized and stemmed phrases the documents must contain.
+    :param tuple statistics: the number of documents and the average number of tokens of
+        each field of the whole index.
+    :param dict doc_freqs: the document frequencies of the terms of the query in the whole
+        index, see Scorer.doc_freqs.
+    :return: a list of (doc_id, score) pairs sorted by decreasing score, with the ids of
+        the documents in the shard.
+
+    """
+    with _shard_rankers_lock:
+        ranker = _shard_rankers.get(manifest)
+        if ranker is None:
+            ranker = _shard_rankers[manifest] = Ranker(
+                None,
+                manifest=manifest,
+                result_cache_size=0,
+                snippet_length=0,
+                **settings,
+            )
+        view = shard_view(ranker, manifest, version)
+    return ranker.rank_docs(
+        lemma_query, n_results, phrases, view, statistics, doc_freqs
+    )
 
 
 class Ranker:
     def __init__(
-        self, pages_file, fields, lem_model="fr_core_news_sm", stem_model="french"
+        self,
+        pages_file,
+        fields,
+        lem_model="fr_core_news_sm",
+        stem_model="french",
+        reload_interval=1.0,
+        term_cache=None,
+        nlp=None,
+        manifest=None,
+        scoring="bm25f",
+        k1=1.2,
+        b=0.75,
+        proximity=0.0,
+        proximity_depth=100,
+        result_cache_size=1000,
+        result_cache_ttl=60.0,
+        result_window=100,
+        doc_cache_size=1000,
+        snippet_length=200,
+        shards=None,
+        shard_processes=None,
     ):
         """
         This function initializes the Ranker class.
@@ -18,39 +162,163 @@ class Ranker:
             The keys are the fields and the values are dictionaries containing the "weight" and "index-file".
         :param str lem_model: the SpaCy model to use for lemmatization.
         :param str stem_model: the Snowball stemmer to use for stemming.
+        :param float reload_interval: the minimum number of seconds between two checks of the
+            index and pages files for modifications.
+        :param str term_cache: the path to a term cache saved by the Indexer, used to warm
+            the query analysis cache.
+        :param spacy.Language nlp: an already loaded SpaCy pipeline to use instead of lem_model.
+        :param str manifest: the path to the manifest of a segmented index written by the
+            Indexer. If it exists, the index-file of the fields are ignored and every segment
+            of the index is queried.
+        :param str scoring: the scoring method, "frequency", "bm25" or "bm25f".
+        :param float k1: the BM25 saturation of the term frequencies.
+        :param float b: the BM25 strength of the document length normalization.
+        :param float proximity: the weight of the proximity boost, which adds weight / d to
+            the score of a webpage for each pair of consecutive query terms found d
+            positions apart in a field. 0 disables it.
+        :param int proximity_depth: the number of best webpages reranked with the
+            proximity boost.
+        :param int result_cache_size: the maximum number of queries whose results are cached.
+        :param float result_cache_ttl: the number of seconds the results of a query are
+            cached, or None to keep them until they are evicted.
+        :param int result_window: the minimum number of results computed for a query, so
+            that the next pages of results are served from the cache.
+        :param int doc_cache_size: the number of documents kept decoded by each doc store of
+            the segmented index.
+        :param int snippet_length: the number of characters of the query-biased snippet
+            replacing the content of the results, 0 to return the stored content as is.
+        :param str shards: the path to the shards file of a sharded index written by the
+            Indexer. If it exists, it replaces the manifest, and the shards are scored in
+            parallel then their best documents are merged.
+        :param int shard_processes: the number of processes scoring the shards, None for one
+            per shard, 0 to score them one after the other in this process.
 
         """
         self.pages_file = pages_file
         self.fields = fields  # {"field": {"weight": weight, "index-file": index-file}}
+        self.scorer = Scorer(fields, scoring, k1=k1, b=b)
+        self.proximity = proximity
+        self.proximity_depth = proximity_depth
+        self.result_window = result_window
+        # {(query, phrases, index version): (ranked (doc_id, score) pairs, window)}
+        self.results = LRUCache(result_cache_size, result_cache_ttl)
+        self._statistics = (None, None)  # Statistics of the legacy indexes
+
+        # Preload the indexes and the webpages, they are reloaded in the
+        # background whenever the files are rewritten
+        print("Loading indexes and webpages ...")
+        self.index = None
+        self.indexes = {}
+        self.reload_interval = reload_interval
+        self.shard_pool = None
+        if shards and os.path.exists(shards):
+            self.index = ReloadableFile(
+                shards,
+                loader=lambda path: ShardedView(path, doc_cache_size),
+                check_interval=reload_interval,
+            )
+            self.pages = None
+            # The processes of the pool build a Ranker for each shard with these settings,
+            # whose analyzer is never loaded since the queries are analyzed here
+            self.shard_settings = {
+                "fields": fields,
+                "lem_model": lem_model,
+                "stem_model": stem_model,
+                "scoring": scoring,
+                "k1": k1,
+                "b": b,
+                "proximity": proximity,
+                "proximity_depth": proximity_depth,
+                "reload_interval": reload_interval,
+            }
+            if shard_processes is None:
+                shard_processes = self.index.get().n_shards
+            if shard_processes:
+                self.shard_pool = ProcessPoolExecutor(
+                    shard_processes, mp_context=get_context("spawn")
+                )
+        elif manifest and os.path.exists(manifest):
+            # The results are read from the doc stores of the segments, the pages file is
+            # only loaded for indexes written without them
+            self.index = ReloadableFile(
+                manifest,
+                loader=lambda path: IndexView(path, doc_cache_size),
+                check_interval=reload_interval,
+            )
+            self.pages = None
+        else:
+            self.indexes = {
+                field: ReloadableFile(
+                    fields[field]["index-file"],
+                    loader=load_index,
+                    check_interval=reload_interval,
+                )
+                for field in fields
+            }
+            self.pages = ReloadableFile(
+                pages_file,
+                loader=lambda path: list(iter_pages(path)),
+                check_interval=reload_interval,
+            )
+
+        # Load the query analyzer and warm its cache, again whenever the Indexer saves
+        # the words of a new version of the index
+        self.analyzer = Analyzer(lem_model, stem_model, nlp=nlp)
+        self.snippets = SnippetGenerator(self.analyzer, snippet_length)
+        self.term_cache = None
+        if term_cache and os.path.exists(term_cache):
+            self.term_cache = ReloadableFile(
+                term_cache, loader=self.load_term_cache, check_interval=reload_interval
+            )
+
+    def load_term_cache(self, path):
+        """
+        This function warms the caches of the analyzer with the term cache saved by the
+        Indexer, and makes the snippets highlight the words it adds.
 
-        # Check if the SpaCy model is installeds
-        if not spacy.util.is_package(lem_model):
-            print(f"Downloading {lem_model} model ...")
-            spacy.cli.download(lem_model)
-
-        # Load the SpaCy model
-        print(f"Loading {lem_model} model ...")
-        self.nlp = spacy.load(lem_model)
+        :param str path: the path to the term cache.
+        :return: the number of terms of the analyzer.
 
-        # Load the stemmer
-        if stem_model:
-            self.stemmer = SnowballStemmer(stem_model)
+        """
+        self.analyzer.load_cache(path)
+        self.snippets.refresh()
+        print(f"Loaded {len(self.analyzer.term_cache)} terms from {path}.")
+        return len(self.analyzer.term_cache)
 
     def run(self, query, n_results=10):
         """
         This function ranks the webpages based on the query.
 
-        :param str query: the query to rank the webpages.
+        :param str query: the query to rank the webpages. Quoted phrases, e.g.
+            '"page introuvable"', must appear as is in the webpages.
         :param int n_results: the number of results to return.
         :return: the ranked webpages.
 
         """
         # Preprocess the query
-        lemma_query = self.preprocess_query([query])
+        lemma_query, phrases = self.analyze(query)
 
         # Rank the webpages
-        ranked_pages = self.rank_pages(lemma_query)
-        return ranked_pages[:n_results]
+        pages = self.rank_pages(lemma_query, n_results, phrases)
+        return self.add_snippets(pages, lemma_query, query)
+
+    def analyze(self, query):
+        """
+        This function analyzes a query and its phrases, with the term cache of the last
+        version of the index.
+
+        :param str query: the query.
+        :return: the lemmatized and stemmed query, and the lemmatized and stemmed phrases.
+
+        """
+        if self.term_cache is not None:
+            self.term_cache.get()
+        with STAGE_SECONDS.time(stage="analyze"):
+            lemma_query = self.preprocess_query(query)
+            phrases = [
+                self.preprocess_query(phrase) for phrase in parse_query(query)[1]
+            ]
+        return lemma_query, phrases
 
     def preprocess_query(self, query):
         """
@@ -60,96 +328,355 @@ class Ranker:
         :return: the lemmatized and stemmed query.
 
         """
-        docs = list(self.nlp.pipe(query, disable=["parser", "ner"]))
-        lemma_docs = []
-        for i, doc in enumerate(docs):
-            lemma_docs.append([])
-            for token in doc:
-                if token.is_alpha and not token.is_stop:
-                    lemma_docs[i].append(token.lemma_.lower())
+        return self.analyzer.analyze_query(query)
+
+    def search(self, query, offset=0, limit=10):
+        """
+        This function returns a page of the results of a query. The results are computed
+        by windows of result_window webpages and cached with the version of the index, so
+        that repeated queries and the next pages of results are not scored again.
+
+        :param str query: the query to rank the webpages.
+        :param int offset: the number of results to skip.
+        :param int limit: the number of results to return, or None to return them all.
+        :return: the ranked webpages.
 
-        # Stem the lemmatized content
-        if self.stemmer:
-            for i, doc in enumerate(lemma_docs):
-                lemma_docs[i] = [self.stemmer.stem(token) for token in doc]
-        return lemma_docs[0]
+        """
+        end = None if limit is None else offset + limit
+        lemma_query, ranked, view = self.rank_query(query, end)
+        pages = self.to_pages(ranked[offset:end], view)
+        return self.add_snippets(pages, lemma_query, query)
+
+    def search_stream(self, query, offset=0, limit=None):
+        """
+        This function ranks the results of a query like search, but only fetches each
+        webpage and builds its snippet when the next result is read, so that exporting
+        many results does not hold them all in memory.
+
+        :param str query: the query to rank the webpages.
+        :param int offset: the number of results to skip.
+        :param int limit: the number of results to return, or None to return them all.
+        :return: an iterator over the ranked webpages.
+
+        """
+        end = None if limit is None else offset + limit
+        lemma_query, ranked, view = self.rank_query(query, end)
+
+        def pages():
+            for pair in ranked[offset:end]:
+                yield from self.add_snippets(
+                    self.to_pages([pair], view), lemma_query, query
+                )
+
+        return pages()
+
+    def rank_query(self, query, end=None):
+        """
+        This function ranks the documents of a query, by windows of result_window
+        documents cached with the version of the index.
+
+        :param str query: the query to rank the webpages.
+        :param int end: the number of best documents needed, or None for all of them.
+        :return: the lemmatized and stemmed query, the ranked (doc_id, score) pairs, at
+            least end of them if there are, and the index they were ranked with.
 
-    def rank_pages(self, lemma_query):
+        """
+        lemma_query, phrases = self.analyze(query)
+        view = self.index.get() if self.index else None
+        key = (
+            tuple(lemma_query),
+            tuple(tuple(phrase) for phrase in phrases),
+            self.index_version(view),
+        )
+
+        # The cached window holds the results if they fit or if there are no more results
+        cached = self.results.get(key)
+        if cached is not None:
+            ranked, window = cached
+            complete = window is None or len(ranked) < window
+            if complete or (end is not None and end <= window):
+                SEARCHES.inc(cache="hit")
+                return lemma_query, ranked, view
+
+        SEARCHES.inc(cache="miss")
+        window = None
+        if end is not None:
+            window = -(-max(end, 1) // self.result_window) * self.result_window
+        try:
+            ranked = self.rank_docs(lemma_query, window, phrases, view)
+        except StaleShardError:
+            # The sharded index was reindexed, the search restarts with its new version
+            self.index.reload()
+            return self.rank_query(query, end)
+        self.results.put(key, (ranked, window))
+        return lemma_query, ranked, view
+
+    def add_snippets(self, pages, lemma_query, query):
+        """
+        This function replaces the content of the webpages by the snippet of the content
+        best matching the query, along with the spans of the matching words. The offsets
+        of the words are read from the doc store, and only computed for the webpages of
+        indexes written without one.
+
+        :param list pages: the webpages.
+        :param list lemma_query: the lemmatized and stemmed query.
+        :param str query: the query.
+        :return: copies of the webpages, with their "content" and "highlights".
+
+        """
+        results = []
+        with STAGE_SECONDS.time(stage="snippets"):
+            for page in pages:
+                # The webpages are shared with the caches of the doc stores
+                page = dict(page)
+                offsets = page.pop("offsets", None)
+                if self.snippets.length:
+                    content = page.get("content", "")
+                    if offsets is None:
+                        offsets = encode_offsets(content)
+                    page["content"], page["highlights"] = self.snippets.snippet(
+                        content, offsets, lemma_query, query
+                    )
+                results.append(page)
+        return results
+
+    def index_version(self, view=None):
+        """
+        This function returns the version of the index, which changes whenever it is
+        reloaded.
+
+        :param IndexView view: the segmented or sharded index, or None to use the
+            index-file of the fields.
+        :return: a hashable version.
+
+        """
+        if view is not None:
+            return view.version
+        return tuple(index.n_reloads for index in self.indexes.values())
+
+    def rank_pages(self, lemma_query, n_results=None, phrases=()):
         """
         This function ranks the webpages based on the query.
 
         :param list lemma_query: the lemmatized and stemmed query.
+        :param int n_results: the number of webpages to return, or None to return them all.
+        :param list phrases: the lemmatized and stemmed phrases the webpages must contain.
         :return: the ranked webpages.
 
         """
-        scores = {}  # {"doc_id": score, ...}
+        view = self.index.get() if self.index else None
+        try:
+            ranked = self.rank_docs(lemma_query, n_results, phrases, view)
+        except StaleShardError:
+            # The sharded index was reindexed, the ranking restarts with its new version
+            self.index.reload()
+            return self.rank_pages(lemma_query, n_results, phrases)
+        return self.to_pages(ranked, view)
+
+    def rank_docs(
+        self,
+        lemma_query,
+        n_results=None,
+        phrases=(),
+        view=None,
+        statistics=None,
+        doc_freqs=None,
+    ):
+        """
+        This function ranks the documents based on the query.
 
-        # Load the index
-        for field in self.fields:
-            weight = self.fields[field]["weight"]
-            index_file = self.fields[field]["index-file"]
+        :param list lemma_query: the lemmatized and stemmed query.
+        :param int n_results: the number of documents to return, or None to return them all.
+        :param list phrases: the lemmatized and stemmed phrases the documents must contain.
+        :param IndexView view: the segmented index, the sharded index, or None to use the
+            index-file of the fields.
+        :param tuple statistics: the number of documents and the average number of tokens
+            of each field to score with, e.g. the ones of the whole sharded index. Defaults
+            to the ones of the index.
+        :param dict doc_freqs: the document frequencies of the terms of the query to score
+            with, see Scorer.doc_freqs. Defaults to the ones of the index.
+        :return: a list of (doc_id, score) pairs sorted by decreasing score.
 
-            # Load the index file
-            with open(index_file, "r", encoding="utf-8") as f:
-                index = json.load(
-                    f
-                )  # {"token": {"doc_id": [pos_1, pos_2, ...], ...}, ...}
+        """
+        if isinstance(view, ShardedView):
+            return self.rank_shards(lemma_query, n_results, phrases, view)
+        segments = self.segments(view)
+        n_docs, avg_lengths = statistics or self.statistics(view, segments)
+
+        # Only the webpages containing the phrases are scored
+        among = None
+        phrases = [phrase for phrase in phrases if len(phrase) > 1]
+        if phrases:
+            with STAGE_SECONDS.time(stage="phrases"):
+                among = match_phrases(phrases, segments, self.fields)
+            if among is not None and not len(among):
+                return []
+
+        # Score the webpages on every field of every segment at once, skipping the
+        # webpages that cannot be among the n_results best ones
+        depth = n_results
+        if self.proximity and n_results is not None:
+            depth = max(n_results, self.proximity_depth)
+        with STAGE_SECONDS.time(stage="score"):
+            if depth is None:
+                doc_ids, scores = self.scorer.score(
+                    lemma_query, segments, n_docs, avg_lengths, among, doc_freqs
+                )
+                ranked = self.scorer.top(doc_ids, scores)
+            else:
+                ranked = self.scorer.top_k(
+                    lemma_query, segments, n_docs, avg_lengths, depth, among, doc_freqs
+                )
+        if self.proximity:
+            with STAGE_SECONDS.time(stage="proximity"):
+                ranked = self.boost_proximity(lemma_query, ranked, segments)
+            ranked = ranked[:n_results]
+        return ranked
+
+    def rank_shards(self, lemma_query, n_results, phrases, view):
+        """
+        This function ranks the documents of a sharded index. The shards are scored in
+        parallel in the shard pool with the statistics of the whole index, so that their
+        scores are the ones of a single index, then their best documents are merged.
 
-            for lemma in lemma_query:
-                if lemma in index:
-                    for doc_id in index[lemma]:
-                        if doc_id not in scores:
-                            scores[doc_id] = 0
-                        scores[doc_id] += weight * len(index[lemma][doc_id])
+        :param list lemma_query: the lemmatized and stemmed query.
+        :param int n_results: the number of documents to return, or None to return them all.
+        :param list phrases: the lemmatized and stemmed phrases the documents must contain.
+        :param ShardedView view: the sharded index.
+        :return: a list of (doc_id, score) pairs sorted by decreasing score, with the global
+            ids of the documents.
+        :raises StaleShardError: if a shard was reindexed since the view was loaded, and
+            its version in the view is no longer available in the shard pool.
 
-        # Sort the webpages based on the scores
-        sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        """
+        statistics = (view.n_indexed_docs, view.indexed_avg_lengths)
+        doc_freqs = self.scorer.doc_freqs(lemma_query, view.all_segments)
+        with STAGE_SECONDS.time(stage="score"):
+            if self.shard_pool is None:
+                # The shards of the view are scored as they are
+                results = [
+                    self.rank_docs(
+                        lemma_query,
+                        n_results,
+                        phrases,
+                        shard_view,
+                        statistics,
+                        doc_freqs,
+                    )
+                    for shard_view in view.views
+                ]
+            else:
+                tasks = [
+                    (manifest, shard_view.version, self.shard_settings, lemma_query)
+                    + (n_results, phrases, statistics, doc_freqs)
+                    for manifest, shard_view in zip(view.manifests, view.views)
+                ]
+                results = list(self.shard_pool.map(search_shard, *zip(*tasks)))
+        ranked = [
+            (doc_id * view.n_shards + shard, score)
+            for shard, shard_ranked in enumerate(results)
+            for doc_id, score in shard_ranked
+        ]
+        # Same order as Scorer.top: decreasing score, ties by increasing doc id
+        ranked.sort(key=lambda pair: (-pair[1], pair[0]))
+        return ranked[:n_results]
+
+    def to_pages(self, ranked, view=None):
+        """
+        This function returns the webpages of ranked documents.
 
-        # Load the webpages
-        with open(self.pages_file, "r", encoding="utf-8") as f:
-            pages = json.load(f)
+        :param list ranked: the (doc_id, score) pairs.
+        :param IndexView view: the segmented or sharded index, or None to use the
+            index-file of the fields.
+        :return: the webpages.
 
-        # Return the ranked webpages
-        return [pages[int(doc_id)] for doc_id, _ in sorted_scores]
+        """
+        with STAGE_SECONDS.time(stage="docs"):
+            if view is not None and view.has_stores:
+                pages = (view.document(doc_id) for doc_id, _ in ranked)
+                return [page for page in pages if page is not None]
+
+            if self.pages is None:
+                self.pages = ReloadableFile(
+                    self.pages_file,
+                    loader=load_pages_by_url,
+                    check_interval=self.reload_interval,
+                )
+            pages = self.pages.get()
+            if view is None:
+                return [pages[doc_id] for doc_id, _ in ranked]
+            urls = (view.doc_urls.get(doc_id) for doc_id, _ in ranked)
+            return [pages[url] for url in urls if url in pages]
+
+    def boost_proximity(self, lemma_query, ranked, segments):
+        """
+        This function reranks webpages by adding a boost to the webpages where consecutive
+        terms of the query are close to each other.
 
+        :param list lemma_query: the lemmatized and stemmed query.
+        :param list ranked: the (doc_id, score) pairs of the webpages.
+        :param list segments: the segments returned by the segments function.
+        :return: the reranked (doc_id, score) pairs.
 
-    @staticmethod
-    def retrieve_top_pages(n_pages, query, index):
         """
-        This function retrieves the top pages based on the BM25 score.
+        pairs = [(a, b) for a, b in zip(lemma_query, lemma_query[1:]) if a != b]
+        if not ranked or not pairs:
+            return ranked
+        doc_ids = np.array(sorted(doc_id for doc_id, _ in ranked))
+        boosts = np.zeros(len(doc_ids))
+        for indexes, deleted in segments:
+            for field in self.fields:
+                index = indexes[field]
+                if not index.positional:
+                    continue
+                for first, second in pairs:
+                    ids, distances = min_distances(
+                        index.positions_array(first, doc_ids),
+                        index.positions_array(second, doc_ids),
+                    )
+                    live = ~np.isin(ids, deleted)
+                    boosts[np.searchsorted(doc_ids, ids[live])] += (
+                        self.fields[field]["weight"] / distances[live]
+                    )
+
+        scores = dict(ranked)
+        scores = np.array([scores[doc_id] for doc_id in doc_ids.tolist()])
+        return self.scorer.top(doc_ids, scores + self.proximity * boosts)
+
+    def segments(self, view=None):
+        """
+        This function lists the segments to query.
 
-        :param int n_pages: the number of pages to retrieve.
-        :param list query: the query to rank the webpages.
-        :param dict index: the inverted index.
-        :return: the top pages.
+        :param IndexView view: the segmented index, or None to use the index-file of the fields.
+        :return: a list of ({field: index}, deleted doc ids array) pairs.
 
         """
+        if view is None:
+            indexes = {field: self.indexes[field].get() for field in self.fields}
+            return [(indexes, np.zeros(0, dtype=np.int64))]
+        return view.segments
 
-        def bm25_score(query, token_index, page_id, avg_doc_length, k1=1.5, b=0.75):
-            """
-            This function computes the BM25 score.
-
-            :param list query: the query to rank the webpages.
-            :param dict token_index: the inverted index.
-            :param str page_id: the page id.
-            :param float avg_doc_length: the average document length.
-            :param float k1: the k1 parameter.
-            :param float b: the b parameter.
-            :return: the BM25 score.
+    def statistics(self, view, segments):
+        """
+        This function returns the collection statistics used by the BM25 scoring.
 
-            """
-            score = 0
-            for token in query:
-                if token in token_index and page_id in token_index[token]:
-                    f = len(token_index[token][page_id])
-                    idf = math.log((len(token_index) - f + 0.5) / (f + 0.5) + 1)
-                    tf = f * (k1 + 1) / (f + k1 * (1 - b + b * len(token_index[token][page_id]) / avg_doc_length))
-                    score += idf * tf
-            return score
+        :param IndexView view: the segmented index, or None to use the index-file of the fields.
+        :param list segments: the segments returned by the segments function.
+        :return: the number of documents and the average number of tokens of each field.
 
-        avg_doc_length = sum(len(doc) for doc in index.values()) / len(index)
-        scores = {}
-        for page_id in index.values():
-            scores[page_id] = bm25_score(query, index, page_id, avg_doc_length)
-        top_pages = sorted(scores.keys(), key=lambda x: scores[x], reverse=True)[:n_pages]
-        return top_pages
\ No newline at end of file
+        """
+        if view is not None:
+            return view.n_indexed_docs, view.indexed_avg_lengths
+
+        # The legacy indexes hold every document, compute their statistics once per load
+        indexes = segments[0][0]
+        key = [indexes[field] for field in self.fields]
+        cached = self._statistics[0]
+        if cached is None or any(a is not b for a, b in zip(cached, key)):
+            n_docs = max(index.n_docs for index in indexes.values())
+            avg_lengths = {
+                field: sum(index.doc_lengths) / n_docs if n_docs else 0
+                for field, index in indexes.items()
+            }
+            self._statistics = (key, (n_docs, avg_lengths))
+        return self._statistics[1]
@@ -0,0 +1,175 @@
+import asyncio
+import time
+import httpx
+import requests
+from threading import Lock
+from urllib import robotparser, parse
+
+
+class RobotsEntry:
+    """
+    Parsed robots.txt of a host.
+    """
+
+    def __init__(self, robots_url, parser, expires):
+        """
+        Initializes the RobotsEntry.
+
+        :param str robots_url: the URL of the robots.txt file.
+        :param robotparser.RobotFileParser parser: the parsed rules.
+        :param float expires: the time after which the entry must be fetched again.
+
+        """
+        self.robots_url = robots_url
+        self.parser = parser
+        self.expires = expires
+        self.sitemaps = parser.site_maps() or []
+        self.crawl_delay = parser.crawl_delay("*")
+
+    def can_fetch(self, url, user_agent="*"):
+        """
+        Checks if a URL can be crawled.
+
+        :param str url: the URL to check.
+        :param str user_agent: the user agent of the crawler.
+        :return: True if the URL can be crawled.
+
+        """
+        return self.parser.can_fetch(user_agent, url)
+
+
+class RobotsCache:
+    """
+    Cache of the robots.txt files keyed by host. Each file is fetched once per TTL, and
+    concurrent lookups of the same host wait for a single download.
+    """
+
+    def __init__(self, ttl=3600, error_ttl=60):
+        """
+        Initializes the RobotsCache.
+
+        :param float ttl: the number of seconds a robots.txt file is kept.
+        :param float error_ttl: the number of seconds a server error is kept.
+
+        """
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.entries = {}  # {robots_url: RobotsEntry}
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+        self.host_locks = {}  # {robots_url: Lock}
+        self.async_host_locks = {}  # {robots_url: asyncio.Lock}
+
+    @staticmethod
+    def robots_url(url):
+        """
+        Returns the URL of the robots.txt file that applies to a URL.
+
+        :param str url: the URL.
+        :return: the URL of the robots.txt file.
+
+        """
+        return parse.urljoin(url, "/robots.txt")
+
+    def lookup(self, url):
+        """
+        Returns the cached robots.txt of the host of a URL if it has not expired.
+
+        :param str url: the URL.
+        :return: the RobotsEntry, or None if it must be fetched.
+
+        """
+        entry = self.entries.get(self.robots_url(url))
+        if entry is not None and entry.expires > time.monotonic():
+            with self.lock:
+                self.hits += 1
+            return entry
+        return None
+
+    def store(self, robots_url, status_code, text):
+        """
+        Parses a downloaded robots.txt file and caches it.
+
+        :param str robots_url: the URL of the robots.txt file.
+        :param int status_code: the HTTP status of the download, or None if it failed.
+        :param str text: the content of the file.
+        :return: the RobotsEntry.
+
+        """
+        rp = robotparser.RobotFileParser(robots_url)
+        ttl = self.ttl
+        if status_code in (401, 403):
+            rp.disallow_all = True
+        elif status_code is not None and 400 <= status_code < 500:
+            rp.allow_all = True
+        elif status_code is None:
+            # The host could not be reached, the file is downloaded again next time
+            rp.allow_all = True
+            ttl = 0
+        elif status_code >= 500:
+            rp.disallow_all = True
+            ttl = self.error_ttl
+        else:
+            rp.parse(text.splitlines())
+
+        entry = RobotsEntry(robots_url, rp, time.monotonic() + ttl)
+        with self.lock:
+            self.misses += 1
+            self.entries[robots_url] = entry
+        return entry
+
+    def get(self, url):
+        """
+        Returns the robots.txt of the host of a URL, downloading it with requests if needed.
+
+        :param str url: the URL.
+        :return: the RobotsEntry.
+
+        """
+        entry = self.lookup(url)
+        if entry is not None:
+            return entry
+
+        robots_url = self.robots_url(url)
+        with self.lock:
+            host_lock = self.host_locks.setdefault(robots_url, Lock())
+        with host_lock:
+            # Another thread may have downloaded the file in the meantime
+            entry = self.lookup(url)
+            if entry is not None:
+                return entry
+            try:
+                response = requests.get(robots_url, timeout=10)
+                return self.store(robots_url, response.status_code, response.text)
+            except requests.RequestException as e:
+                print(f"Could not download {robots_url}: {e}")
+                return self.store(robots_url, None, "")
+
+    async def aget(self, client, url):
+        """
+        Returns the robots.txt of the host of a URL, downloading it with an asynchronous
+        HTTP client if needed.
+
+        :param httpx.AsyncClient client: the HTTP client.
+        :param str url: the URL.
+        :return: the RobotsEntry.
+
+        """
+        entry = self.lookup(url)
+        if entry is not None:
+            return entry
+
+        robots_url = self.robots_url(url)
+        host_lock = self.async_host_locks.setdefault(robots_url, asyncio.Lock())
+        async with host_lock:
+            # Another worker may have downloaded the file in the meantime
+            entry = self.lookup(url)
+            if entry is not None:
+                return entry
+            try:
+                response = await client.get(robots_url)
+                return self.store(robots_url, response.status_code, response.text)
+            except httpx.HTTPError as e:
+                print(f"Could not download {robots_url}: {e}")
+                return self.store(robots_url, None, "")
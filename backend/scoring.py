@@ -0,0 +1,347 @@
+import numpy as np
+from collections import Counter
+from utils import metrics
+
+SCORING_METHODS = ("frequency", "bm25", "bm25f")
+# Shared with the Ranker, the postings are decoded while scoring
+STAGE_SECONDS = metrics.registry.histogram(
+    "noodle_ranker_stage_seconds", "Seconds spent in each stage of a search."
+)
+
+
+def bm25_idf(n_docs, doc_freq):
+    """
+    This function computes the BM25 inverse document frequency, which is always positive.
+
+    :param int n_docs: the number of documents of the collection.
+    :param doc_freq: the number of documents containing the term, or an array of them.
+    :return: the inverse document frequency.
+
+    """
+    doc_freq = np.minimum(doc_freq, n_docs)
+    return np.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+def scatter_add(contributions):
+    """
+    This function sums the contributions of each document. Few documents are summed after
+    sorting their ids, many are summed in a dense array indexed by doc id.
+
+    :param list contributions: (doc_ids, values) array pairs, the doc ids of a pair being
+        unique.
+    :return: the sorted unique doc ids and the sum of their values.
+
+    """
+    contributions = [(ids, values) for ids, values in contributions if len(ids)]
+    if not contributions:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    if len(contributions) == 1:
+        ids, values = contributions[0]
+        if np.any(ids[1:] < ids[:-1]):
+            order = np.argsort(ids, kind="stable")
+            ids, values = ids[order], values[order]
+        return ids, values.astype(float)
+
+    n_values = sum(len(ids) for ids, _ in contributions)
+    size = max(int(ids.max()) for ids, _ in contributions) + 1
+    if n_values * 16 < size:
+        doc_ids = np.concatenate([ids for ids, _ in contributions])
+        values = np.concatenate([values for _, values in contributions])
+        unique_ids, inverse = np.unique(doc_ids, return_inverse=True)
+        return unique_ids, np.bincount(inverse, weights=values)
+
+    sums = np.zeros(size)
+    seen = np.zeros(size, dtype=bool)
+    for ids, values in contributions:
+        sums[ids] += values
+        seen[ids] = True
+    unique_ids = np.flatnonzero(seen)
+    return unique_ids, sums[unique_ids]
+
+
+class Scorer:
+    """
+    Vectorized scoring engine. The postings of each query term are decoded into NumPy
+    arrays, and the scores are accumulated with a scatter-add over all the fields.
+
+    - frequency: sum of the term frequencies, multiplied by the weight of the field
+    - bm25: sum over the fields of the weighted BM25 score of each field
+    - bm25f: BM25 over the weighted and length-normalized term frequencies of the fields
+    """
+
+    def __init__(self, fields, method="bm25f", k1=1.2, b=0.75):
+        """
+        Initializes the Scorer.
+
+        :param dict fields: the fields to score, {field: {"weight": weight}}. A field may
+            also set its own "b".
+        :param str method: the scoring method, "frequency", "bm25" or "bm25f".
+        :param float k1: the saturation of the term frequencies.
+        :param float b: the strength of the document length normalization.
+
+        """
+        if method not in SCORING_METHODS:
+            raise ValueError(
+                f"Unknown scoring method {method}, expected one of {SCORING_METHODS}."
+            )
+        self.fields = fields
+        self.method = method
+        self.k1 = k1
+        self.b = b
+
+    def field_postings(self, term, field, segments, among=None):
+        """
+        This function gathers the live postings of a term in a field across segments.
+
+        :param str term: the term.
+        :param str field: the field.
+        :param list segments: the ({field: index}, deleted doc ids array) pairs to search.
+        :param numpy.ndarray among: the sorted ids of the only documents to return, or None
+            to return every document containing the term.
+        :return: the doc ids, sorted, the term frequencies and the document lengths, as
+            arrays.
+
+        """
+        doc_ids, tfs, lengths = [], [], []
+        with STAGE_SECONDS.time(stage="postings"):
+            for indexes, deleted in segments:
+                index = indexes[field]
+                if among is None:
+                    ids, frequencies = index.postings_array(term)
+                else:
+                    ids, frequencies = index.postings_among(term, among)
+                if len(deleted) and len(ids):
+                    live = ~np.isin(ids, deleted)
+                    ids, frequencies = ids[live], frequencies[live]
+                doc_ids.append(ids)
+                tfs.append(frequencies)
+                if self.method != "frequency":
+                    lengths.append(index.lengths_of(ids))
+        if not doc_ids:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        doc_ids, tfs = np.concatenate(doc_ids), np.concatenate(tfs)
+        lengths = np.concatenate(lengths) if lengths else None
+        if len(segments) > 1:
+            # A modified document keeps its doc id in a newer segment, and merged
+            # segments take the place of the oldest one, so the ids are sorted again
+            order = np.argsort(doc_ids, kind="stable")
+            doc_ids, tfs = doc_ids[order], tfs[order]
+            if lengths is not None:
+                lengths = lengths[order]
+        return doc_ids, tfs, lengths
+
+    def doc_freqs(self, terms, segments):
+        """
+        This function counts the documents containing each term in each field. Deleted
+        documents still count in the statistics until they are merged.
+
+        :param list terms: the normalized terms of the query.
+        :param list segments: the ({field: index}, deleted doc ids array) pairs to search.
+        :return: a {term: {field: document frequency}} dictionary.
+
+        """
+        return {
+            term: {
+                field: sum(s[0][field].doc_freq(term) for s in segments)
+                for field in self.fields
+            }
+            for term in set(terms)
+        }
+
+    def units(self, terms, segments, n_docs, avg_lengths, doc_freqs=None):
+        """
+        This function splits a query into scoring units, whose scores add up to the score
+        of a document: a term in a field for frequency and bm25, a term in every field for
+        bm25f. Each unit gets an upper bound of its score in any document, computed from
+        the maximum term frequency of the term and the shortest document of each segment.
+
+        :param list terms: the normalized terms of the query.
+        :param list segments: the ({field: index}, deleted doc ids array) pairs to search.
+        :param int n_docs: the number of documents of the segments, deleted ones included.
+        :param dict avg_lengths: the average number of tokens of each field over the
+            documents of the segments.
+        :param dict doc_freqs: the document frequencies of the terms over a larger
+            collection than the segments, e.g. every shard of a sharded index, as returned
+            by the doc_freqs function. Defaults to the ones of the segments.
+        :return: a list of (term, count, fields, idf, upper bound) tuples.
+
+        """
+        local_freqs = self.doc_freqs(terms, segments)
+        units = []
+        # A term repeated in the query counts as many times
+        for term, count in Counter(terms).items():
+            field_freqs, bounds = {}, {}
+            for field, config in self.fields.items():
+                if not local_freqs[term][field]:
+                    continue
+                field_freqs[field] = (doc_freqs or local_freqs)[term][field]
+                b = config.get("b", self.b)
+                avg_length = avg_lengths.get(field) or 1
+                bound = 0
+                for indexes, _ in segments:
+                    index = indexes[field]
+                    max_tf = index.max_tf(term)
+                    if self.method == "frequency":
+                        bound = max(bound, config["weight"] * max_tf)
+                        continue
+                    norm = 1 - b + b * index.min_length() / avg_length
+                    if self.method == "bm25":
+                        norm = self.k1 * norm
+                        bound = max(bound, config["weight"] * max_tf / (max_tf + norm))
+                    else:
+                        bound = max(bound, config["weight"] * max_tf / norm)
+                bounds[field] = bound
+
+            if self.method == "bm25f":
+                if bounds:
+                    # Like Lucene's CombinedFieldQuery, the document frequency of a term
+                    # is its highest document frequency in a field, over every field so that
+                    # a shard lacking the term in a field agrees with the whole index
+                    idf = bm25_idf(
+                        n_docs, max((doc_freqs or local_freqs)[term].values())
+                    )
+                    tf = sum(bounds.values())
+                    bound = count * idf * tf * (self.k1 + 1) / (tf + self.k1)
+                    units.append((term, count, list(bounds), idf, bound))
+                continue
+            for field, bound in bounds.items():
+                idf = bm25_idf(n_docs, field_freqs[field])
+                if self.method == "bm25":
+                    bound *= idf * (self.k1 + 1)
+                units.append((term, count, [field], idf, count * bound))
+        return units
+
+    def unit_scores(self, unit, segments, avg_lengths, among=None):
+        """
+        This function scores the documents containing the term of a scoring unit.
+
+        :param tuple unit: the scoring unit, see units.
+        :param list segments: the ({field: index}, deleted doc ids array) pairs to search.
+        :param dict avg_lengths: the average number of tokens of each field over the
+            documents of the segments.
+        :param numpy.ndarray among: the sorted ids of the only documents to score, or None
+            to score every document containing the term.
+        :return: the doc ids and their scores, as arrays.
+
+        """
+        term, count, fields, idf, _ = unit
+        contributions = []
+        for field in fields:
+            config = self.fields[field]
+            ids, tfs, lengths = self.field_postings(term, field, segments, among)
+            if not len(ids):
+                continue
+            if self.method == "frequency":
+                values = config["weight"] * count * tfs
+            else:
+                b = config.get("b", self.b)
+                avg_length = avg_lengths.get(field) or 1
+                norm = 1 - b + b * lengths / avg_length
+                if self.method == "bm25":
+                    weight = config["weight"] * count * idf
+                    values = weight * tfs * (self.k1 + 1) / (tfs + self.k1 * norm)
+                else:
+                    values = config["weight"] * tfs / norm
+            contributions.append((ids, values))
+
+        ids, values = scatter_add(contributions)
+        if self.method == "bm25f":
+            # Saturate the combined term frequency of each document
+            values = count * idf * values * (self.k1 + 1) / (values + self.k1)
+        return ids, values
+
+    def score(self, terms, segments, n_docs, avg_lengths, among=None, doc_freqs=None):
+        """
+        This function scores every document containing at least one term of the query.
+
+        :param list terms: the normalized terms of the query.
+        :param list segments: the ({field: index}, deleted doc ids array) pairs to search.
+        :param int n_docs: the number of documents of the segments, deleted ones included.
+        :param dict avg_lengths: the average number of tokens of each field over the
+            documents of the segments.
+        :param numpy.ndarray among: the sorted ids of the only documents to score, or None
+            to score every document containing a term.
+        :param dict doc_freqs: the document frequencies of the terms, see units.
+        :return: the doc ids and their scores, as arrays.
+
+        """
+        units = self.units(terms, segments, n_docs, avg_lengths, doc_freqs)
+        return scatter_add(
+            [self.unit_scores(unit, segments, avg_lengths, among) for unit in units]
+        )
+
+    def top_k(
+        self,
+        terms,
+        segments,
+        n_docs,
+        avg_lengths,
+        n_results,
+        among=None,
+        doc_freqs=None,
+    ):
+        """
+        This function returns the best documents for a query with the MaxScore dynamic
+        pruning, giving the same results as sorting the output of score.
+
+        The units are scored by decreasing upper bound. Once the sum of the upper bounds of
+        the remaining units is below the n_results-th best partial score, no other
+        document can enter the results: the remaining units only complete the scores of
+        the candidates that can still make it, decoding only the blocks of postings that
+        contain them. Common terms, whose bounds are low, are thus barely decoded.
+
+        :param list terms: the normalized terms of the query.
+        :param list segments: the ({field: index}, deleted doc ids array) pairs to search.
+        :param int n_docs: the number of documents of the segments, deleted ones included.
+        :param dict avg_lengths: the average number of tokens of each field over the
+            documents of the segments.
+        :param int n_results: the number of documents to return.
+        :param numpy.ndarray among: the sorted ids of the only documents to score, e.g. the
+            ones matching the phrases of the query, or None to score every document.
+        :param dict doc_freqs: the document frequencies of the terms, see units.
+        :return: a list of (doc_id, score) pairs sorted by decreasing score.
+
+        """
+        units = self.units(terms, segments, n_docs, avg_lengths, doc_freqs)
+        # Leave room for the rounding errors of the bounds
+        units.sort(key=lambda unit: unit[4], reverse=True)
+        remaining = sum(unit[4] for unit in units) * (1 + 1e-9)
+
+        doc_ids, scores = np.zeros(0, dtype=np.int64), np.zeros(0)
+        threshold = 0
+        for unit in units:
+            if len(scores) >= n_results > 0 and remaining < threshold:
+                # Drop the candidates that cannot reach the results anymore
+                keep = scores + remaining >= threshold
+                doc_ids, scores = doc_ids[keep], scores[keep]
+                ids, values = self.unit_scores(unit, segments, avg_lengths, doc_ids)
+                scores[np.searchsorted(doc_ids, ids)] += values
+            else:
+                ids, values = self.unit_scores(unit, segments, avg_lengths, among)
+                doc_ids, scores = scatter_add([(doc_ids, scores), (ids, values)])
+            remaining -= unit[4] * (1 + 1e-9)
+            if len(scores) >= n_results > 0:
+                threshold = np.partition(scores, len(scores) - n_results)[-n_results]
+        return self.top(doc_ids, scores, n_results)
+
+    @staticmethod
+    def top(doc_ids, scores, n_results=None):
+        """
+        This function sorts the documents by decreasing score, ties by increasing doc id.
+
+        :param numpy.ndarray doc_ids: the doc ids.
+        :param numpy.ndarray scores: their scores.
+        :param int n_results: the number of documents to keep, or None to keep them all.
+        :return: a list of (doc_id, score) pairs.
+
+        """
+        if n_results is not None and len(scores) > n_results:
+            if n_results <= 0:
+                return []
+            # Only sort the documents scoring at least the n-th best score, ties included
+            threshold = np.partition(scores, len(scores) - n_results)[-n_results]
+            selected = np.flatnonzero(scores >= threshold)
+            doc_ids, scores = doc_ids[selected], scores[selected]
+        order = np.lexsort((doc_ids, -scores))[:n_results]
+        return list(zip(doc_ids[order].tolist(), scores[order].tolist()))
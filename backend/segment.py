@@ -0,0 +1,901 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import numpy as np
+from array import array
+
+# Segment layout (little-endian):
+#   header   | magic, version, flags, n_docs, n_terms, entries_pos, terms_pos, doc_lengths_pos,
+#            | doc_ids_pos
+#   postings | for each term: a skip table with the last doc id, byte length and maximum term
+#            | frequency of each block of BLOCK_SIZE postings, the blocks (doc id deltas then
+#            | term frequencies), then the position deltas of each doc, all encoded as varints
+#   terms    | the UTF-8 encoded terms, concatenated in sorted order
+#   entries  | for each term (plus a sentinel): offset in terms, postings offset, document frequency
+#   doc ids  | the sorted ids of the documents as uint32, only if they are not 0 to n_docs - 1
+#   lengths  | the number of tokens of each document as uint32
+MAGIC = b"NOODLSEG"
+VERSION = 3
+FLAG_POSITIONAL = 1
+FLAG_SPARSE = 2
+HEADER = struct.Struct("<8sIIIIQQQQ")
+ENTRY = struct.Struct("<IQI")
+BLOCK_SIZE = 128
+SKIP = struct.Struct("<III")
+SKIP_DTYPE = np.dtype([("last_doc_id", "<u4"), ("length", "<u4"), ("max_tf", "<u4")])
+
+
+def encode_varints(values, out):
+    """
+    This function appends integers to a buffer using a variable-length encoding.
+
+    :param iterable values: the non-negative integers to encode.
+    :param bytearray out: the buffer to append to.
+
+    """
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+
+def decode_varints(buf, pos, count):
+    """
+    This function decodes integers encoded with encode_varints.
+
+    :param buf: the buffer to decode from.
+    :param int pos: the offset of the first integer in the buffer.
+    :param int count: the number of integers to decode.
+    :return: the decoded integers and the offset following the last one.
+
+    """
+    values = []
+    for _ in range(count):
+        result = shift = 0
+        while True:
+            byte = buf[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        values.append(result)
+    return values, pos
+
+
+def decode_varints_array(buf, count, indices=None):
+    """
+    This function decodes integers encoded with encode_varints into a NumPy array, without
+    a Python loop over the bytes.
+
+    :param bytes buf: the buffer starting with the integers to decode.
+    :param int count: the number of integers to decode.
+    :param numpy.ndarray indices: the ranks of the only integers to return among the count
+        first ones, or None to return them all. Only their bytes are decoded.
+    :return: a uint64 array of the decoded integers.
+
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)[:count]  # Last byte of each integer
+    if len(ends) < count:
+        raise ValueError("The buffer is too short.")
+    if not count or ends[-1] == count - 1:
+        # Every integer fits in a single byte
+        values = data[:count] if indices is None else data[indices]
+        return values.astype(np.uint64)
+    starts = np.empty(count, dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    if indices is not None:
+        starts, ends = starts[indices], ends[indices]
+    # Add the 7 bits of the k-th byte of the integers that have one
+    values = (data[starts] & 0x7F).astype(np.uint64)
+    longer = np.flatnonzero(ends > starts)
+    shift = 7
+    while len(longer):
+        chunks = (data[starts[longer] + shift // 7] & 0x7F).astype(np.uint64)
+        values[longer] |= chunks << np.uint64(shift)
+        longer = longer[ends[longer] > starts[longer] + shift // 7]
+        shift += 7
+    return values
+
+
+def split_blocks(values, counts):
+    """
+    This function separates the doc id gaps from the term frequencies of decoded blocks.
+
+    :param numpy.ndarray values: the decoded integers of consecutive blocks, each made of
+        count gaps followed by count term frequencies.
+    :param numpy.ndarray counts: the number of postings of each block.
+    :return: the gaps and the term frequencies.
+
+    """
+    block_starts = 2 * (np.cumsum(counts) - counts)
+    ranks = np.arange(len(values)) - np.repeat(block_starts, 2 * counts)
+    is_gap = ranks < np.repeat(counts, 2 * counts)
+    return values[is_gap], values[~is_gap]
+
+
+def delta_encode(values):
+    """
+    This function converts a sorted list of integers to the gaps between them.
+
+    :param list values: the sorted integers.
+    :return: the gaps, the first value being kept as is.
+
+    """
+    return [value - previous for previous, value in zip([0] + values, values)]
+
+
+def delta_decode(gaps):
+    """
+    This function converts gaps back to the integers they were computed from.
+
+    :param list gaps: the gaps produced by delta_encode.
+    :return: the sorted integers.
+
+    """
+    values = []
+    total = 0
+    for gap in gaps:
+        total += gap
+        values.append(total)
+    return values
+
+
+class SegmentWriter:
+    """
+    Writes an inverted index to a binary segment. Terms must be added in sorted order.
+    """
+
+    def __init__(self, path, positional=True):
+        """
+        This function initializes the SegmentWriter class and opens the output file.
+
+        :param str path: the path to the segment to write.
+        :param bool positional: whether the segment stores the positions of the terms.
+
+        """
+        self.path = path
+        self.positional = positional
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(b"\0" * HEADER.size)
+        self._entries = []  # [(term_offset, postings_offset, doc_freq), ...]
+        self._terms = bytearray()
+        self._last_term = None
+
+    def add(self, term, postings):
+        """
+        This function writes the postings of a term.
+
+        :param str term: the term, greater than every term added before.
+        :param list postings: the (doc_id, positions) pairs of the term sorted by doc id. For a
+            non-positional segment, positions may be replaced by the term frequency.
+
+        """
+        if self._last_term is not None and term <= self._last_term:
+            raise ValueError(f"Terms must be added in sorted order, got {term!r}.")
+        self._last_term = term
+
+        doc_ids = [doc_id for doc_id, _ in postings]
+        if self.positional:
+            tfs = [len(positions) for _, positions in postings]
+        else:
+            tfs = [
+                positions if isinstance(positions, int) else len(positions)
+                for _, positions in postings
+            ]
+
+        # Blocks of postings can be skipped or decoded on their own
+        skips = bytearray()
+        blocks = bytearray()
+        gaps = delta_encode(doc_ids)
+        for start in range(0, len(doc_ids), BLOCK_SIZE):
+            end = start + BLOCK_SIZE
+            length = len(blocks)
+            encode_varints(gaps[start:end], blocks)
+            encode_varints(tfs[start:end], blocks)
+            skips += SKIP.pack(
+                doc_ids[end - 1 if end <= len(doc_ids) else -1],
+                len(blocks) - length,
+                max(tfs[start:end]),
+            )
+        block = skips + blocks
+        if self.positional:
+            for _, positions in postings:
+                encode_varints(delta_encode(positions), block)
+
+        self._entries.append((len(self._terms), self._file.tell(), len(doc_ids)))
+        self._terms += term.encode("utf-8")
+        self._file.write(block)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self, doc_lengths, doc_ids=None):
+        """
+        This function writes the term dictionary and the document lengths, then moves the
+        segment to its final path.
+
+        :param list doc_lengths: the number of tokens of each document.
+        :param list doc_ids: the sorted ids of the documents matching doc_lengths, if they
+            are not 0 to len(doc_lengths) - 1.
+
+        """
+        terms_pos = self._file.tell()
+        self._file.write(self._terms)
+
+        entries_pos = terms_pos + len(self._terms)
+        entries = bytearray()
+        for term_offset, postings_offset, doc_freq in self._entries:
+            entries += ENTRY.pack(term_offset, postings_offset, doc_freq)
+        entries += ENTRY.pack(len(self._terms), terms_pos, 0)  # Sentinel
+        self._file.write(entries)
+
+        # Align the tables so that they can be viewed as uint32 in place
+        tables_pos = entries_pos + len(entries)
+        padding = -tables_pos % 4
+        self._file.write(b"\0" * padding)
+        tables_pos += padding
+        doc_ids_pos = 0
+        if doc_ids is not None:
+            doc_ids_pos = tables_pos
+            self._write_uint32(doc_ids)
+        doc_lengths_pos = self._file.tell()
+        self._write_uint32(doc_lengths)
+
+        flags = FLAG_POSITIONAL if self.positional else 0
+        if doc_ids is not None:
+            flags |= FLAG_SPARSE
+        self._file.seek(0)
+        self._file.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                flags,
+                len(doc_lengths),
+                len(self._entries),
+                entries_pos,
+                terms_pos,
+                doc_lengths_pos,
+                doc_ids_pos,
+            )
+        )
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def _write_uint32(self, values):
+        """
+        This function writes integers as little-endian uint32.
+
+        :param list values: the integers to write.
+
+        """
+        values = array("I", values)
+        if sys.byteorder == "big":
+            values.byteswap()
+        self._file.write(values.tobytes())
+
+
+def write_segment(path, index, doc_lengths, positional=True):
+    """
+    This function writes an index built by Indexer.create_index to a binary segment.
+
+    :param str path: the path to the segment to write.
+    :param dict index: the index, {term: {doc_id: [positions]}} if positional and
+        {term: [doc_id, ...]} otherwise.
+    :param list doc_lengths: the number of tokens of each document.
+    :param bool positional: whether the index is positional.
+
+    """
+    writer = SegmentWriter(path, positional)
+    for term in sorted(index):
+        if positional:
+            postings = sorted((int(doc_id), p) for doc_id, p in index[term].items())
+        else:
+            tfs = {}
+            for doc_id in index[term]:
+                tfs[int(doc_id)] = tfs.get(int(doc_id), 0) + 1
+            postings = sorted(tfs.items())
+        writer.add(term, postings)
+    writer.close(doc_lengths)
+
+
+class Segment:
+    """
+    Read-only view of a binary segment. The file is memory-mapped and only the postings
+    of the terms that are looked up get decoded.
+    """
+
+    def __init__(self, path):
+        """
+        This function initializes the Segment class and maps the file in memory.
+
+        :param str path: the path to the segment.
+
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            version,
+            flags,
+            self.n_docs,
+            self.n_terms,
+            self._entries_pos,
+            self._terms_pos,
+            doc_lengths_pos,
+            doc_ids_pos,
+        ) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a Noodle segment of version {VERSION}.")
+        self.positional = bool(flags & FLAG_POSITIONAL)
+
+        self._views = []
+        self.doc_lengths = self._uint32_table(doc_lengths_pos)
+        if flags & FLAG_SPARSE:
+            self.doc_ids = self._uint32_table(doc_ids_pos)
+        else:
+            self.doc_ids = range(self.n_docs)
+        self._arrays = None  # NumPy copies of the doc ids and lengths, see lengths_of
+
+    def _uint32_table(self, pos):
+        """
+        This function views a table of n_docs uint32 of the segment.
+
+        :param int pos: the offset of the table.
+        :return: a sequence of integers, backed by the mapped file on little-endian machines.
+
+        """
+        view = memoryview(self._mm)[pos : pos + 4 * self.n_docs]
+        if sys.byteorder == "big":
+            table = array("I", view.tobytes())
+            table.byteswap()
+            view.release()
+            return table
+        table = view.cast("I")
+        self._views += [table, view]
+        return table
+
+    def doc_length(self, doc_id):
+        """
+        This function returns the number of tokens of a document of the segment.
+
+        :param int doc_id: the id of the document.
+        :return: the number of tokens, or 0 if the document is not in the segment.
+
+        """
+        i = bisect.bisect_left(self.doc_ids, doc_id)
+        if i < self.n_docs and self.doc_ids[i] == doc_id:
+            return self.doc_lengths[i]
+        return 0
+
+    def _entry(self, i):
+        """
+        This function reads the i-th entry of the term dictionary.
+
+        :param int i: the rank of the term.
+        :return: the term offset, the postings offset and the document frequency.
+
+        """
+        return ENTRY.unpack_from(self._mm, self._entries_pos + i * ENTRY.size)
+
+    def _term(self, i):
+        """
+        This function reads the i-th term of the term dictionary.
+
+        :param int i: the rank of the term.
+        :return: the UTF-8 encoded term.
+
+        """
+        start = self._terms_pos + self._entry(i)[0]
+        end = self._terms_pos + self._entry(i + 1)[0]
+        return self._mm[start:end]
+
+    def _find(self, term):
+        """
+        This function finds the rank of a term with a binary search.
+
+        :param str term: the term to find.
+        :return: the rank of the term, or None if the term is not in the segment.
+
+        """
+        key = term.encode("utf-8")
+        low, high = 0, self.n_terms
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.n_terms and self._term(low) == key:
+            return low
+        return None
+
+    def __contains__(self, term):
+        return self._find(term) is not None
+
+    def __len__(self):
+        return self.n_terms
+
+    def terms(self):
+        """
+        This function iterates over the terms of the segment in sorted order.
+
+        :return: an iterator over the terms.
+
+        """
+        for i in range(self.n_terms):
+            yield self._term(i).decode("utf-8")
+
+    def doc_freq(self, term):
+        """
+        This function returns the number of documents containing a term.
+
+        :param str term: the term.
+        :return: the document frequency.
+
+        """
+        i = self._find(term)
+        return 0 if i is None else self._entry(i)[2]
+
+    def _skips(self, i):
+        """
+        This function reads the skip table of the i-th term.
+
+        :param int i: the rank of the term.
+        :return: the skip table as a structured array, the offset of the first block and
+            the document frequency.
+
+        """
+        _, offset, doc_freq = self._entry(i)
+        n_blocks = -(-doc_freq // BLOCK_SIZE)
+        skips = np.frombuffer(
+            self._mm[offset : offset + SKIP.size * n_blocks], dtype=SKIP_DTYPE
+        )
+        return skips, offset + SKIP.size * n_blocks, doc_freq
+
+    def _decode(self, i, with_positions):
+        """
+        This function decodes the postings of the i-th term.
+
+        :param int i: the rank of the term.
+        :param bool with_positions: whether to decode the positions.
+        :return: the doc ids, the term frequencies and the positions (or None).
+
+        """
+        skips, offset, doc_freq = self._skips(i)
+        gaps, tfs = [], []
+        for start in range(0, doc_freq, BLOCK_SIZE):
+            count = min(BLOCK_SIZE, doc_freq - start)
+            block_gaps, offset = decode_varints(self._mm, offset, count)
+            block_tfs, offset = decode_varints(self._mm, offset, count)
+            gaps += block_gaps
+            tfs += block_tfs
+        positions = None
+        if with_positions and self.positional:
+            positions = []
+            for tf in tfs:
+                gaps_positions, offset = decode_varints(self._mm, offset, tf)
+                positions.append(delta_decode(gaps_positions))
+        return delta_decode(gaps), tfs, positions
+
+    def postings(self, term):
+        """
+        This function returns the documents containing a term and the term frequencies.
+
+        :param str term: the term.
+        :return: the sorted doc ids and the matching term frequencies.
+
+        """
+        i = self._find(term)
+        if i is None:
+            return [], []
+        doc_ids, tfs, _ = self._decode(i, with_positions=False)
+        return doc_ids, tfs
+
+    def postings_array(self, term):
+        """
+        This function decodes the documents containing a term and the term frequencies into
+        NumPy arrays, skipping the positions.
+
+        :param str term: the term.
+        :return: the sorted doc ids and the matching term frequencies, as int64 arrays.
+
+        """
+        i = self._find(term)
+        if i is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        skips, offset, doc_freq = self._skips(i)
+        end = offset + int(skips["length"].sum(dtype=np.int64))
+        values = decode_varints_array(self._mm[offset:end], 2 * doc_freq)
+        counts = np.minimum(BLOCK_SIZE, doc_freq - BLOCK_SIZE * np.arange(len(skips)))
+        gaps, tfs = split_blocks(values.astype(np.int64), counts)
+        return np.cumsum(gaps), tfs
+
+    def max_tf(self, term):
+        """
+        This function returns the highest frequency of a term in a document, without
+        decoding its postings.
+
+        :param str term: the term.
+        :return: the maximum term frequency, or 0 if the term is not in the segment.
+
+        """
+        i = self._find(term)
+        return 0 if i is None else int(self._skips(i)[0]["max_tf"].max())
+
+    def postings_among(self, term, doc_ids):
+        """
+        This function returns the postings of a term for some documents only, decoding only
+        the blocks that may contain them.
+
+        :param str term: the term.
+        :param numpy.ndarray doc_ids: the sorted ids of the documents.
+        :return: the doc ids among doc_ids containing the term and the term frequencies.
+
+        """
+        i = self._find(term)
+        if i is None or not len(doc_ids):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        skips, offset, doc_freq = self._skips(i)
+        last_ids = skips["last_doc_id"].astype(np.int64)
+        blocks = np.unique(np.searchsorted(last_ids, doc_ids))
+        blocks = blocks[blocks < len(skips)]
+        if not len(blocks):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        # Decode the selected blocks only
+        ends = offset + np.cumsum(skips["length"], dtype=np.int64)
+        starts = ends - skips["length"]
+        data = b"".join(self._mm[starts[b] : ends[b]] for b in blocks.tolist())
+        counts = np.minimum(BLOCK_SIZE, doc_freq - BLOCK_SIZE * blocks)
+        values = decode_varints_array(data, 2 * int(counts.sum()))
+        gaps, tfs = split_blocks(values.astype(np.int64), counts)
+
+        # The first gap of a block is relative to the last doc id of the previous block
+        bases = np.where(blocks > 0, last_ids[np.maximum(blocks - 1, 0)], 0)
+        block_starts = np.cumsum(counts) - counts
+        sums = np.cumsum(gaps)
+        before = np.where(block_starts > 0, sums[np.maximum(block_starts - 1, 0)], 0)
+        ids = sums - np.repeat(before - bases, counts)
+        selected = np.isin(ids, doc_ids, assume_unique=True)
+        return ids[selected], tfs[selected]
+
+    def lengths_of(self, doc_ids):
+        """
+        This function returns the number of tokens of documents of the segment.
+
+        :param numpy.ndarray doc_ids: the ids of documents of the segment.
+        :return: an array of the lengths.
+
+        """
+        ids, lengths = self._load_arrays()
+        if isinstance(self.doc_ids, range):
+            return lengths[doc_ids]
+        return lengths[np.searchsorted(ids, doc_ids)]
+
+    def min_length(self):
+        """
+        This function returns the smallest number of tokens of a document containing at
+        least one term, used to bound the scores of the terms.
+
+        :return: the minimum non-zero length, or 1 if every document is empty.
+
+        """
+        lengths = self._load_arrays()[1]
+        lengths = lengths[lengths > 0]
+        return int(lengths.min()) if len(lengths) else 1
+
+    def _load_arrays(self):
+        """
+        This function loads the doc ids and the lengths of the segment as NumPy arrays.
+
+        :return: the doc ids and the lengths, as int64 arrays.
+
+        """
+        if self._arrays is None:
+            # Copied, so that the file can still be unmapped
+            if isinstance(self.doc_ids, range):
+                ids = np.arange(self.n_docs, dtype=np.int64)
+            else:
+                ids = np.frombuffer(self.doc_ids, dtype=np.uint32).astype(np.int64)
+            lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+            self._arrays = (ids, lengths.astype(np.int64))
+        return self._arrays
+
+    def positions(self, term):
+        """
+        This function returns the positions of a term in each document containing it.
+
+        :param str term: the term.
+        :return: a dictionary {doc_id: [positions]}.
+
+        """
+        i = self._find(term)
+        if i is None:
+            return {}
+        doc_ids, _, positions = self._decode(i, with_positions=True)
+        return dict(zip(doc_ids, positions))
+
+    def positions_array(self, term, among=None):
+        """
+        This function decodes the positions of a term into NumPy arrays, only decoding the
+        bytes of the positions of the requested documents.
+
+        :param str term: the term.
+        :param numpy.ndarray among: the sorted ids of the only documents to return, or None
+            to return every document containing the term.
+        :return: the doc ids, the term frequencies and the positions of the documents, the
+            positions of the i-th document being the next tfs[i] values of the positions.
+
+        """
+        empty = np.zeros(0, dtype=np.int64)
+        i = self._find(term)
+        if i is None or not self.positional:
+            return empty, empty, empty
+        doc_ids, tfs = self.postings_array(term)
+        selected = slice(None) if among is None else np.isin(doc_ids, among)
+        if among is not None and not selected.any():
+            return empty, empty, empty
+
+        # The positions follow the blocks, only the ones of the requested documents are
+        # decoded
+        skips, offset, _ = self._skips(i)
+        offset += int(skips["length"].sum(dtype=np.int64))
+        ends = np.cumsum(tfs)
+        indices = None
+        if among is not None:
+            doc_ids, tfs, ends = doc_ids[selected], tfs[selected], ends[selected]
+            indices = np.arange(int(tfs.sum())) + np.repeat(ends - tfs.cumsum(), tfs)
+        gaps = decode_varints_array(
+            self._mm[offset : self._entry(i + 1)[1]], int(ends[-1]), indices
+        ).astype(np.int64)
+
+        # Rebuild the positions from their gaps within each document
+        sums = np.cumsum(gaps)
+        within = np.cumsum(tfs)
+        before = np.zeros(len(tfs), dtype=np.int64)
+        before[1:] = sums[within[:-1] - 1]
+        positions = sums - np.repeat(before, tfs)
+        return doc_ids, tfs, positions
+
+    def items(self):
+        """
+        This function iterates over the postings of every term, in the format expected by
+        SegmentWriter.add.
+
+        :return: an iterator over (term, [(doc_id, positions or term frequency)]) pairs
+            sorted by term.
+
+        """
+        for i in range(self.n_terms):
+            term = self._term(i).decode("utf-8")
+            doc_ids, tfs, positions = self._decode(i, with_positions=True)
+            yield term, list(zip(doc_ids, positions if self.positional else tfs))
+
+    def to_dict(self):
+        """
+        This function exports the segment in the JSON index format.
+
+        :return: the index, {term: {doc_id: [positions]}} if positional and
+            {term: [doc_id, ...]} otherwise.
+
+        """
+        index = {}
+        for i in range(self.n_terms):
+            term = self._term(i).decode("utf-8")
+            doc_ids, tfs, positions = self._decode(i, with_positions=True)
+            if self.positional:
+                index[term] = {str(d): p for d, p in zip(doc_ids, positions)}
+            else:
+                index[term] = [d for d, tf in zip(doc_ids, tfs) for _ in range(tf)]
+        return index
+
+    def close(self):
+        """
+        This function unmaps the segment.
+
+        """
+        for view in self._views:
+            view.release()
+        self._mm.close()
+
+
+class DictIndex:
+    """
+    Exposes an index in the JSON format with the same interface as Segment.
+    """
+
+    def __init__(self, index):
+        """
+        This function initializes the DictIndex class.
+
+        :param dict index: the index, {term: {doc_id: [positions]}} if positional and
+            {term: [doc_id, ...]} otherwise.
+
+        """
+        self.index = index
+        self.positional = all(isinstance(p, dict) for p in index.values())
+
+        lengths = {}
+        for term in index:
+            for doc_id, tf in zip(*self.postings(term)):
+                lengths[doc_id] = lengths.get(doc_id, 0) + tf
+        self.n_docs = max(lengths) + 1 if lengths else 0
+        self.doc_lengths = [lengths.get(i, 0) for i in range(self.n_docs)]
+        self.n_terms = len(index)
+        self.doc_ids = range(self.n_docs)
+
+    def __contains__(self, term):
+        return term in self.index
+
+    def __len__(self):
+        return self.n_terms
+
+    def terms(self):
+        """
+        This function iterates over the terms of the index in sorted order.
+
+        """
+        return iter(sorted(self.index))
+
+    def doc_freq(self, term):
+        """
+        This function returns the number of documents containing a term.
+
+        """
+        return len(self.postings(term)[0])
+
+    def postings(self, term):
+        """
+        This function returns the documents containing a term and the term frequencies.
+
+        """
+        if term not in self.index:
+            return [], []
+        if self.positional:
+            postings = self.index[term]
+            return [int(d) for d in postings], [len(p) for p in postings.values()]
+        tfs = {}
+        for doc_id in self.index[term]:
+            tfs[int(doc_id)] = tfs.get(int(doc_id), 0) + 1
+        return list(tfs), list(tfs.values())
+
+    def postings_array(self, term):
+        """
+        This function returns the documents containing a term and the term frequencies as
+        NumPy arrays.
+
+        """
+        doc_ids, tfs = self.postings(term)
+        return np.array(doc_ids, dtype=np.int64), np.array(tfs, dtype=np.int64)
+
+    def lengths_of(self, doc_ids):
+        """
+        This function returns the number of tokens of documents of the index.
+
+        """
+        return np.array(self.doc_lengths, dtype=np.int64)[doc_ids]
+
+    def min_length(self):
+        """
+        This function returns the smallest non-zero number of tokens of a document.
+
+        """
+        return min((length for length in self.doc_lengths if length), default=1)
+
+    def max_tf(self, term):
+        """
+        This function returns the highest frequency of a term in a document.
+
+        """
+        return max(self.postings(term)[1], default=0)
+
+    def postings_among(self, term, doc_ids):
+        """
+        This function returns the postings of a term for some documents only.
+
+        """
+        ids, tfs = self.postings_array(term)
+        selected = np.isin(ids, doc_ids)
+        return ids[selected], tfs[selected]
+
+    def positions(self, term):
+        """
+        This function returns the positions of a term in each document containing it.
+
+        """
+        if not self.positional or term not in self.index:
+            return {}
+        return {int(d): p for d, p in self.index[term].items()}
+
+    def positions_array(self, term, among=None):
+        """
+        This function returns the positions of a term as NumPy arrays, see
+        Segment.positions_array.
+
+        """
+        positions = self.positions(term)
+        doc_ids = sorted(positions)
+        if among is not None:
+            wanted = set(among.tolist())
+            doc_ids = [doc_id for doc_id in doc_ids if doc_id in wanted]
+        flat = [p for doc_id in doc_ids for p in sorted(positions[doc_id])]
+        return (
+            np.array(doc_ids, dtype=np.int64),
+            np.array([len(positions[d]) for d in doc_ids], dtype=np.int64),
+            np.array(flat, dtype=np.int64),
+        )
+
+    def doc_length(self, doc_id):
+        """
+        This function returns the number of tokens of a document of the index.
+
+        """
+        return self.doc_lengths[doc_id] if 0 <= doc_id < self.n_docs else 0
+
+    def items(self):
+        """
+        This function iterates over the postings of every term, sorted by term.
+
+        """
+        for term in self.terms():
+            doc_ids, tfs = self.postings(term)
+            if self.positional:
+                positions = self.positions(term)
+                yield term, [(d, positions[d]) for d in doc_ids]
+            else:
+                yield term, list(zip(doc_ids, tfs))
+
+    def to_dict(self):
+        """
+        This function returns the index in the JSON format.
+
+        """
+        return self.index
+
+    def close(self):
+        """
+        This function does nothing, the index is only held in memory.
+
+        """
+
+
+def load_index(path):
+    """
+    This function opens an index, either a binary segment or a JSON file.
+
+    :param str path: the path to the index.
+    :return: a Segment or a DictIndex.
+
+    """
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return DictIndex(json.load(f))
+    return Segment(path)
+
+
+if __name__ == "__main__":
+    # Convert an index between the JSON and the binary formats:
+    #   python -m backend.segment data/title.pos_index.json data/title.pos_index.seg
+    input_path, output_path = sys.argv[1:3]
+    source = load_index(input_path)
+    if output_path.endswith(".json"):
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(source.to_dict(), f, ensure_ascii=False)
+    else:
+        write_segment(
+            output_path,
+            source.to_dict(),
+            list(source.doc_lengths),
+            positional=source.positional,
+        )
+    print(f"Converted {input_path} to {output_path}.")
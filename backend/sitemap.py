@@ -0,0 +1,75 @@
+import gzip
+import io
+import requests
+from datetime import datetime
+from lxml import etree
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def parse_lastmod(lastmod):
+    """
+    Converts the lastmod of a sitemap entry to a timestamp.
+
+    :param str lastmod: the W3C datetime of the entry, e.g. "2024-02-14" or
+        "2024-02-14T10:00:00+00:00".
+    :return: the timestamp, or 0 if the date is missing or invalid.
+
+    """
+    if not lastmod:
+        return 0
+    try:
+        return datetime.fromisoformat(
+            lastmod.strip().replace("Z", "+00:00")
+        ).timestamp()
+    except ValueError:
+        return 0
+
+
+def iter_sitemap(stream):
+    """
+    Parses a sitemap or a sitemap index incrementally. Elements are discarded as soon as
+    they are read, so memory stays constant whatever the size of the sitemap.
+
+    :param stream: a binary file-like object, optionally gzipped.
+    :return: an iterator over (kind, loc, lastmod) tuples, where kind is "url" for a page
+        and "sitemap" for a nested sitemap of an index.
+
+    """
+    stream = io.BufferedReader(stream) if not hasattr(stream, "peek") else stream
+    if stream.peek(2)[:2] == GZIP_MAGIC:
+        stream = gzip.GzipFile(fileobj=stream)
+
+    for _, element in etree.iterparse(stream, events=("end",), recover=True):
+        kind = etree.QName(element).localname
+        if kind in ("url", "sitemap"):
+            loc = lastmod = None
+            for child in element:
+                name = etree.QName(child).localname
+                if name == "loc" and child.text:
+                    loc = child.text.strip()
+                elif name == "lastmod":
+                    lastmod = child.text
+            if loc:
+                yield kind, loc, parse_lastmod(lastmod)
+
+            # Free the parsed elements
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def fetch_sitemap(sitemap_url):
+    """
+    Downloads a sitemap and parses it while it is being received.
+
+    :param str sitemap_url: the URL of the sitemap.
+    :return: an iterator over (kind, loc, lastmod) tuples, see iter_sitemap.
+
+    """
+    with requests.get(sitemap_url, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        # Let the parser read until the end of the stream
+        response.raw.auto_close = False
+        yield from iter_sitemap(response.raw)
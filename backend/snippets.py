@@ -0,0 +1,174 @@
+import numpy as np
+from backend.analyzer import WORD
+from backend.segment import decode_varints_array, encode_varints
+from utils.lru import LRUCache
+
+
+def encode_offsets(text):
+    """
+    This function computes the character offsets of the words of a text, stored with the
+    text so that snippets are built without tokenizing it again.
+
+    :param str text: the text.
+    :return: the (gap from the end of the previous word, length) of each word as varints.
+
+    """
+    values, end = [], 0
+    for match in WORD.finditer(text):
+        values += [match.start() - end, match.end() - match.start()]
+        end = match.end()
+    buf = bytearray()
+    encode_varints(values, buf)
+    return bytes(buf)
+
+
+def decode_offsets(buf):
+    """
+    This function decodes the offsets encoded with encode_offsets.
+
+    :param bytes buf: the encoded offsets.
+    :return: the start and end offsets of the words, as arrays.
+
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    count = int(np.count_nonzero(data < 0x80))
+    values = decode_varints_array(buf, count).astype(np.int64)
+    bounds = np.cumsum(values)
+    return bounds[0::2], bounds[1::2]
+
+
+class SnippetGenerator:
+    """
+    Builds query-biased snippets: the window of the stored text holding the most distinct
+    query terms, cut at word boundaries, with the spans of the matching words.
+
+    The words matching a query term are the words that were analyzed into this term while
+    indexing, taken from the word cache of the analyzer, plus the words of the query. They
+    are found from the stored offsets of the words, so that the text is only sliced around
+    the words that may match.
+    """
+
+    def __init__(self, analyzer, length=200, cache_size=1000):
+        """
+        Initializes the SnippetGenerator.
+
+        :param Analyzer analyzer: the analyzer of the queries, whose word cache was warmed
+            with the words seen while indexing.
+        :param int length: the maximum number of characters of a snippet.
+        :param int cache_size: the number of queries whose matching words are cached.
+
+        """
+        self.analyzer = analyzer
+        self.length = length
+        # {(terms, query): ({word: term}, word lengths)}
+        self.patterns = LRUCache(cache_size)
+        self._words = None  # {term: [words]}
+
+    def refresh(self):
+        """
+        This function forgets the words of the terms, to read them again from the word
+        cache of the analyzer once it holds the words of a new version of the index.
+
+        """
+        self._words = None
+        self.patterns.clear()
+
+    def words_of(self, term):
+        """
+        This function returns the words analyzed into a term.
+
+        :param str term: the normalized term.
+        :return: the list of lowercased words.
+
+        """
+        words = self._words
+        if words is None:
+            words = {}
+            for word, word_term in self.analyzer.word_cache.items():
+                if word_term:
+                    words.setdefault(word_term, []).append(word)
+            self._words = words
+        return words.get(term, [])
+
+    def pattern(self, terms, query):
+        """
+        This function lists the words matching the terms of a query.
+
+        :param list terms: the normalized terms of the query.
+        :param str query: the query.
+        :return: the term of each matching word, and the sorted array of the lengths of
+            the matching words.
+
+        """
+        key = (tuple(terms), query)
+        cached = self.patterns.get(key)
+        if cached is not None:
+            return cached
+        word_terms = {word: term for term in terms for word in self.words_of(term)}
+        for word in WORD.findall(query.lower()):
+            term = self.analyzer.word_cache.get(word)
+            if term in terms:
+                word_terms[word] = term
+        lengths = np.array(sorted({len(word) for word in word_terms}), dtype=np.int64)
+        self.patterns.put(key, (word_terms, lengths))
+        return word_terms, lengths
+
+    def snippet(self, text, offsets, terms, query):
+        """
+        This function builds the snippet of a text for a query.
+
+        :param str text: the stored text.
+        :param bytes offsets: the offsets of the words of the text, see encode_offsets.
+        :param list terms: the normalized terms of the query.
+        :param str query: the query.
+        :return: the snippet and the (start, end) spans of the matching words in it.
+
+        """
+        word_terms, lengths = self.pattern(terms, query)
+        starts, ends = decode_offsets(offsets)
+        matches = []
+        if word_terms and len(starts):
+            # Only the words having the length of a matching word are read
+            candidates = np.flatnonzero(np.isin(ends - starts, lengths))
+            for start, end in zip(
+                starts[candidates].tolist(), ends[candidates].tolist()
+            ):
+                term = word_terms.get(text[start:end].lower())
+                if term is not None:
+                    matches.append((start, end, term))
+
+        # Pick the window holding the most distinct terms, then the most matches
+        best, best_score = (0, 0), (0, 0)
+        j = 0
+        for i, (start, _, _) in enumerate(matches):
+            j = max(i, j)
+            while j < len(matches) and matches[j][1] <= start + self.length:
+                j += 1
+            score = (len({m[2] for m in matches[i:j]}), j - i)
+            if score > best_score:
+                best, best_score = (i, j), score
+
+        if best_score[1]:
+            i, j = best
+            covered_start, covered_end = matches[i][0], matches[j - 1][1]
+            # Center the matches in the snippet
+            slack = self.length - (covered_end - covered_start)
+            start = max(0, covered_start - slack // 2)
+            k = int(np.searchsorted(starts, start))
+            start = min(int(starts[k]), covered_start) if k < len(starts) else start
+        else:
+            start = 0
+        end = start + self.length
+        if end < len(text) and len(ends):
+            k = int(np.searchsorted(ends, end, side="right")) - 1
+            if k >= 0 and ends[k] > start:
+                end = int(ends[k])
+
+        prefix = "..." if start > 0 else ""
+        suffix = "..." if end < len(text) else ""
+        highlights = [
+            (s - start + len(prefix), e - start + len(prefix))
+            for s, e, _ in matches
+            if s >= start and e <= end
+        ]
+        return prefix + text[start:end] + suffix, highlights
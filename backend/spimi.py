@@ -0,0 +1,138 @@
+import heapq
+import json
+import os
+import tempfile
+
+# Rough memory cost in bytes of the Python objects of an in-memory inverted index
+TERM_COST = 200
+POSTING_COST = 120
+POSITION_COST = 36
+
+
+class SpimiBuilder:
+    """
+    Single-pass in-memory inverted index builder. Postings are accumulated in memory until
+    the memory budget is reached, then flushed to a sorted run file on disk. The runs are
+    merged into the final index with a k-way merge, so that the memory used does not grow
+    with the size of the corpus.
+    """
+
+    def __init__(self, positional=True, memory_budget=512, run_dir=None):
+        """
+        Initializes the SpimiBuilder.
+
+        :param bool positional: whether to keep the positions of the terms.
+        :param float memory_budget: the estimated size in MB of the in-memory index above
+            which it is flushed to a run.
+        :param str run_dir: the directory where to write the runs, a temporary directory by
+            default.
+
+        """
+        self.positional = positional
+        self.memory_budget = memory_budget * 1024 * 1024
+        self.run_dir = tempfile.mkdtemp(prefix="runs-", dir=run_dir)
+        self.runs = []
+        self.index = {}  # {term: {doc_id: [positions] or term frequency}}
+        self.memory = 0
+
+    def add(self, doc_id, tokens):
+        """
+        Adds a document to the index. Documents may be added in any order of doc ids.
+
+        :param int doc_id: the id of the document.
+        :param list tokens: the tokens of the document.
+
+        """
+        for position, term in enumerate(tokens):
+            postings = self.index.get(term)
+            if postings is None:
+                postings = self.index[term] = {}
+                self.memory += TERM_COST
+            if self.positional:
+                positions = postings.get(doc_id)
+                if positions is None:
+                    positions = postings[doc_id] = []
+                    self.memory += POSTING_COST
+                positions.append(position)
+                self.memory += POSITION_COST
+            else:
+                if doc_id not in postings:
+                    postings[doc_id] = 0
+                    self.memory += POSTING_COST
+                postings[doc_id] += 1
+
+        if self.memory >= self.memory_budget:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the in-memory index to a run file sorted by term, and empties it.
+
+        """
+        if not self.index:
+            return
+        path = os.path.join(self.run_dir, f"run-{len(self.runs):05d}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for term in sorted(self.index):
+                postings = sorted(self.index[term].items())
+                f.write(json.dumps([term, postings], ensure_ascii=False))
+                f.write("\n")
+        print(f"Flushed {len(self.index)} terms to {path}.")
+        self.runs.append(path)
+        self.index = {}
+        self.memory = 0
+
+    @staticmethod
+    def iter_run(path):
+        """
+        Reads a run file.
+
+        :param str path: the path to the run.
+        :return: an iterator over the (term, postings) pairs of the run, sorted by term.
+
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                term, postings = json.loads(line)
+                yield term, postings
+
+    def merge(self):
+        """
+        Merges the runs into the final index. The postings of a term are concatenated in
+        run order, then sorted by doc id since the documents of a run may be older than the
+        documents of the previous runs, e.g. when a modified webpage keeps its doc id.
+
+        :return: an iterator over the (term, postings) pairs sorted by term, where postings
+            is a list of (doc_id, positions or term frequency) pairs sorted by doc id.
+
+        """
+        if not self.runs:
+            # Everything fits in memory, there is nothing to merge
+            for term in sorted(self.index):
+                yield term, sorted(self.index[term].items())
+            return
+
+        self.flush()
+        runs = [self.iter_run(path) for path in self.runs]
+        merged = heapq.merge(*runs, key=lambda item: item[0])
+        current_term, current_postings = None, []
+        for term, postings in merged:
+            if term != current_term:
+                if current_term is not None:
+                    current_postings.sort(key=lambda posting: posting[0])
+                    yield current_term, current_postings
+                current_term, current_postings = term, []
+            current_postings.extend(postings)
+        if current_term is not None:
+            current_postings.sort(key=lambda posting: posting[0])
+            yield current_term, current_postings
+
+    def close(self):
+        """
+        Deletes the run files.
+
+        """
+        for path in self.runs:
+            os.remove(path)
+        self.runs = []
+        os.rmdir(self.run_dir)
@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.pages import PageLog, is_page_log
+
+# The most frequent words of French, in decreasing order of frequency
+COMMON_WORDS = (
+    "de la le et les des en un du une que est pour qui dans a par plus pas au sur ne se "
+    "ce il sont aux avec ou son sa ses été cette mais comme on tout nous leur bien elle "
+    "très entre deux fait être sans aussi peut lors dont ces"
+).split()
+DOMAIN_WORDS = (
+    "école étudiant statistique données analyse recherche formation master ingénieur "
+    "campus rennes stage entreprise cours projet équipe laboratoire publication "
+    "admission concours international semestre diplôme économie informatique"
+).split()
+SYLLABLES = (
+    "ca pi ta li sa ré de mo na con pro ver gé té for ma ti cou ra lo vé si pa mé cu "
+    "bé do ne ri tu vo an in on ou eu au ai oi"
+).split()
+SUFFIXES = ["", "", "s", "e", "es", "tion", "ment", "eur", "ique", "ité", "er", "ée"]
+BASE_URL = "https://bench.noodle.test"
+
+
+def build_vocabulary(n_words, seed=0):
+    """
+    This function builds a French-like vocabulary: the most frequent French words, then
+    words of the domain of the crawled website, then pseudo-words made of French
+    syllables and suffixes.
+
+    :param int n_words: the size of the vocabulary.
+    :param int seed: the seed of the random generator.
+    :return: the list of words, the most frequent first.
+
+    """
+    rng = np.random.default_rng(seed)
+    words = list(dict.fromkeys(COMMON_WORDS + DOMAIN_WORDS))
+    seen = set(words)
+    while len(words) < n_words:
+        syllables = rng.choice(SYLLABLES, rng.integers(2, 5))
+        word = "".join(syllables) + rng.choice(SUFFIXES)
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words[:n_words]
+
+
+def zipf_sampler(n_words, exponent, rng):
+    """
+    This function builds a sampler of word ranks following a Zipf law truncated to the
+    vocabulary, so that the frequency of the word of rank r is proportional to 1 / r^s.
+
+    :param int n_words: the size of the vocabulary.
+    :param float exponent: the exponent s of the law.
+    :param numpy.random.Generator rng: the random generator.
+    :return: a function giving an array of ranks from a number of words, 0 being the most
+        frequent rank.
+
+    """
+    cdf = np.cumsum(1 / np.arange(1, n_words + 1) ** exponent)
+    cdf /= cdf[-1]
+    return lambda size: np.minimum(np.searchsorted(cdf, rng.random(size)), n_words - 1)
+
+
+def generate_pages(n_pages, n_words=20000, length=200, seed=0):
+    """
+    This function generates webpages in the schema of the crawler, whose words follow a
+    Zipf law over a French-like vocabulary, like natural language.
+
+    :param int n_pages: the number of webpages.
+    :param int n_words: the size of the vocabulary.
+    :param int length: the average number of words of the content of a webpage.
+    :param int seed: the seed of the random generator.
+    :return: an iterator over the webpages, {"url", "title", "content", "time"}.
+
+    """
+    vocabulary = np.array(build_vocabulary(n_words, seed))
+    rng = np.random.default_rng(seed)
+    ranks = zipf_sampler(len(vocabulary), 1.0, rng)
+    for i in range(n_pages):
+        n_tokens = rng.poisson(length) + 1
+        words = vocabulary[ranks(n_tokens)]
+        # Cut the content into sentences of 8 to 20 words
+        sentences, start = [], 0
+        while start < n_tokens:
+            end = start + int(rng.integers(8, 21))
+            sentence = " ".join(words[start:end])
+            sentences.append(sentence[:1].upper() + sentence[1:] + ".")
+            start = end
+        title = " ".join(vocabulary[ranks(rng.integers(3, 9))])
+        yield {
+            "url": f"{BASE_URL}/page/{i}",
+            "title": title[:1].upper() + title[1:],
+            "content": " ".join(sentences),
+            "time": 1700000000.0 + i,
+        }
+
+
+def write_corpus(path, pages):
+    """
+    This function writes webpages as a JSON array like crawled_urls.json, or as a page log
+    if the path ends with .jsonl or .jsonl.gz. The webpages are streamed to the file.
+
+    :param str path: the path to the file.
+    :param iterable pages: the webpages.
+    :return: the number of webpages written.
+
+    """
+    n_pages = 0
+    if is_page_log(path):
+        log = PageLog(path)
+        for page in pages:
+            log.write(page)
+            n_pages += 1
+        log.close()
+        return n_pages
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for page in pages:
+            f.write(",\n" if n_pages else "\n")
+            f.write(json.dumps(page, ensure_ascii=False))
+            n_pages += 1
+        f.write("\n]\n")
+    return n_pages
+
+
+def render_page(i, page, n_pages, n_links=10):
+    """
+    This function renders a webpage of the corpus as HTML, with a menu, a footer and links
+    to the next webpage and to random other ones.
+
+    :param int i: the number of the webpage.
+    :param dict page: the webpage.
+    :param int n_pages: the number of webpages of the site.
+    :param int n_links: the number of links to other webpages.
+    :return: the HTML of the webpage.
+
+    """
+    rng = np.random.default_rng(i)
+    targets = [(i + 1) % n_pages] + rng.integers(0, n_pages, n_links - 1).tolist()
+    links = " ".join(f'<a href="/page/{target}">{target}</a>' for target in targets)
+    paragraphs = "".join(
+        f"<p>{sentence.rstrip('.')}.</p>"
+        for sentence in page["content"].split(". ")
+        if sentence
+    )
+    return (
+        f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{page['title']}"
+        f'</title><script>var page = {{"id": {i}}};</script></head><body>'
+        '<nav><a href="/">Accueil</a> <a href="/page/0">Première page</a></nav>'
+        f"<main><h1>{page['title']}</h1>{paragraphs}<p>{links}</p></main>"
+        "<footer>Mentions légales</footer></body></html>"
+    )
+
+
+@contextmanager
+def serve_site(pages, n_links=10):
+    """
+    This function serves webpages as a local website, the stand-in of a real website for
+    the crawler. The home page is the first webpage, the others are at /page/<number>.
+
+    :param list pages: the webpages.
+    :param int n_links: the number of links of each webpage.
+    :return: a context manager giving the URL of the website.
+
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path == "/robots.txt":
+                body = "User-agent: *\nAllow: /\n"
+            elif self.path == "/":
+                body = render_page(0, pages[0], len(pages), n_links)
+            elif self.path.startswith("/page/") and self.path[6:].isdigit():
+                i = int(self.path[6:])
+                if i >= len(pages):
+                    return self.send_error(404)
+                body = render_page(i, pages[i], len(pages), n_links)
+            else:
+                return self.send_error(404)
+            body = body.encode("utf-8")
+            self.send_response(200)
+            content_type = "text/plain" if self.path == "/robots.txt" else "text/html"
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic French-like corpus of crawled webpages."
+    )
+    parser.add_argument("output", help="JSON file, or page log ending with .jsonl(.gz)")
+    parser.add_argument("--pages", type=int, default=10000, help="Number of webpages")
+    parser.add_argument("--words", type=int, default=20000, help="Vocabulary size")
+    parser.add_argument("--length", type=int, default=200, help="Words per webpage")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--serve", action="store_true", help="Serve the corpus as a local website"
+    )
+    args = parser.parse_args()
+
+    starting_time = time.perf_counter()
+    pages = generate_pages(args.pages, args.words, args.length, args.seed)
+    n_pages = write_corpus(args.output, pages)
+    elapsed = time.perf_counter() - starting_time
+    print(f"Wrote {n_pages} webpages to {args.output} in {elapsed:.1f} seconds.")
+    if args.serve:
+        pages = list(generate_pages(args.pages, args.words, args.length, args.seed))
+        with serve_site(pages) as url:
+            print(f"Serving the corpus at {url}, press Ctrl-C to stop.")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == "__main__":
+    main()
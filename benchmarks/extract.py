@@ -0,0 +1,91 @@
+import argparse
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.extract import decode_html, extract_page
+from benchmarks.topk import measure
+
+WORDS = (
+    "école étudiant statistique données analyse recherche formation master ingénieur "
+    "campus rennes stage entreprise cours projet équipe laboratoire publication"
+).split()
+
+
+def build_page(n_paragraphs, n_links, seed=0):
+    """
+    This function writes a random page with a menu, scripts, paragraphs and links.
+
+    :param int n_paragraphs: the number of paragraphs.
+    :param int n_links: the number of links.
+    :param int seed: the seed of the random generator.
+    :return: the HTML of the page, encoded in UTF-8.
+
+    """
+    rng = np.random.default_rng(seed)
+    menu = "".join(f'<li><a href="/menu/{i}">Menu {i}</a></li>' for i in range(30))
+    paragraphs = "".join(
+        f"<p>{' '.join(rng.choice(WORDS, 60))}</p>" for _ in range(n_paragraphs)
+    )
+    links = "".join(
+        f'<a href="../page/{i}?id={i}">{rng.choice(WORDS)}</a> ' for i in range(n_links)
+    )
+    html = (
+        '<html><head><meta charset="utf-8"><title>Formations</title>'
+        "<script>var data = {'a': 1};</script><style>p {color: red}</style></head>"
+        f"<body><nav><ul>{menu}</ul></nav><main><h1>Formations</h1>{paragraphs}"
+        f"{links}</main><footer>Mentions légales</footer></body></html>"
+    )
+    return html.encode("utf-8")
+
+
+def extract_with_beautifulsoup(content, url):
+    """
+    This function extracts the title, the main text and the links of a page with
+    BeautifulSoup and html.parser, in separate tree walks.
+
+    :param bytes content: the page.
+    :param str url: the URL of the page.
+    :return: the title, the main text and the links.
+
+    """
+    from bs4 import BeautifulSoup
+    from urllib.parse import urljoin
+
+    soup = BeautifulSoup(content.decode("utf-8"), "html.parser")
+    links = [urljoin(url, a_tag["href"]) for a_tag in soup.find_all("a", href=True)]
+    title = soup.title.string if soup.title else ""
+    for tag in soup.find_all(["script", "style", "nav", "header", "footer"]):
+        tag.decompose()
+    main = soup.find("main") or soup.body or soup
+    return title, " ".join(main.get_text(" ").split()), links
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the single-pass lxml extraction with BeautifulSoup."
+    )
+    parser.add_argument("--paragraphs", type=int, default=50, help="Paragraphs")
+    parser.add_argument("--links", type=int, default=200, help="Links per page")
+    parser.add_argument("--repeat", type=int, default=50, help="Number of runs")
+    args = parser.parse_args()
+
+    content = build_page(args.paragraphs, args.links)
+    url = "https://www.ensai.fr/ecole/formations"
+    print(f"Page of {len(content) / 1000:.0f}kB with {args.links} links")
+
+    (_, text, links), single_pass = measure(
+        lambda: extract_page(decode_html(content), url), args.repeat
+    )
+    (_, soup_text, soup_links), soup = measure(
+        lambda: extract_with_beautifulsoup(content, url), args.repeat
+    )
+    assert links == soup_links and len(text) == len(soup_text)
+    print(f"{'beautifulsoup':<16}{soup:>10.2f}ms")
+    print(f"{'lxml single pass':<16}{single_pass:>10.2f}ms ({soup / single_pass:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
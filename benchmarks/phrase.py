@@ -0,0 +1,98 @@
+import argparse
+import os
+import sys
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.positions import match_phrases
+from backend.scoring import Scorer
+from backend.segment import Segment, SegmentWriter
+from benchmarks.topk import measure
+
+
+def build_positional_segment(path, n_docs, n_terms, doc_length, seed=0):
+    """
+    This function writes a positional segment of random documents whose terms follow a
+    Zipf law, like natural language.
+
+    :param str path: the path to the segment.
+    :param int n_docs: the number of documents.
+    :param int n_terms: the size of the vocabulary.
+    :param int doc_length: the average number of tokens of a document.
+    :param int seed: the seed of the random generator.
+    :return: the number of tokens of each document.
+
+    """
+    rng = np.random.default_rng(seed)
+    lengths = rng.poisson(doc_length, n_docs) + 1
+    doc_ids = np.repeat(np.arange(n_docs), lengths)
+    positions = np.arange(len(doc_ids)) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths
+    )
+    terms = np.minimum(rng.zipf(1.1, len(doc_ids)), n_terms) - 1
+
+    # Sort the tokens by term, then doc id, then position
+    order = np.lexsort((positions, doc_ids, terms))
+    terms, doc_ids, positions = terms[order], doc_ids[order], positions[order]
+    bounds = np.searchsorted(terms, np.arange(n_terms + 1))
+    writer = SegmentWriter(path, positional=True)
+    for term in sorted(range(n_terms), key=lambda t: f"t{t}"):
+        start, end = bounds[term], bounds[term + 1]
+        if start == end:
+            continue
+        ids, first = np.unique(doc_ids[start:end], return_index=True)
+        groups = np.split(positions[start:end], first[1:])
+        writer.add(f"t{term}", list(zip(ids.tolist(), [g.tolist() for g in groups])))
+    writer.close(lengths.tolist())
+    return lengths
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare phrase queries with bag-of-words queries."
+    )
+    parser.add_argument("--docs", type=int, default=100000, help="Number of documents")
+    parser.add_argument("--terms", type=int, default=20000, help="Vocabulary size")
+    parser.add_argument(
+        "--length", type=int, default=30, help="Average document length"
+    )
+    parser.add_argument("-k", type=int, default=10, help="Number of results")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "content.pos_index.seg")
+        print(f"Building a positional segment of {args.docs} documents...")
+        lengths = build_positional_segment(path, args.docs, args.terms, args.length)
+        segment = Segment(path)
+        segments = [({"content": segment}, np.zeros(0, dtype=np.int64))]
+        avg_lengths = {"content": float(lengths.mean())}
+        scorer = Scorer({"content": {"weight": 1}}, "bm25f")
+
+        queries = [["t0", "t1"], ["t0", "t1", "t2"], ["t1", "t50"], ["t0", "t500"]]
+        print(f"{'query':<24}{'words':>12}{'phrase':>12}{'ratio':>10}{'matches':>10}")
+        for query in queries:
+
+            def words():
+                return scorer.top_k(query, segments, args.docs, avg_lengths, args.k)
+
+            def phrase():
+                among = match_phrases([query], segments, ["content"])
+                ranked = scorer.top_k(
+                    query, segments, args.docs, avg_lengths, args.k, among
+                )
+                return among, ranked
+
+            _, words_time = measure(words, args.repeat)
+            (among, _), phrase_time = measure(phrase, args.repeat)
+            print(
+                f"{' '.join(query):<24}{words_time:>10.2f}ms{phrase_time:>10.2f}ms"
+                f"{phrase_time / words_time:>9.1f}x{len(among):>10}"
+            )
+        segment.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = (
+    "école étudiant statistique données analyse recherche formation master ingénieur "
+    "campus rennes stage entreprise cours projet équipe laboratoire publication "
+    "admission concours international semestre diplôme économie informatique des"
+).split()
+
+# Run in a fresh interpreter, so that nothing is already imported or loaded
+CHILD = """
+import json, sys, time
+starting_time = time.perf_counter()
+from backend.ranker import Ranker
+imported = time.perf_counter()
+ranker = Ranker({pages!r}, {fields!r}, lem_model={model!r}, term_cache={cache!r},
+                manifest={manifest!r})
+ready = time.perf_counter()
+results = ranker.search({query!r})
+first_query = time.perf_counter()
+print(json.dumps({{
+    "import": imported - starting_time,
+    "ranker": ready - imported,
+    "first_query": first_query - ready,
+    "time_to_first_query": first_query - starting_time,
+    "model_loaded": ranker.analyzer.loaded,
+    "n_results": len(results),
+}}))
+"""
+
+
+def load_pipeline(model):
+    """
+    This function loads the SpaCy model used to index the corpus, or a lookup lemmatizer
+    if it is not installed.
+
+    :param str model: the SpaCy model.
+    :return: the SpaCy pipeline.
+
+    """
+    import spacy
+
+    if spacy.util.is_package(model):
+        return spacy.load(model)
+    nlp = spacy.blank("fr")
+    nlp.add_pipe("lemmatizer", config={"mode": "lookup"})
+    nlp.initialize()
+    return nlp
+
+
+def build_index(directory, n_pages, model, seed=0):
+    """
+    This function indexes random webpages made of French words.
+
+    :param str directory: the directory of the pages and the index.
+    :param int n_pages: the number of webpages.
+    :param str model: the SpaCy model used to index the webpages.
+    :return: the path to the pages file.
+
+    """
+    from backend.indexer import Indexer
+
+    rng = np.random.default_rng(seed)
+    pages = [
+        {
+            "url": f"https://www.example.fr/{i}",
+            "title": " ".join(rng.choice(WORDS, 5)),
+            "content": " ".join(rng.choice(WORDS, 50)),
+        }
+        for i in range(n_pages)
+    ]
+    pages_file = os.path.join(directory, "crawled_urls.json")
+    with open(pages_file, "w", encoding="utf-8") as f:
+        json.dump(pages, f, ensure_ascii=False)
+    indexer = Indexer(nlp=load_pipeline(model))
+    indexer.run(
+        pages_file, directory, ["title", "content"], use_pos=True, incremental=True
+    )
+    return pages_file
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the time to the first query of a fresh ranker process."
+    )
+    parser.add_argument("--pages", type=int, default=10000, help="Number of webpages")
+    parser.add_argument("--model", default="fr_core_news_sm", help="SpaCy model")
+    parser.add_argument("--query", default="analyse des données", help="Query")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of processes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Indexing {args.pages} webpages...")
+        pages_file = build_index(directory, args.pages, args.model)
+        fields = {
+            field: {"weight": weight, "index-file": "unused"}
+            for field, weight in [("title", 2), ("content", 1)]
+        }
+        code = CHILD.format(
+            pages=pages_file,
+            fields=fields,
+            model=args.model,
+            cache=os.path.join(directory, "term_cache.json"),
+            manifest=os.path.join(directory, "manifest.json"),
+            query=args.query,
+        )
+        runs = []
+        for _ in range(args.repeat):
+            starting_time = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, "-c", code],
+                cwd=ROOT,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            run = json.loads(output.strip().splitlines()[-1])
+            run["process"] = time.perf_counter() - starting_time
+            runs.append(run)
+
+        for key in [
+            "import",
+            "ranker",
+            "first_query",
+            "time_to_first_query",
+            "process",
+        ]:
+            print(f"{key:<22}{np.median([run[key] for run in runs]) * 1000:>10.1f}ms")
+        print(f"{'model loaded':<22}{runs[-1]['model_loaded']!s:>12}")
+        print(f"{'results':<22}{runs[-1]['n_results']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import build_vocabulary, generate_pages, serve_site, write_corpus
+from benchmarks.startup import load_pipeline
+
+FIELDS = {"title": 2, "content": 1}
+STAGES = ("crawl", "index", "query")
+
+
+@contextlib.contextmanager
+def quiet(verbose=False):
+    """
+    This function silences the logs printed by the components being measured.
+
+    :param bool verbose: whether to keep the logs.
+    :return: a context manager.
+
+    """
+    if verbose:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def git_version():
+    """
+    This function returns the version of the code being measured.
+
+    :return: the abbreviated commit hash, followed by "+" if the tree has local changes,
+        or None outside of a git repository.
+
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+" if status.strip() else "")
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """
+    This function returns the peak resident set size of the process or of its children.
+
+    :param int who: resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN.
+    :return: the peak RSS in MB.
+
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def directory_bytes(directory, exclude=()):
+    """
+    This function sums the size of the files of a directory.
+
+    :param str directory: the directory.
+    :param tuple exclude: the names of the files to leave out.
+    :return: a dictionary {extension: bytes}.
+
+    """
+    sizes = {}
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name in exclude or not os.path.isfile(path):
+            continue
+        extension = os.path.splitext(name)[1].lstrip(".")
+        sizes[extension] = sizes.get(extension, 0) + os.path.getsize(path)
+    return sizes
+
+
+def bench_crawl(args, directory):
+    """
+    This function measures the throughput of the crawler on a local website serving the
+    synthetic corpus.
+
+    :param argparse.Namespace args: the parameters of the benchmark.
+    :param str directory: the working directory.
+    :return: the results of the stage.
+
+    """
+    from backend.crawler import Crawler
+
+    pages = list(generate_pages(args.crawl_pages, args.words, args.length, args.seed))
+    with serve_site(pages) as url, quiet(args.verbose):
+        crawler = Crawler(
+            url,
+            max_urls=args.crawl_pages,
+            n_threads=args.crawl_threads,
+            politeness_delay=0,
+            page_log=os.path.join(directory, "crawl", "crawled_pages.jsonl"),
+        )
+        starting_time = time.perf_counter()
+        crawler.run()
+        elapsed = time.perf_counter() - starting_time
+
+    n_pages = len(crawler.visited_urls)
+    return {
+        "pages": n_pages,
+        "seconds": elapsed,
+        "pages_per_sec": n_pages / elapsed,
+        "ms_per_page": {
+            stage: seconds / max(crawler.n_processed, 1) * 1000
+            for stage, seconds in crawler.stage_times.items()
+        },
+    }
+
+
+def index_corpus(corpus_file, output_dir, model, n_process, verbose, results):
+    """
+    This function indexes the corpus, in a child process so that its peak memory is
+    measured apart from the rest of the benchmark.
+
+    :param str corpus_file: the path to the corpus.
+    :param str output_dir: the directory of the index.
+    :param str model: the SpaCy model.
+    :param int n_process: the number of analysis processes.
+    :param bool verbose: whether to show the logs of the indexer.
+    :param multiprocessing.Queue results: the queue receiving the duration of the indexing.
+
+    """
+    from backend.indexer import Indexer
+
+    with quiet(verbose):
+        indexer = Indexer(nlp=load_pipeline(model), n_process=n_process)
+        starting_time = time.perf_counter()
+        indexer.run(
+            corpus_file, output_dir, list(FIELDS), use_pos=True, incremental=True
+        )
+        results.put(time.perf_counter() - starting_time)
+
+
+def bench_index(args, directory):
+    """
+    This function measures the throughput, the peak memory and the index size of the
+    indexer on the synthetic corpus.
+
+    :param argparse.Namespace args: the parameters of the benchmark.
+    :param str directory: the working directory, where the corpus and the index are written.
+    :return: the results of the stage.
+
+    """
+    corpus_file = os.path.join(directory, "crawled_urls.json")
+    starting_time = time.perf_counter()
+    pages = generate_pages(args.pages, args.words, args.length, args.seed)
+    n_pages = write_corpus(corpus_file, pages)
+    generation_time = time.perf_counter() - starting_time
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(
+        target=index_corpus,
+        args=(
+            corpus_file,
+            directory,
+            args.model,
+            args.n_process,
+            args.verbose,
+            results,
+        ),
+    )
+    process.start()
+    elapsed = results.get()
+    process.join()
+
+    sizes = directory_bytes(directory, exclude=("crawled_urls.json",))
+    index_bytes = sum(sizes.values())
+    return {
+        "pages": n_pages,
+        "corpus_bytes": os.path.getsize(corpus_file),
+        "generation_seconds": generation_time,
+        "seconds": elapsed,
+        "docs_per_sec": n_pages / elapsed,
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "index_bytes": index_bytes,
+        "index_bytes_per_doc": index_bytes / n_pages,
+        "index_bytes_by_kind": sizes,
+    }
+
+
+def build_queries(args):
+    """
+    This function draws queries from the vocabulary of the corpus: one to three words
+    among the frequent but not too common ones, and some phrases taken from the webpages.
+
+    :param argparse.Namespace args: the parameters of the benchmark.
+    :return: the list of queries.
+
+    """
+    rng = np.random.default_rng(args.seed + 1)
+    vocabulary = build_vocabulary(args.words, args.seed)
+    words = vocabulary[50 : min(len(vocabulary), 5000)]
+    pages = list(
+        generate_pages(min(args.pages, 100), args.words, args.length, args.seed)
+    )
+    queries = []
+    for _ in range(args.queries):
+        if rng.random() < 0.1:
+            tokens = pages[rng.integers(len(pages))]["content"].split()
+            start = rng.integers(max(1, len(tokens) - 2))
+            queries.append('"' + " ".join(tokens[start : start + 2]).strip(".") + '"')
+        else:
+            queries.append(" ".join(rng.choice(words, rng.integers(1, 4))))
+    return queries
+
+
+async def run_queries(client, queries, concurrency):
+    """
+    This function sends queries to the search endpoint.
+
+    :param httpx.AsyncClient client: the client of the API.
+    :param list queries: the queries.
+    :param int concurrency: the number of queries in flight.
+    :return: the latency of each query in milliseconds.
+
+    """
+    latencies = []
+    pending = iter(queries)
+
+    async def worker():
+        for query in pending:
+            starting_time = time.perf_counter()
+            response = await client.get("/search", params={"query": query})
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - starting_time) * 1000)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def bench_query(args, directory):
+    """
+    This function measures the latency and the throughput of the search endpoint of the
+    API, backend.api:app, serving the index built by the index stage.
+
+    :param argparse.Namespace args: the parameters of the benchmark.
+    :param str directory: the working directory holding the index.
+    :return: the results of the stage.
+
+    """
+    import httpx
+    import backend.api as api
+    from backend.ranker import Ranker
+
+    fields = {
+        field: {"weight": weight, "index-file": "unused"}
+        for field, weight in FIELDS.items()
+    }
+    with quiet(args.verbose):
+        starting_time = time.perf_counter()
+        api.ranker = Ranker(
+            os.path.join(directory, "crawled_urls.json"),
+            fields,
+            nlp=load_pipeline(args.model),
+            term_cache=os.path.join(directory, "term_cache.json"),
+            manifest=os.path.join(directory, "manifest.json"),
+            proximity=api.ranker_config.get("proximity", 0.0),
+            snippet_length=api.ranker_config.get("snippet-length", 200),
+        )
+        load_time = time.perf_counter() - starting_time
+    queries = build_queries(args)
+
+    async def measure():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://noodle"
+        ) as client:
+            await run_queries(client, queries[: args.queries // 10], 1)  # Warm up
+            api.ranker.results.clear()
+            # One query at a time for the latencies, then concurrent ones for the QPS,
+            # each time with an empty result cache
+            latencies = await run_queries(client, queries, 1)
+            api.ranker.results.clear()
+            starting_time = time.perf_counter()
+            await run_queries(client, queries, args.concurrency)
+            return latencies, time.perf_counter() - starting_time
+
+    latencies, elapsed = asyncio.run(measure())
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]).tolist()
+    return {
+        "queries": len(queries),
+        "ranker_load_seconds": load_time,
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "mean_ms": float(np.mean(latencies)),
+        "concurrency": args.concurrency,
+        "qps": len(queries) / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(previous, current):
+    """
+    This function prints the change of every metric between two runs of the suite.
+
+    :param dict previous: the results of the reference run.
+    :param dict current: the results of the new run.
+
+    """
+    print(
+        f"{'metric':<36}{previous.get('version')!s:>12}{current.get('version')!s:>12}"
+    )
+    for stage in STAGES:
+        for key, value in current.get(stage, {}).items():
+            old = previous.get(stage, {}).get(key)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = f"{(value - old) / old * 100:+.1f}%" if old else ""
+            print(f"{stage + '.' + key:<36}{old:>12.4g}{value:>12.4g}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the crawler, the indexer and the API end to end on a "
+        "synthetic corpus, and write the results as JSON."
+    )
+    parser.add_argument("--pages", type=int, default=10000, help="Webpages indexed")
+    parser.add_argument("--words", type=int, default=20000, help="Vocabulary size")
+    parser.add_argument("--length", type=int, default=200, help="Words per webpage")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--crawl-pages", type=int, default=1000, help="Webpages crawled"
+    )
+    parser.add_argument("--crawl-threads", type=int, default=10, help="Crawl workers")
+    parser.add_argument("--model", default="fr_core_news_sm", help="SpaCy model")
+    parser.add_argument("--n-process", type=int, default=1, help="Analysis processes")
+    parser.add_argument("--queries", type=int, default=1000, help="Queries sent")
+    parser.add_argument("--concurrency", type=int, default=8, help="Queries in flight")
+    parser.add_argument(
+        "--stages", default=",".join(STAGES), help="Comma-separated stages to run"
+    )
+    parser.add_argument("--output", help="JSON file of the results, else stdout")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare")
+    parser.add_argument("--verbose", action="store_true", help="Show the logs")
+    args = parser.parse_args()
+    stages = args.stages.split(",")
+    os.chdir(ROOT)  # The API reads config.yml from the working directory
+    if "query" in stages and "index" not in stages:
+        parser.error("The query stage needs the index stage.")
+
+    results = {
+        "version": git_version(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.machine()}, {os.cpu_count()} CPUs",
+        "parameters": vars(args),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for stage in STAGES:
+            if stage in stages:
+                print(f"Running the {stage} stage...", file=sys.stderr)
+                bench = globals()[f"bench_{stage}"]
+                results[stage] = bench(args, directory)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"Results written to {args.output}.", file=sys.stderr)
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
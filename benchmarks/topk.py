@@ -0,0 +1,116 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.scoring import Scorer
+from backend.segment import Segment, SegmentWriter
+
+
+def build_segment(path, n_docs, n_terms, doc_length, seed=0):
+    """
+    This function writes a segment of random documents whose terms follow a Zipf law, like
+    natural language, so that the first terms appear in most documents.
+
+    :param str path: the path to the segment.
+    :param int n_docs: the number of documents.
+    :param int n_terms: the size of the vocabulary.
+    :param int doc_length: the average number of tokens of a document.
+    :param int seed: the seed of the random generator.
+    :return: the number of tokens of each document.
+
+    """
+    rng = np.random.default_rng(seed)
+    lengths = rng.poisson(doc_length, n_docs) + 1
+    doc_ids = np.repeat(np.arange(n_docs), lengths)
+    terms = np.minimum(rng.zipf(1.1, len(doc_ids)), n_terms) - 1
+
+    # Count the occurrences of each (term, doc) pair, sorted by term then doc id
+    pairs, tfs = np.unique(terms * n_docs + doc_ids, return_counts=True)
+    pair_terms, pair_docs = np.divmod(pairs, n_docs)
+    bounds = np.searchsorted(pair_terms, np.arange(n_terms + 1))
+    writer = SegmentWriter(path, positional=False)
+    for term in sorted(range(n_terms), key=lambda t: f"t{t}"):
+        start, end = bounds[term], bounds[term + 1]
+        if start < end:
+            writer.add(
+                f"t{term}",
+                list(zip(pair_docs[start:end].tolist(), tfs[start:end].tolist())),
+            )
+    writer.close(lengths.tolist())
+    return lengths
+
+
+def measure(function, repeat):
+    """
+    This function measures the median duration of a function.
+
+    :param callable function: the function to call.
+    :param int repeat: the number of calls.
+    :return: the result of the last call and the median duration in milliseconds.
+
+    """
+    durations = []
+    for _ in range(repeat):
+        starting_time = time.perf_counter()
+        result = function()
+        durations.append((time.perf_counter() - starting_time) * 1000)
+    return result, float(np.median(durations))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare exhaustive scoring with top-k MaxScore pruning."
+    )
+    parser.add_argument("--docs", type=int, default=200000, help="Number of documents")
+    parser.add_argument("--terms", type=int, default=20000, help="Vocabulary size")
+    parser.add_argument(
+        "--length", type=int, default=30, help="Average document length"
+    )
+    parser.add_argument("-k", type=int, default=10, help="Number of results")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query")
+    parser.add_argument("--scoring", default="bm25f", help="frequency, bm25 or bm25f")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "content.non_pos_index.seg")
+        print(f"Building a segment of {args.docs} documents...")
+        lengths = build_segment(path, args.docs, args.terms, args.length)
+        segment = Segment(path)
+        segments = [({"content": segment}, np.zeros(0, dtype=np.int64))]
+        avg_lengths = {"content": float(lengths.mean())}
+        scorer = Scorer({"content": {"weight": 1}}, args.scoring)
+
+        # From common terms only to a rare term among common ones
+        queries = [
+            ["t0"],
+            ["t0", "t1"],
+            ["t0", "t1", "t2", "t50"],
+            ["t0", "t1", "t500"],
+        ]
+        print(f"{'query':<24}{'exhaustive':>12}{'top-k':>12}{'speedup':>10}")
+        for query in queries:
+
+            def exhaustive():
+                doc_ids, scores = scorer.score(query, segments, args.docs, avg_lengths)
+                return scorer.top(doc_ids, scores, args.k)
+
+            def top_k():
+                return scorer.top_k(query, segments, args.docs, avg_lengths, args.k)
+
+            expected, exhaustive_time = measure(exhaustive, args.repeat)
+            actual, top_k_time = measure(top_k, args.repeat)
+            assert [d for d, _ in actual] == [d for d, _ in expected]
+            print(
+                f"{' '.join(query):<24}{exhaustive_time:>10.2f}ms{top_k_time:>10.2f}ms"
+                f"{exhaustive_time / top_k_time:>9.1f}x"
+            )
+        segment.close()
+
+
+if __name__ == "__main__":
+    main()
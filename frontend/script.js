@@ -94,7 +94,16 @@ function performSearch() {
                 contentElement.style.fontFamily = 'Poppins';
                 contentElement.style.fontWeight = '300'; // Poppins Light
                 contentElement.style.color = 'black';
-                contentElement.textContent = result.content;
+                // Met en gras les mots de l'extrait correspondant à la requête
+                let position = 0;
+                (result.highlights || []).forEach(([start, end]) => {
+                    contentElement.appendChild(document.createTextNode(result.content.slice(position, start)));
+                    const highlight = document.createElement('b');
+                    highlight.textContent = result.content.slice(start, end);
+                    contentElement.appendChild(highlight);
+                    position = end;
+                });
+                contentElement.appendChild(document.createTextNode(result.content.slice(position)));
 
                 // Ajoute les éléments au conteneur de la page
                 pageContainer.appendChild(titleDiv);
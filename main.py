@@ -1,8 +1,7 @@
 import argparse
 import yaml
-import os
-import webbrowser
-import uvicorn
+from utils import metrics
+from utils.logs import setup_logs
 
 # Read the Yaml configuration file
 with open("config.yml", "r") as f:
@@ -16,62 +15,162 @@ parser.add_argument("-c", "--crawler", action="store_true", help="Run Crawler")
 parser.add_argument("-i", "--indexer", action="store_true", help="Run Indexer")
 parser.add_argument("-r", "--ranker", action="store_true", help="Run Ranker")
 parser.add_argument("-w", "--web", action="store_true", help="Run Web Search Engine")
-args = parser.parse_args()
-
-if args.crawler:
-    from backend.crawler import Crawler
-
-    crawler_config = config["crawler-config"]
-    crawler = Crawler(
-        base_url=crawler_config["base-url"],
-        max_urls=crawler_config["max-urls"],
-        n_threads=crawler_config["n-threads"],
-        politeness_delay=crawler_config["politeness-delay"],
-        max_url_per_page=crawler_config["max-url-per-page"],
-    )
-    crawler.run()
-    crawler.save_visited_urls(crawler_config["pages-file"])
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="Resume the crawl saved in the page log and the checkpoint file",
+)
+parser.add_argument(
+    "--partition",
+    type=int,
+    help="Only run the crawler of this partition of a partitioned crawl, e.g. on another node",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=config.get("api-config", {}).get("workers", 1),
+    help="Number of processes serving the Web Search Engine",
+)
 
 
-elif args.indexer:
-    from backend.indexer import Indexer
+def main():
+    args = parser.parse_args()
 
-    indexer_config = config["indexer-config"]
-    indexer = Indexer(
-        lem_model=indexer_config["lem-model"],
-        limit=indexer_config["limit"],
-    )
-    indexer.run(
-        input_file=indexer_config["input-file"],
-        output_dir=indexer_config["output-dir"],
-        fields=indexer_config["fields"],
-        use_pos=indexer_config["use-pos"],
-        use_stem=indexer_config["use-stem"],
+    # Print and log the messages as set in the global configuration
+    global_config = config.get("global-config", {})
+    setup_logs(
+        verbose=global_config.get("verbose", True),
+        logs=global_config.get("logs", False),
+        logs_file=global_config.get("logs-file", "logs.log"),
     )
+    metrics.registry.enabled = global_config.get("metrics", False)
 
+    if args.crawler:
+        from backend.crawler import Crawler
 
-elif args.ranker:
-    from backend.ranker import Ranker
+        crawler_config = config["crawler-config"]
+        settings = dict(
+            base_url=crawler_config["base-url"],
+            max_urls=crawler_config["max-urls"],
+            n_threads=crawler_config["n-threads"],
+            politeness_delay=crawler_config["politeness-delay"],
+            max_url_per_page=crawler_config["max-url-per-page"],
+            bloom_capacity=crawler_config.get("bloom-capacity"),
+            robots_ttl=crawler_config.get("robots-ttl", 3600),
+            page_log=crawler_config.get("page-log"),
+            checkpoint_file=crawler_config.get("checkpoint-file"),
+            checkpoint_interval=crawler_config.get("checkpoint-interval", 60),
+            near_duplicate_distance=crawler_config.get("near-duplicate-distance"),
+        )
+        n_partitions = crawler_config.get("partitions", 1)
+        link_queue = crawler_config.get("link-queue", "data/link_queue.db")
+        pages_file = crawler_config["pages-file"]
+        if args.partition is None and n_partitions > 1:
+            # Coordinator: one crawler process per partition
+            import sys
+            from backend.distributed import coordinate
 
-    ranker_config = config["ranker-config"]
-    ranker = Ranker(
-        pages_file=ranker_config["pages-file"],
-        fields=ranker_config["fields"],
-        lem_model=ranker_config["lem-model"],
-    )
-    query = ""
-    while query != "exit":
-        query = input("Enter a query (or 'exit' to quit):")
-        results = ranker.run(query)
-        for i, result in enumerate(results):
-            print(f"{i+1}. {result['url']}")
-
-elif args.web:
-    # Open the frontend in the default web browser
-    cwd = os.getcwd()
-    webbrowser.open(cwd + "/frontend/index.html")
-    uvicorn.run("backend.api:app")
-
-else:
-    # Display the help message if no argument is provided
-    parser.print_help()
+            coordinate(
+                n_partitions,
+                link_queue,
+                settings["max_urls"],
+                [sys.executable, sys.argv[0], "-c"],
+                page_log=settings["page_log"],
+                resume=args.resume,
+            )
+        else:
+            if args.partition is None:
+                crawler = Crawler(**settings)
+            else:
+                from backend.distributed import PartitionedCrawler
+                from backend.pages import shard_path
+
+                crawler = PartitionedCrawler(
+                    args.partition, n_partitions, link_queue, **settings
+                )
+                pages_file = shard_path(pages_file, args.partition)
+            crawler.run(resume=args.resume)
+            if not crawler.page_log:
+                crawler.save_visited_urls(pages_file)
+            if metrics.registry.enabled:
+                print(metrics.registry.summary())
+
+    elif args.indexer:
+        from backend.indexer import Indexer
+
+        indexer_config = config["indexer-config"]
+        indexer = Indexer(
+            lem_model=indexer_config["lem-model"],
+            limit=indexer_config["limit"],
+            n_process=indexer_config.get("n-process", 1),
+            batch_size=indexer_config.get("batch-size", 1000),
+            memory_budget=indexer_config.get("memory-budget", 512),
+            max_segments=indexer_config.get("max-segments", 8),
+            stored_length=indexer_config.get("stored-length", 20000),
+            near_duplicate_distance=indexer_config.get("near-duplicate-distance"),
+        )
+        indexer.run(
+            input_file=indexer_config["input-file"],
+            output_dir=indexer_config["output-dir"],
+            fields=indexer_config["fields"],
+            use_pos=indexer_config["use-pos"],
+            use_stem=indexer_config["use-stem"],
+            index_format=indexer_config.get("index-format", "binary"),
+            incremental=indexer_config.get("incremental", False),
+            delete_missing=indexer_config.get("delete-missing", True),
+            n_shards=indexer_config.get("n-shards", 1),
+        )
+        if metrics.registry.enabled:
+            print(metrics.registry.summary())
+
+    elif args.ranker:
+        from backend.ranker import Ranker
+
+        ranker_config = config["ranker-config"]
+        ranker = Ranker(
+            pages_file=ranker_config["pages-file"],
+            fields=ranker_config["fields"],
+            lem_model=ranker_config["lem-model"],
+            term_cache=ranker_config.get("term-cache"),
+            manifest=ranker_config.get("manifest"),
+            scoring=ranker_config.get("scoring", "bm25f"),
+            k1=ranker_config.get("k1", 1.2),
+            b=ranker_config.get("b", 0.75),
+            proximity=ranker_config.get("proximity", 0.0),
+            proximity_depth=ranker_config.get("proximity-depth", 100),
+            result_cache_size=ranker_config.get("result-cache-size", 1000),
+            result_cache_ttl=ranker_config.get("result-cache-ttl", 60.0),
+            result_window=ranker_config.get("result-window", 100),
+            doc_cache_size=ranker_config.get("doc-cache-size", 1000),
+            snippet_length=ranker_config.get("snippet-length", 200),
+            shards=ranker_config.get("shards"),
+            shard_processes=ranker_config.get("shard-processes"),
+        )
+        query = ""
+        while query != "exit":
+            query = input("Enter a query (or 'exit' to quit):")
+            results = ranker.search(query)
+            for i, result in enumerate(results):
+                print(f"{i+1}. {result['url']}")
+
+    elif args.web:
+        import os
+        import webbrowser
+        import uvicorn
+
+        # Open the frontend in the default web browser
+        cwd = os.getcwd()
+        webbrowser.open(cwd + "/frontend/index.html")
+        # Each worker process maps the same binary segments, which are shared read-only
+        # through the page cache instead of being copied in every process
+        uvicorn.run("backend.api:app", workers=args.workers)
+
+    else:
+        # Display the help message if no argument is provided
+        parser.print_help()
+
+
+# The processes started by uvicorn and by the sharded ranker import this module again,
+# which must not run the command again
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+SITE = {
+    "/robots.txt": "User-agent: *\nDisallow: /private\nSitemap: {base}/sitemap.xml\n",
+    "/sitemap.xml": '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+    "<sitemap><loc>{base}/sitemap-pages.xml</loc></sitemap></sitemapindex>",
+    "/sitemap-pages.xml": '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+    "<url><loc>{base}/c</loc><lastmod>2023-01-01</lastmod></url>"
+    "<url><loc>{base}/d</loc><lastmod>2024-02-14</lastmod></url></urlset>",
+    "/": '<html><title>Accueil</title><p>Bienvenue</p><a href="/a">A</a><a href="/b">B</a>'
+    '<a href="/private">P</a></html>',
+    "/a": '<html><title>Page A</title><p>Contenu A</p><a href="/c">C</a></html>',
+    "/b": '<html><title>Page B</title><p>Contenu B</p><a href="/a">A</a></html>',
+    "/c": "<html><title>Page C</title><p>Contenu C</p></html>",
+    "/d": "<html><title>Page D</title><p>Contenu D</p></html>",
+    "/private": "<html><title>Private</title><p>Secret</p></html>",
+}
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        body = SITE.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.end_headers()
+        body = body.replace("{base}", f"http://{self.headers['Host']}")
+        self.wfile.write(body.encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_site():
+    # Serve a small website on a random local port
+    SiteHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture
+def site_requests(local_site):
+    # Paths requested to the local website, in order
+    return SiteHandler.requests
+
+
+@pytest.fixture(scope="session")
+def nlp():
+    # French pipeline: the full model if installed, a lookup lemmatizer otherwise
+    spacy = pytest.importorskip("spacy")
+    if spacy.util.is_package("fr_core_news_sm"):
+        return spacy.load("fr_core_news_sm")
+    pytest.importorskip("spacy_lookups_data")
+    nlp = spacy.blank("fr")
+    nlp.add_pipe("lemmatizer", config={"mode": "lookup"})
+    nlp.initialize()
+    return nlp
@@ -1,5 +1,7 @@
+import json
 import pytest
 from backend.crawler import Crawler
+from backend.pages import PageLog, iter_pages
 
 
 @pytest.fixture
@@ -35,6 +37,58 @@ def test_parse_page(crawler_instance):
     assert url in crawler_instance.visited_urls
 
 
+def test_process_page_keeps_main_text(crawler_instance):
+    # The whole main text is kept, without the menus and the scripts
+    html = (
+        "<html><head><title>Ensai</title><script>var a = 1;</script></head><body>"
+        "<nav><a href='/menu'>Menu</a></nav><main><h1>Formations</h1><p>Le master</p>"
+        "<p>Les   stages</p></main><footer>Contact</footer></body></html>"
+    )
+    crawler_instance.process_page("http://example.com/f", html)
+    page = crawler_instance.visited_urls["http://example.com/f"]
+    assert page["title"] == "Ensai"
+    assert page["content"] == "Formations Le master Les stages"
+
+
+def test_process_page_without_content(crawler_instance):
+    # An empty page is reported and not marked as visited
+    crawler_instance.process_page("http://example.com/empty", b"")
+    assert "http://example.com/empty" not in crawler_instance.visited_urls
+
+
+def test_process_page_near_duplicate():
+    # A near-duplicate of a crawled page is not kept, its links are still followed
+    crawler = Crawler("http://example.com", max_urls=10, near_duplicate_distance=3)
+    html = (
+        "<html><head><title>Erreur</title></head><body><main><p>La page demandée est "
+        "introuvable, elle a peut-être été déplacée ou supprimée du site de l'école."
+        "</p><a href='{}'>Accueil</a></main></body></html>"
+    )
+    crawler.process_page("http://example.com/a", html.format("/"))
+    crawler.process_page("http://example.com/b?x=1", html.format("/plan"))
+    assert "simhash" in crawler.visited_urls["http://example.com/a"]
+    page = crawler.visited_urls["http://example.com/b?x=1"]
+    assert page["duplicate_of"] == "http://example.com/a"
+    assert "http://example.com/plan" in crawler.urls_to_crawl
+
+
+def test_near_duplicate_logged(tmp_path):
+    # The near-duplicates are logged without their content, so that a resumed crawl
+    # does not download them again, and they are not read as webpages
+    path = str(tmp_path / "pages.jsonl")
+    crawler = Crawler("http://example.com", max_urls=10, near_duplicate_distance=3)
+    crawler.page_log = PageLog(path)
+    html = "<title>Erreur</title><p>La page demandée est introuvable sur le site.</p>"
+    crawler.process_page("http://example.com/a", html)
+    crawler.process_page("http://example.com/b", html)
+    crawler.page_log.close()
+    assert [page["url"] for page in iter_pages(path)] == ["http://example.com/a"]
+    log = PageLog(path, resume=True)
+    assert set(log.visited) == {"http://example.com/a", "http://example.com/b"}
+    assert list(log.fingerprints) == ["http://example.com/a"]
+    log.close()
+
+
 def test_save_visited_urls(crawler_instance, tmp_path):
     # Test the save_visited_urls method
     json_file = tmp_path / "visited_urls.json"
@@ -45,5 +99,119 @@ def test_save_visited_urls(crawler_instance, tmp_path):
     assert json_file.is_file()  # Check if the JSON file is created
 
 
+def test_run_local_site(local_site):
+    # Crawl a local website with the asynchronous workers
+    crawler = Crawler(local_site, max_urls=10, n_threads=3, politeness_delay=0)
+    crawler.run()
+    assert set(crawler.visited_urls) == {
+        local_site + "/",
+        local_site + "/a",
+        local_site + "/b",
+        local_site + "/c",
+        local_site + "/d",
+    }
+    assert crawler.visited_urls[local_site + "/a"]["title"] == "Page A"
+
+
+def test_run_survives_page_errors(local_site):
+    # A page failing to be processed is skipped, the other pages are still crawled
+    crawler = Crawler(local_site, max_urls=10, n_threads=1, politeness_delay=0)
+    process_page = crawler.process_page
+
+    def failing_process_page(url, *args):
+        if url.endswith("/a"):
+            raise ValueError("Malformed page")
+        process_page(url, *args)
+
+    crawler.process_page = failing_process_page
+    crawler.run()
+    assert local_site + "/a" not in crawler.visited_urls
+    assert {local_site + "/b", local_site + "/c"} <= set(crawler.visited_urls)
+
+
+def test_run_respects_max_urls(local_site):
+    # The crawl stops once max_urls pages are known
+    crawler = Crawler(local_site, max_urls=2, n_threads=2, politeness_delay=0)
+    crawler.run()
+    assert len(crawler.visited_urls) == 2
+
+
+def test_run_per_host_politeness(local_site):
+    # Requests to the same host are spaced by the politeness delay
+    crawler = Crawler(local_site, max_urls=3, n_threads=3, politeness_delay=0.2)
+    crawler.run()
+    times = sorted(page["time"] for page in crawler.visited_urls.values())
+    assert len(times) == 3
+    assert all(b - a >= 0.15 for a, b in zip(times, times[1:]))
+
+
+def test_robots_fetched_once(local_site, site_requests):
+    # robots.txt is downloaded once for the whole crawl
+    crawler = Crawler(local_site, max_urls=10, n_threads=3, politeness_delay=0)
+    crawler.run()
+    assert site_requests.count("/robots.txt") == 1
+    assert crawler.robots.misses == 1
+    assert crawler.robots.hits >= 3
+
+
+def test_parse_robots_uses_cache(local_site, site_requests):
+    # The threaded path shares the same cache
+    crawler = Crawler(local_site, max_urls=10, n_threads=3, politeness_delay=0)
+    assert crawler.parse_robots(local_site + "/a")
+    assert not crawler.parse_robots(local_site + "/private")
+    assert site_requests.count("/robots.txt") == 1
+
+
+def test_run_seeds_from_sitemaps(local_site, site_requests):
+    # Sitemap URLs are crawled, the most recently modified first
+    crawler = Crawler(local_site, max_urls=10, n_threads=1, politeness_delay=0)
+    crawler.run()
+    assert site_requests.count("/sitemap-pages.xml") == 1
+    assert site_requests.index("/d") < site_requests.index("/c")
+
+
+def test_run_with_page_log(local_site, tmp_path):
+    # The pages are streamed to the log, only their time is kept in memory
+    page_log = str(tmp_path / "pages.jsonl.gz")
+    checkpoint_file = str(tmp_path / "checkpoint.json")
+    crawler = Crawler(
+        local_site,
+        max_urls=10,
+        politeness_delay=0,
+        page_log=page_log,
+        checkpoint_file=checkpoint_file,
+    )
+    crawler.run()
+    pages = {page["url"]: page for page in iter_pages(page_log)}
+    assert set(pages) == set(crawler.visited_urls) and len(pages) == 5
+    assert pages[local_site + "/a"]["title"] == "Page A"
+    assert "title" not in crawler.visited_urls[local_site + "/a"]
+    with open(checkpoint_file, encoding="utf-8") as f:
+        assert json.load(f)["queued"] == []
+
+
+def test_resume(local_site, site_requests, tmp_path):
+    # A crawl stopped after the home page continues from its checkpoint
+    page_log = str(tmp_path / "pages.jsonl")
+    checkpoint_file = tmp_path / "checkpoint.json"
+    log = PageLog(page_log)
+    log.write({"url": local_site + "/", "title": "Accueil", "content": "", "time": 1})
+    log.close()
+    queued = [[local_site + "/a", 0], [local_site + "/b", 0]]
+    checkpoint_file.write_text(json.dumps({"queued": queued}))
+
+    crawler = Crawler(
+        local_site,
+        max_urls=10,
+        politeness_delay=0,
+        page_log=page_log,
+        checkpoint_file=str(checkpoint_file),
+    )
+    crawler.run(resume=True)
+    assert "/" not in site_requests and "/a" in site_requests
+    urls = [page["url"] for page in iter_pages(page_log)]
+    assert len(urls) == 5 and set(urls) == set(crawler.visited_urls)
+
+
 if __name__ == "__main__":
     pytest.main()
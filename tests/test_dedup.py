@@ -0,0 +1,35 @@
+from backend.dedup import SimHashIndex, hamming_distance, page_fingerprint, simhash
+
+TEXT = (
+    "L'ENSAI forme des ingénieurs en statistique et en science des données. Les "
+    "étudiants suivent des cours de probabilités, d'économétrie et d'informatique, puis "
+    "font un stage en entreprise ou dans un laboratoire de recherche."
+)
+
+
+def test_simhash_near_duplicates():
+    # A small edit flips a few bits, a different text about half of them
+    assert simhash(TEXT) == simhash(TEXT.upper())
+    assert hamming_distance(simhash(TEXT), simhash(TEXT + " Mentions légales")) <= 4
+    assert hamming_distance(simhash(TEXT), simhash("Erreur : page introuvable")) > 12
+    assert simhash("") == 0
+
+
+def test_page_fingerprint():
+    # The fingerprint saved by the crawler is reused
+    page = {"url": "https://www.ensai.fr/", "title": "ENSAI", "content": TEXT}
+    assert page_fingerprint(page) == simhash(f"ENSAI {TEXT}")
+    assert page_fingerprint(dict(page, simhash=42)) == 42
+
+
+def test_simhash_index():
+    # Fingerprints within max_distance bits of a previous one are near-duplicates
+    index = SimHashIndex(max_distance=3)
+    fingerprint = simhash(TEXT)
+    assert index.find_or_add(fingerprint, "a") is None
+    assert index.find_or_add(fingerprint ^ 0b111 << 20, "b") == "a"
+    assert index.find_or_add(fingerprint ^ 0b1111 << 20, "c") is None
+    # The first fingerprint added is returned, whatever the band they share
+    assert index.find(fingerprint ^ 0b1111 << 20 ^ 1 << 63) == "c"
+    assert index.find(fingerprint ^ 1 << 63) == "a"
+    assert len(index) == 2
@@ -0,0 +1,95 @@
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from backend.distributed import LinkQueue, PartitionedCrawler, partition_of
+from backend.pages import iter_pages, page_files, shard_path
+
+
+@pytest.fixture
+def other_site(local_site):
+    # Second host, whose home page links to the first one
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            pages = {
+                "/": f'<html><title>Autre</title><a href="{local_site}/">Site</a>'
+                '<a href="/x">X</a></html>',
+                "/x": "<html><title>Page X</title><p>Contenu X</p></html>",
+            }
+            body = pages.get(self.path)
+            self.send_response(200 if body else 404)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.end_headers()
+            self.wfile.write((body or "").encode("utf-8"))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_partition_of():
+    # Every URL of a host belongs to the same partition
+    partitions = {partition_of(f"https://www.ensai.fr/{i}", 4) for i in range(20)}
+    assert len(partitions) == 1 and partitions.pop() in range(4)
+
+
+def test_link_queue_ends_when_all_idle(tmp_path):
+    queue = LinkQueue(str(tmp_path / "links.db"))
+    queue.reset(n_partitions=2, max_urls=100)
+    queue.join(0, 2, 100)
+    queue.join(1, 2, 100)
+    # The link sent to the idle partition 1 keeps the crawl going
+    assert queue.exchange(0, [(1, "https://b.fr/", 0)], 3, idle=True) == ([], False)
+    assert queue.exchange(1, [], 0, idle=True) == ([("https://b.fr/", 0)], False)
+    assert queue.exchange(0, [], 3, idle=True) == ([], False)
+    assert queue.exchange(1, [], 1, idle=True) == ([], True)
+    assert queue.n_visited() == 4
+
+
+def test_link_queue_stops_at_max_urls(tmp_path):
+    queue = LinkQueue(str(tmp_path / "links.db"))
+    queue.reset(n_partitions=2, max_urls=5)
+    queue.join(0, 2, 5)
+    assert queue.exchange(0, [], 4, idle=False) == ([], False)
+    assert queue.exchange(1, [], 1, idle=False) == ([], True)
+
+
+def test_partitioned_crawl(local_site, other_site, tmp_path):
+    # The hosts are crawled by the crawlers of their partitions, each writing its shard
+    n_partitions = next(
+        n
+        for n in range(2, 20)
+        if partition_of(local_site, n) != partition_of(other_site, n)
+    )
+    page_log = str(tmp_path / "pages.jsonl.gz")
+    link_queue = str(tmp_path / "links.db")
+    LinkQueue(link_queue).reset(n_partitions, max_urls=100)
+    crawlers = [
+        PartitionedCrawler(
+            partition,
+            n_partitions,
+            link_queue,
+            other_site,
+            max_urls=100,
+            politeness_delay=0,
+            page_log=page_log,
+            exchange_interval=0.05,
+        )
+        for partition in range(n_partitions)
+    ]
+    threads = [Thread(target=crawler.run) for crawler in crawlers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not any(thread.is_alive() for thread in threads)
+
+    site_pages = {local_site + path for path in ["/", "/a", "/b", "/c", "/d"]}
+    urls = {page["url"] for page in iter_pages(page_log)}
+    assert urls == site_pages | {other_site + "/", other_site + "/x"}
+    shard = shard_path(page_log, partition_of(local_site, n_partitions))
+    assert {page["url"] for page in iter_pages(shard)} == site_pages
+    assert len(page_files(page_log)) == n_partitions
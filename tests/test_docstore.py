@@ -0,0 +1,57 @@
+import pytest
+from backend.docstore import DocStore, DocStoreWriter, merge_stores
+from backend.snippets import decode_offsets
+
+PAGES = {
+    4: {"url": "https://www.ensai.fr/", "title": "Accueil", "content": "Bienvenue"},
+    0: {"url": "https://www.ensai.fr/a", "title": "École", "content": "A" * 500},
+    7: {"url": "https://www.ensai.fr/b", "title": "Erreur", "content": ""},
+}
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    # Documents added out of doc id order
+    writer = DocStoreWriter(str(tmp_path / "docs.store"), stored_length=100)
+    for doc_id, page in PAGES.items():
+        writer.add(doc_id, page)
+    writer.close()
+    return str(tmp_path / "docs.store")
+
+
+def test_get(store_path):
+    store = DocStore(store_path)
+    assert list(store.doc_ids) == [0, 4, 7]
+    page = store.get(4)
+    assert {field: page[field] for field in PAGES[4]} == PAGES[4]
+    assert store.get(7)["content"] == "" and store.get(7)["offsets"] == b""
+    # The content is cut to stored_length, and stored with the offsets of its words
+    page = store.get(0)
+    assert page["content"] == "A" * 100
+    starts, ends = decode_offsets(page["offsets"])
+    assert starts.tolist() == [0] and ends.tolist() == [100]
+    assert store.get(1) is None and 1 not in store
+    store.close()
+
+
+def test_cache(store_path):
+    store = DocStore(store_path, cache_size=1)
+    store.get(4)
+    assert store.get(4) is store.get(4)
+    assert store.cache.stats()["hits"] == 2
+    store.close()
+
+
+def test_merge_stores(store_path, tmp_path):
+    # Deleted documents are dropped, the others are copied
+    writer = DocStoreWriter(str(tmp_path / "new.store"))
+    writer.add(4, dict(PAGES[4], title="Nouvel accueil"))
+    writer.close()
+    merged = str(tmp_path / "merged.store")
+    n_docs = merge_stores(
+        [store_path, str(tmp_path / "new.store")], [{4, 7}, set()], merged
+    )
+    store = DocStore(merged)
+    assert n_docs == 2 and list(store.doc_ids) == [0, 4]
+    assert store.get(4)["title"] == "Nouvel accueil"
+    store.close()
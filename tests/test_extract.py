@@ -0,0 +1,54 @@
+from backend.extract import charset_of, decode_html, extract_page
+
+PAGE = """<html><head><title> École
+ nationale </title><script>var a = "<p>";</script></head><body>
+<nav><a href="/menu">Menu</a></nav>
+<main><h1>Formations</h1><p>Le <b>master</b> et les stages</p>
+<a href="../cours?id=1#plan">Cours</a> <a href="mailto:contact@ensai.fr">Contact</a>
+<a href="https://www.insee.fr">Insee</a></main>
+<footer>Mentions légales</footer></body></html>"""
+
+
+def test_extract_page():
+    # The title, the main text and the links come from a single pass
+    title, content, links = extract_page(PAGE, "https://www.ensai.fr/ecole/formations")
+    assert title == "École nationale"
+    assert content == "Formations Le master et les stages Cours Contact Insee"
+    assert links == [
+        "https://www.ensai.fr/menu",
+        "https://www.ensai.fr/cours?id=1#plan",
+        "https://www.insee.fr",
+    ]
+
+
+def test_extract_page_without_main():
+    # The text of the whole body is used, relative to the <base> of the page
+    html = '<base href="https://www.ensai.fr/a/"><p>Bienvenue</p><a href="b">B</a>'
+    assert extract_page(html, "https://www.ensai.fr/") == (
+        "",
+        "Bienvenue B",
+        ["https://www.ensai.fr/a/b"],
+    )
+    assert extract_page("", "https://www.ensai.fr/") == ("", "", [])
+
+
+def test_extract_page_keeps_words_whole():
+    # Entities and inline elements do not split words, blocks do
+    html = (
+        "<main><p>Le caf&eacute; de l&#39;&eacute;cole</p><p><b>ENS</b>AI<br>Rennes</p>"
+        "<ul><li>Master</li><li>Stage</li></ul></main>"
+    )
+    _, content, _ = extract_page(html, "https://www.ensai.fr/")
+    assert content == "Le café de l'école ENSAI Rennes Master Stage"
+
+
+def test_decode_html():
+    # The header wins over the page, which wins over the guess
+    html = '<meta charset="iso-8859-1"><p>Été</p>'
+    assert decode_html(html.encode("latin-1")) == html
+    assert decode_html(html.encode("utf-8"), "text/html; charset=utf-8") == html
+    assert decode_html("Été".encode("utf-8")) == "Été"
+    assert decode_html("Été".encode("cp1252")) == "Été"
+    assert decode_html('<meta charset="unknown">é'.encode("utf-8")).endswith("é")
+    assert charset_of('text/html; Charset="UTF-8"') == "UTF-8"
+    assert charset_of("text/html") is None
@@ -0,0 +1,72 @@
+from backend.frontier import BloomFilter, Frontier, normalize_url
+
+
+def test_normalize_url():
+    # Equivalent URLs share the same normalized form
+    assert normalize_url("HTTPS://www.Ensai.fr:443") == "https://www.ensai.fr/"
+    assert normalize_url("http://ensai.fr/a?b=2&a=1#top") == "http://ensai.fr/a?a=1&b=2"
+    assert normalize_url("http://ensai.fr:8080/a") == "http://ensai.fr:8080/a"
+
+
+def test_deduplicates_urls():
+    # A URL is only queued once, whatever its form
+    frontier = Frontier()
+    assert frontier.add("http://ensai.fr/a")
+    assert not frontier.add("http://ENSAI.fr/a#section")
+    assert "http://ensai.fr/a" in frontier
+    assert len(frontier) == 1
+
+
+def test_pops_hosts_in_turn():
+    # URLs of a host wait for its politeness window while other hosts are served
+    frontier = Frontier(politeness_delay=10)
+    for url in ["http://a.fr/1", "http://a.fr/2", "http://b.fr/1"]:
+        frontier.add(url)
+    assert frontier.pop() == ("http://a.fr/1", 0)
+    assert frontier.pop() == ("http://b.fr/1", 0)
+    url, wait = frontier.pop()
+    assert url is None and 9 < wait <= 10
+    assert len(frontier) == 1
+
+
+def test_empty_frontier():
+    # An empty frontier has nothing to wait for
+    frontier = Frontier()
+    assert frontier.pop() == (None, None)
+
+
+def test_reserve_delays_host():
+    # A request sent outside the frontier pushes back the host
+    frontier = Frontier(politeness_delay=10)
+    frontier.add("http://a.fr/1")
+    assert frontier.reserve("http://a.fr/robots.txt") == 0
+    url, wait = frontier.pop()
+    assert url is None and wait > 9
+
+
+def test_bloom_filter():
+    # Added elements are always found, unseen ones rarely
+    bloom = BloomFilter(1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"http://ensai.fr/{i}")
+    assert all(f"http://ensai.fr/{i}" in bloom for i in range(1000))
+    false_positives = sum(f"http://noodle.fr/{i}" in bloom for i in range(1000))
+    assert false_positives < 50
+
+
+def test_bloom_frontier():
+    # The frontier works the same with a Bloom filter seen-set
+    frontier = Frontier(bloom_capacity=100)
+    assert frontier.add("http://ensai.fr/a")
+    assert not frontier.add("http://ensai.fr/a")
+    assert frontier.n_seen == 1
+
+
+def test_queued():
+    # The queued URLs are listed with their priority, to checkpoint the crawl
+    frontier = Frontier()
+    frontier.add("http://a.fr/1", priority=2)
+    frontier.add("http://b.fr/1")
+    frontier.add("http://a.fr/2", priority=5)
+    frontier.pop()
+    assert frontier.queued() == [("http://a.fr/1", 2), ("http://b.fr/1", 0)]
@@ -0,0 +1,220 @@
+import json
+import pytest
+from backend import analyzer
+from backend.analyzer import Analyzer
+from backend.docstore import DocStore
+from backend.indexer import Indexer
+from backend.segment import Segment
+
+PAGES = [
+    {
+        "url": "https://www.ensai.fr/",
+        "title": "Accueil de l'ENSAI",
+        "content": "Bienvenue",
+    },
+    {
+        "url": "https://www.ensai.fr/a",
+        "title": "Les étudiants de l'école",
+        "content": "A",
+    },
+    {
+        "url": "https://www.ensai.fr/b",
+        "title": "Erreur : page introuvable",
+        "content": "B",
+    },
+    {
+        "url": "https://www.ensai.fr/c",
+        "title": "Erreur, les pages sont perdues",
+        "content": "C",
+    },
+]
+
+
+@pytest.fixture
+def pages_file(tmp_path):
+    path = tmp_path / "crawled_urls.json"
+    path.write_text(json.dumps(PAGES), encoding="utf-8")
+    return str(path)
+
+
+def test_parallel_analysis_matches_serial(nlp):
+    # Sharding the documents across processes does not change the tokens
+    titles = [page["title"] for page in PAGES] * 5
+    serial = Indexer(nlp=nlp).analyzer.analyze(titles)
+    parallel = Indexer(nlp=nlp, n_process=2, batch_size=3).analyzer.analyze_parallel(
+        titles
+    )
+    assert parallel == serial
+    assert serial[2] == ["erreur", "pag", "introuv"]
+
+
+def test_worker_caches_persist(nlp, monkeypatch):
+    # A worker keeps its caches across the chunks and only sends their new entries
+    monkeypatch.setattr(analyzer, "_worker_analyzer", Analyzer(nlp=nlp))
+    analyzer._init_worker(None, None)
+    titles = [page["title"] for page in PAGES]
+    docs, term_items, word_items = analyzer._analyze_chunk((titles, True))
+    assert term_items and word_items
+    assert analyzer._analyze_chunk((titles, True)) == (docs, [], [])
+    assert analyzer._worker_analyzer.cache_stats()["term"]["hits"] > 0
+
+
+def test_run_json(nlp, pages_file, tmp_path):
+    # The JSON index maps each token to its positions in each page
+    indexer = Indexer(nlp=nlp)
+    indexer.run(pages_file, str(tmp_path), ["title"], use_pos=True, index_format="json")
+    with open(tmp_path / "title.pos_index.json", encoding="utf-8") as f:
+        index = json.load(f)
+    assert index["erreur"] == {"2": [0], "3": [0]}
+    with open(tmp_path / "metadata.json", encoding="utf-8") as f:
+        assert json.load(f)["n_docs"] == 4
+
+
+def test_run_page_log(nlp, tmp_path):
+    # The page log of the crawler is indexed like a JSON array
+    page_log = tmp_path / "pages.jsonl"
+    page_log.write_text("".join(json.dumps(page) + "\n" for page in PAGES))
+    Indexer(nlp=nlp).run(str(page_log), str(tmp_path), ["title"], use_pos=True)
+    segment = Segment(str(tmp_path / "title.pos_index.seg"))
+    assert segment.to_dict()["erreur"] == {"2": [0], "3": [0]}
+
+
+def test_run_binary(nlp, pages_file, tmp_path):
+    # The binary segment holds the same postings as the JSON index
+    json_dir, binary_dir = tmp_path / "json", tmp_path / "binary"
+    json_dir.mkdir()
+    binary_dir.mkdir()
+    indexer = Indexer(nlp=nlp)
+    indexer.run(pages_file, str(json_dir), ["title"], use_pos=True, index_format="json")
+    indexer.run(pages_file, str(binary_dir), ["title"], use_pos=True)
+    segment = Segment(str(binary_dir / "title.pos_index.seg"))
+    with open(json_dir / "title.pos_index.json", encoding="utf-8") as f:
+        assert segment.to_dict() == json.load(f)
+    assert segment.n_docs == 4
+    segment.close()
+
+
+def test_run_with_runs_matches_in_memory(nlp, pages_file, tmp_path):
+    # Flushing the postings to runs on disk does not change the index
+    in_memory, runs = tmp_path / "in_memory", tmp_path / "runs"
+    in_memory.mkdir()
+    runs.mkdir()
+    Indexer(nlp=nlp).run(pages_file, str(in_memory), ["title", "content"], use_pos=True)
+    Indexer(nlp=nlp, memory_budget=0).run(
+        pages_file, str(runs), ["title", "content"], use_pos=True
+    )
+    for field in ["title", "content"]:
+        filename = f"{field}.pos_index.seg"
+        expected = Segment(str(in_memory / filename))
+        actual = Segment(str(runs / filename))
+        assert actual.to_dict() == expected.to_dict()
+        assert list(actual.doc_lengths) == list(expected.doc_lengths)
+    assert sorted(p.name for p in runs.iterdir() if p.is_dir()) == []
+
+
+def test_incremental_run(nlp, pages_file, tmp_path):
+    # Only the new and modified webpages are indexed, doc ids stay stable
+    indexer = Indexer(nlp=nlp)
+    indexer.run(pages_file, str(tmp_path), ["title"], use_pos=True, incremental=True)
+    pages = PAGES[1:] + [
+        {"url": "https://www.ensai.fr/d", "title": "Page des erreurs", "content": "D"}
+    ]
+    pages[1] = dict(pages[1], title="Nouvelle page")
+    with open(pages_file, "w", encoding="utf-8") as f:
+        json.dump(pages, f)
+    indexer.run(pages_file, str(tmp_path), ["title"], use_pos=True, incremental=True)
+    indexer.wait_for_merge()
+
+    with open(tmp_path / "manifest.json", encoding="utf-8") as f:
+        manifest = json.load(f)
+    with open(tmp_path / "docs.json", encoding="utf-8") as f:
+        registry = json.load(f)
+    assert [s["n_docs"] for s in manifest["segments"]] == [4, 2]
+    assert manifest["segments"][0]["deleted"] == [0, 2]
+    assert {url: entry[0] for url, entry in registry.items()} == {
+        "https://www.ensai.fr/a": 1,
+        "https://www.ensai.fr/b": 2,
+        "https://www.ensai.fr/c": 3,
+        "https://www.ensai.fr/d": 4,
+    }
+    segment = Segment(str(tmp_path / manifest["segments"][1]["files"]["title"]))
+    assert list(segment.doc_ids) == [2, 4]
+    assert segment.postings("pag") == ([2, 4], [1, 1])
+    segment.close()
+
+    # Running again without changes does not create a segment
+    indexer.run(pages_file, str(tmp_path), ["title"], use_pos=True, incremental=True)
+    with open(tmp_path / "manifest.json", encoding="utf-8") as f:
+        assert len(json.load(f)["segments"]) == 2
+
+
+def test_near_duplicates(nlp, pages_file, tmp_path):
+    # Only the first webpage of a set of near-duplicates is indexed
+    indexer = Indexer(nlp=nlp, near_duplicate_distance=3)
+    indexer.run(pages_file, str(tmp_path), ["title"], use_pos=True, incremental=True)
+    pages = PAGES + [dict(PAGES[2], url="https://www.ensai.fr/b?lang=fr")]
+    with open(pages_file, "w", encoding="utf-8") as f:
+        json.dump(pages, f)
+    indexer.run(pages_file, str(tmp_path), ["title"], use_pos=True, incremental=True)
+    with open(tmp_path / "docs.json", encoding="utf-8") as f:
+        assert list(json.load(f)) == [page["url"] for page in PAGES]
+
+    # A webpage indexed before its near-duplicate is deleted
+    with open(pages_file, "w", encoding="utf-8") as f:
+        json.dump([pages[-1]] + PAGES, f)
+    indexer.run(
+        pages_file,
+        str(tmp_path),
+        ["title"],
+        use_pos=True,
+        incremental=True,
+        delete_missing=False,
+    )
+    with open(tmp_path / "docs.json", encoding="utf-8") as f:
+        registry = json.load(f)
+    assert "https://www.ensai.fr/b" not in registry
+    assert registry["https://www.ensai.fr/b?lang=fr"][0] == 4
+
+
+def test_unsharded_run_removes_shards(nlp, pages_file, tmp_path):
+    # The single index replaces the sharded index of a previous run
+    indexer = Indexer(nlp=nlp)
+    indexer.run(pages_file, str(tmp_path), ["title"], use_pos=True, n_shards=2)
+    assert (tmp_path / "shards.json").exists()
+    indexer.run(pages_file, str(tmp_path), ["title"], use_pos=True)
+    indexer.wait_for_merge()
+    assert not (tmp_path / "shards.json").exists()
+    assert not any(path.name.startswith("shard") for path in tmp_path.iterdir())
+    assert (tmp_path / "manifest.json").exists()
+
+
+def test_merge_segments(nlp, pages_file, tmp_path):
+    # Merging drops the deleted documents and keeps the doc ids
+    indexer = Indexer(nlp=nlp, max_segments=1)
+    indexer.run(pages_file, str(tmp_path), ["title"], use_pos=True, incremental=True)
+    with open(pages_file, "w", encoding="utf-8") as f:
+        json.dump([dict(PAGES[3], title="Page perdue")] + PAGES[:3], f)
+    indexer.run(pages_file, str(tmp_path), ["title"], use_pos=True, incremental=True)
+    indexer.wait_for_merge()
+
+    with open(tmp_path / "manifest.json", encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert len(manifest["segments"]) == 1
+    assert manifest["segments"][0]["deleted"] == []
+    segment = Segment(str(tmp_path / manifest["segments"][0]["files"]["title"]))
+    assert segment.postings("erreur") == ([2], [1])
+    assert segment.postings("pag") == ([2, 3], [1, 1])
+    segment.close()
+    # The merged segments are removed
+    assert sorted(p.name for p in tmp_path.glob("*.seg")) == [
+        manifest["segments"][0]["files"]["title"]
+    ]
+
+    # The doc stores are merged along with the segments
+    assert [p.name for p in tmp_path.glob("*.store")] == [
+        manifest["segments"][0]["store"]
+    ]
+    store = DocStore(str(tmp_path / manifest["segments"][0]["store"]))
+    assert list(store.doc_ids) == [0, 1, 2, 3]
+    assert store.get(3)["title"] == "Page perdue"
+    store.close()
@@ -0,0 +1,31 @@
+import time
+from utils.lru import LRUCache
+
+
+def test_evicts_least_recently_used():
+    # The oldest unused entry goes first
+    cache = LRUCache(maxsize=2)
+    cache.put("erreur", "erreur")
+    cache.put("étudiant", "étudi")
+    cache.get("erreur")
+    cache.put("école", "écol")
+    assert "étudiant" not in cache
+    assert cache.get("erreur") == "erreur"
+
+
+def test_stats():
+    # Hits and misses are counted
+    cache = LRUCache()
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_ttl():
+    # Expired entries are misses
+    cache = LRUCache(ttl=0.01)
+    cache.put("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
@@ -0,0 +1,54 @@
+import pytest
+from utils.metrics import MetricsRegistry, profile
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry(enabled=True)
+
+
+def test_histogram_buckets(registry):
+    histogram = registry.histogram("stage_seconds", "Stages.", buckets=(0.1, 1.0))
+    for value in [0.05, 0.5, 0.5, 5.0]:
+        histogram.observe(value, stage="fetch")
+    lines = histogram.render()
+    assert 'stage_seconds_bucket{stage="fetch",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="fetch",le="1.0"} 3' in lines
+    assert 'stage_seconds_bucket{stage="fetch",le="+Inf"} 4' in lines
+    assert 'stage_seconds_sum{stage="fetch"} 6.05' in lines
+    assert 'stage_seconds_count{stage="fetch"} 4' in lines
+
+
+def test_disabled_registry_records_nothing(registry):
+    registry.enabled = False
+    histogram = registry.histogram("stage_seconds", "Stages.")
+    counter = registry.counter("pages_total", "Pages.")
+    with histogram.time(stage="parse"):
+        pass
+    histogram.observe(1.0, stage="parse")
+    counter.inc(outcome="crawled")
+    assert histogram.series == {} and counter.series == {}
+
+
+def test_metrics_are_shared_by_name(registry):
+    counter = registry.counter("pages_total", "Pages.")
+    assert registry.counter("pages_total", "Pages.") is counter
+    counter.inc(outcome="crawled")
+    counter.inc(2, outcome="crawled")
+    assert 'pages_total{outcome="crawled"} 3' in registry.render()
+
+
+def test_profile_without_metrics(registry):
+    # A profiled request gets its stage times even when the metrics are disabled
+    registry.enabled = False
+    histogram = registry.histogram("stage_seconds", "Stages.")
+    token = profile.set({})
+    try:
+        for _ in range(2):
+            with histogram.time(stage="score"):
+                pass
+        stages = profile.get()
+    finally:
+        profile.reset(token)
+    assert list(stages) == ["score"] and stages["score"] >= 0
+    assert histogram.series == {}
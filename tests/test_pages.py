@@ -0,0 +1,72 @@
+import gzip
+import pytest
+from backend.pages import PageLog, iter_pages, page_files, shard_path
+
+PAGES = [
+    {"url": "https://www.ensai.fr/", "title": "Accueil", "time": 1.0},
+    {"url": "https://www.ensai.fr/a", "title": "École", "time": 2.0},
+]
+
+
+@pytest.mark.parametrize("name", ["pages.jsonl", "pages.jsonl.gz"])
+def test_page_log(tmp_path, name):
+    path = str(tmp_path / name)
+    log = PageLog(path)
+    for page in PAGES:
+        log.write(page)
+    log.close()
+    assert list(iter_pages(path)) == PAGES
+    assert list(iter_pages(path, limit=1)) == PAGES[:1]
+
+    # Resuming appends to the log
+    log = PageLog(path, resume=True)
+    assert log.visited == {"https://www.ensai.fr/": 1.0, "https://www.ensai.fr/a": 2.0}
+    log.write({"url": "https://www.ensai.fr/b", "title": "Erreur", "time": 3.0})
+    log.close()
+    assert len(list(iter_pages(path))) == 3
+
+
+def test_page_log_truncated(tmp_path):
+    # A page cut by a crash is dropped before new pages are appended
+    path = str(tmp_path / "pages.jsonl")
+    log = PageLog(path)
+    log.write(PAGES[0])
+    log.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"url": "https://www.ensai.fr/a", "ti')
+    assert list(iter_pages(path)) == PAGES[:1]
+    log = PageLog(path, resume=True)
+    log.write(PAGES[1])
+    log.close()
+    assert list(iter_pages(path)) == PAGES
+
+
+def test_page_log_truncated_gzip(tmp_path):
+    path = str(tmp_path / "pages.jsonl.gz")
+    log = PageLog(path)
+    log.write(PAGES[0])
+    log.flush()
+    # The gzip stream is not closed, as after a crash
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data)
+    assert list(iter_pages(path)) == PAGES[:1]
+    log = PageLog(path, resume=True)
+    log.write(PAGES[1])
+    log.close()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+
+
+def test_page_log_shards(tmp_path):
+    # The shards of a partitioned crawl are read as a single log, in order
+    path = str(tmp_path / "pages.jsonl.gz")
+    assert shard_path(path, 2) == str(tmp_path / "pages.part2.jsonl.gz")
+    for shard, page in zip([10, 2], PAGES):
+        log = PageLog(shard_path(path, shard))
+        log.write(page)
+        log.close()
+    assert page_files(path) == [shard_path(path, 2), shard_path(path, 10)]
+    assert list(iter_pages(path)) == PAGES[::-1]
+    assert list(iter_pages(path, limit=1)) == PAGES[1:]
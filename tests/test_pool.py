@@ -0,0 +1,37 @@
+import asyncio
+import pytest
+from contextvars import ContextVar
+from threading import Event
+from utils.pool import BoundedPool, PoolSaturated
+
+
+def test_runs_tasks():
+    pool = BoundedPool(n_threads=2, max_pending=4)
+    assert asyncio.run(pool.run(sum, [1, 2, 3])) == 6
+    pool.shutdown()
+
+
+def test_rejects_when_saturated():
+    # Tasks beyond max_pending are rejected instead of queued
+    pool = BoundedPool(n_threads=1, max_pending=2)
+    release = Event()
+    futures = [pool.submit(release.wait) for _ in range(2)]
+    with pytest.raises(PoolSaturated):
+        pool.submit(release.wait)
+    assert pool.n_rejected == 1
+
+    # The slots are freed once the tasks are done
+    release.set()
+    for future in futures:
+        future.result()
+    pool.submit(sum, [1]).result()
+    pool.shutdown()
+
+
+def test_tasks_see_context_variables():
+    # The tasks run in the context of the caller, e.g. the profile of a request
+    variable = ContextVar("variable", default=None)
+    pool = BoundedPool(n_threads=1, max_pending=1)
+    variable.set("request")
+    assert pool.submit(variable.get).result() == "request"
+    pool.shutdown()
@@ -0,0 +1,71 @@
+import numpy as np
+from backend.positions import (
+    intersect_sorted,
+    min_distances,
+    parse_query,
+    phrase_matches,
+)
+from backend.segment import DictIndex, Segment, write_segment
+
+TITLES = {
+    "erreur": {0: [0], 1: [0, 2], 3: [1, 3]},
+    "pag": {1: [1], 2: [0], 3: [0, 2]},
+    "introuvable": {1: [3], 3: [4]},
+}
+
+
+def test_parse_query():
+    assert parse_query('inscription "page introuvable" ensai') == (
+        "inscription   ensai",
+        ["page introuvable"],
+    )
+    # An unclosed quote runs until the end of the query
+    assert parse_query('"page introuvable') == ("", ["page introuvable"])
+    assert parse_query('"" ensai') == ("ensai", [])
+
+
+def test_intersect_sorted():
+    a = np.array([1, 3, 5, 7, 100])
+    b = np.array([0, 3, 4, 7, 8, 9, 101])
+    assert intersect_sorted(a, b).tolist() == [3, 7]
+    assert intersect_sorted(b, a).tolist() == [3, 7]
+    assert intersect_sorted(a, np.zeros(0, dtype=np.int64)).tolist() == []
+
+
+def test_phrase_matches(tmp_path):
+    # "pag erreur" occurs once in document 1 and twice in document 3
+    write_segment(str(tmp_path / "title.seg"), TITLES, [1, 4, 1, 5])
+    segment = Segment(str(tmp_path / "title.seg"))
+    index = DictIndex(TITLES)
+    for source in [segment, index]:
+        positions = [source.positions_array(t) for t in ["erreur", "pag"]]
+        doc_ids, counts = phrase_matches(positions)
+        assert doc_ids.tolist() == [1, 3] and counts.tolist() == [1, 1]
+        positions = [source.positions_array(t) for t in ["pag", "erreur"]]
+        doc_ids, counts = phrase_matches(positions)
+        assert doc_ids.tolist() == [1, 3] and counts.tolist() == [1, 2]
+        positions = [source.positions_array(t) for t in ["introuvable", "pag"]]
+        assert phrase_matches(positions)[0].tolist() == []
+    segment.close()
+
+
+def test_positions_array_among(tmp_path):
+    # Restricting the documents gives the same positions as filtering them all
+    write_segment(str(tmp_path / "title.seg"), TITLES, [1, 4, 1, 5])
+    segment = Segment(str(tmp_path / "title.seg"))
+    doc_ids, tfs, positions = segment.positions_array("erreur", np.array([1, 2]))
+    assert doc_ids.tolist() == [1] and tfs.tolist() == [2]
+    assert positions.tolist() == [0, 2]
+    segment.close()
+
+
+def test_min_distances():
+    index = DictIndex(TITLES)
+    doc_ids, distances = min_distances(
+        index.positions_array("erreur"), index.positions_array("introuvable")
+    )
+    assert doc_ids.tolist() == [1, 3] and distances.tolist() == [1, 1]
+    doc_ids, distances = min_distances(
+        index.positions_array("pag"), index.positions_array("introuvable")
+    )
+    assert doc_ids.tolist() == [1, 3] and distances.tolist() == [2, 2]
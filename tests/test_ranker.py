@@ -0,0 +1,387 @@
+import json
+import pytest
+from backend.indexer import Indexer
+from backend.ranker import Ranker, StaleShardError, shard_view
+from utils import metrics
+
+PAGES = [
+    {
+        "url": "https://www.ensai.fr/",
+        "title": "Accueil de l'ENSAI",
+        "content": "Bienvenue",
+    },
+    {
+        "url": "https://www.ensai.fr/a",
+        "title": "Les étudiants de l'école",
+        "content": "A",
+    },
+    {
+        "url": "https://www.ensai.fr/b",
+        "title": "Erreur : page introuvable",
+        "content": "B",
+    },
+    {
+        "url": "https://www.ensai.fr/c",
+        "title": "Erreur, erreur, page perdue",
+        "content": "C",
+    },
+]
+
+
+@pytest.fixture
+def index_dir(nlp, tmp_path):
+    # Index the pages in a temporary directory
+    pages_file = tmp_path / "crawled_urls.json"
+    pages_file.write_text(json.dumps(PAGES), encoding="utf-8")
+    Indexer(nlp=nlp).run(str(pages_file), str(tmp_path), ["title"], use_pos=True)
+    return tmp_path
+
+
+@pytest.fixture
+def ranker(nlp, index_dir):
+    fields = {
+        "title": {"weight": 1, "index-file": str(index_dir / "title.pos_index.seg")}
+    }
+    return Ranker(
+        str(index_dir / "crawled_urls.json"),
+        fields,
+        term_cache=str(index_dir / "term_cache.json"),
+        nlp=nlp,
+    )
+
+
+def test_run(ranker):
+    # Pages are ranked by the frequency of the query terms
+    results = ranker.run("erreurs de page")
+    assert [page["url"] for page in results] == [
+        "https://www.ensai.fr/c",
+        "https://www.ensai.fr/b",
+    ]
+
+
+def test_term_cache_warm_loaded(ranker):
+    # The lemmas seen at indexing time are already normalized
+    assert ranker.analyzer.term_cache.get("erreur") == "erreur"
+    assert len(ranker.analyzer.term_cache) > 0
+
+
+def test_repeated_queries_are_cached(ranker):
+    # A repeated query does not go through the pipeline again
+    ranker.run("étudiants")
+    ranker.run("étudiants")
+    assert ranker.analyzer.cache_stats()["query"]["hits"] == 1
+
+
+def test_run_across_segments(nlp, index_dir):
+    # Modified webpages are only found with their new content
+    indexer = Indexer(nlp=nlp)
+    pages_file = str(index_dir / "crawled_urls.json")
+    indexer.run(pages_file, str(index_dir), ["title"], use_pos=True, incremental=True)
+    pages = PAGES[:3] + [dict(PAGES[3], title="Page perdue")]
+    with open(pages_file, "w", encoding="utf-8") as f:
+        json.dump(pages, f)
+    indexer.run(pages_file, str(index_dir), ["title"], use_pos=True, incremental=True)
+    indexer.wait_for_merge()
+
+    fields = {"title": {"weight": 1, "index-file": "unused"}}
+    ranker = Ranker(
+        pages_file, fields, nlp=nlp, manifest=str(index_dir / "manifest.json")
+    )
+    assert [page["url"] for page in ranker.run("erreur")] == ["https://www.ensai.fr/b"]
+    assert [page["title"] for page in ranker.run("perdue")] == ["Page perdue"]
+    # The results come from the doc stores, the pages file is never loaded
+    assert ranker.pages is None
+
+
+@pytest.mark.parametrize("scoring", ["frequency", "bm25", "bm25f"])
+def test_modified_page_in_later_segment(nlp, index_dir, scoring):
+    # A modified webpage keeps its doc id in a newer segment, before the new webpages
+    indexer = Indexer(nlp=nlp)
+    pages_file = str(index_dir / "crawled_urls.json")
+    indexer.run(pages_file, str(index_dir), ["title"], use_pos=True, incremental=True)
+    pages = [dict(PAGES[0], title="Page d'erreur de l'ENSAI")] + PAGES[1:]
+    pages += [{"url": "https://www.ensai.fr/d", "title": "Le campus", "content": ""}]
+    with open(pages_file, "w", encoding="utf-8") as f:
+        json.dump(pages, f)
+    indexer.run(pages_file, str(index_dir), ["title"], use_pos=True, incremental=True)
+    indexer.wait_for_merge()
+
+    fields = {"title": {"weight": 1, "index-file": "unused"}}
+    ranker = Ranker(
+        None,
+        fields,
+        nlp=nlp,
+        scoring=scoring,
+        manifest=str(index_dir / "manifest.json"),
+    )
+    view = ranker.index.get()
+    assert len(view.segments) == 2
+    results = ranker.rank_docs(["erreur", "pag"], view=view)
+    assert {view.doc_urls[doc_id] for doc_id, _ in results} == {
+        "https://www.ensai.fr/",
+        "https://www.ensai.fr/b",
+        "https://www.ensai.fr/c",
+    }
+    assert [score for _, score in results] == sorted(
+        (score for _, score in results), reverse=True
+    )
+
+
+@pytest.mark.parametrize("shard_processes", [0, 2])
+def test_sharded_search(nlp, tmp_path, shard_processes):
+    # The shards are scored with the statistics of the whole index, like a single index
+    pages = PAGES + [
+        {"url": f"https://www.ensai.fr/{i}", "title": title, "content": ""}
+        for i, title in enumerate(["Page d'erreur", "Les erreurs", "Une page"])
+    ]
+    pages_file = tmp_path / "crawled_urls.json"
+    pages_file.write_text(json.dumps(pages), encoding="utf-8")
+    indexer = Indexer(nlp=nlp)
+    for output_dir, n_shards in [(tmp_path / "single", 1), (tmp_path, 3)]:
+        output_dir.mkdir(exist_ok=True)
+        indexer.run(
+            str(pages_file), str(output_dir), ["title"], use_pos=True, n_shards=n_shards
+        )
+
+    fields = {"title": {"weight": 1, "index-file": "unused"}}
+    single = Ranker(
+        None, fields, nlp=nlp, manifest=str(tmp_path / "single" / "manifest.json")
+    )
+    sharded = Ranker(
+        None,
+        fields,
+        nlp=nlp,
+        shards=str(tmp_path / "shards.json"),
+        shard_processes=shard_processes,
+    )
+    try:
+        view = sharded.index.get()
+        assert view.n_shards == 3 and view.n_docs == len(pages)
+        single_view = single.index.get()
+        for query in [["erreur", "page"], ["étudiant"]]:
+            # Equal scores are ordered by doc id, which differ between the two indexes
+            expected = single.rank_docs(query, view=single_view)
+            results = sharded.rank_docs(query, view=view)
+            assert {view.doc_urls[doc_id]: score for doc_id, score in results} == (
+                pytest.approx(
+                    {single_view.doc_urls[doc_id]: score for doc_id, score in expected}
+                )
+            )
+        assert [page["url"] for page in sharded.run("perdue")] == [
+            page["url"] for page in single.run("perdue")
+        ]
+    finally:
+        if sharded.shard_pool is not None:
+            sharded.shard_pool.shutdown()
+
+
+def test_sharded_bm25f_fields(nlp, tmp_path):
+    # The first shard only has the titles containing erreur, which is more frequent in
+    # the contents of the whole index
+    pages = [
+        {"url": f"https://www.ensai.fr/{i}", "title": title, "content": content}
+        for i, (title, content) in enumerate(
+            [
+                ("Page d'erreur", "Accueil"),
+                ("Les étudiants", "Accueil"),
+                ("Une page", "Erreur, erreur"),
+                ("Accueil", "Erreur de page"),
+                ("Accueil", "Une erreur"),
+                ("Les étudiants", "Une page d'erreur"),
+                ("Erreur", "Les étudiants"),
+            ]
+        )
+    ]
+    pages_file = tmp_path / "crawled_urls.json"
+    pages_file.write_text(json.dumps(pages), encoding="utf-8")
+    indexer = Indexer(nlp=nlp)
+    for output_dir, n_shards in [(tmp_path / "single", 1), (tmp_path, 3)]:
+        output_dir.mkdir(exist_ok=True)
+        indexer.run(
+            str(pages_file),
+            str(output_dir),
+            ["title", "content"],
+            use_pos=True,
+            n_shards=n_shards,
+        )
+
+    fields = {
+        "title": {"weight": 2, "index-file": "unused"},
+        "content": {"weight": 1, "index-file": "unused"},
+    }
+    single = Ranker(
+        None,
+        fields,
+        nlp=nlp,
+        scoring="bm25f",
+        manifest=str(tmp_path / "single" / "manifest.json"),
+    )
+    sharded = Ranker(
+        None, fields, nlp=nlp, scoring="bm25f", shards=str(tmp_path / "shards.json")
+    )
+    view, single_view = sharded.index.get(), single.index.get()
+    for query in [["erreur"], ["erreur", "pag"], ["étudiant", "accueil"]]:
+        expected = single.rank_docs(query, view=single_view)
+        results = sharded.rank_shards(query, None, (), view)
+        assert {view.doc_urls[doc_id]: score for doc_id, score in results} == (
+            pytest.approx(
+                {single_view.doc_urls[doc_id]: score for doc_id, score in expected}
+            )
+        )
+
+
+def test_shard_view_versions(nlp, index_dir):
+    # A shard is scored in the version the Ranker resolved, even after a reindex
+    indexer = Indexer(nlp=nlp)
+    pages_file = str(index_dir / "crawled_urls.json")
+    indexer.run(pages_file, str(index_dir), ["title"], use_pos=True, incremental=True)
+    manifest = str(index_dir / "manifest.json")
+    fields = {"title": {"weight": 1, "index-file": "unused"}}
+    ranker = Ranker(None, fields, nlp=nlp, manifest=manifest, reload_interval=3600)
+    old = ranker.index.get()
+    with open(pages_file, "w", encoding="utf-8") as f:
+        json.dump(PAGES[:3], f)
+    indexer.run(pages_file, str(index_dir), ["title"], use_pos=True, incremental=True)
+    indexer.wait_for_merge()
+
+    assert shard_view(ranker, manifest, old.version) is old
+    with open(manifest, encoding="utf-8") as f:
+        version = json.load(f)["version"]
+    new = shard_view(ranker, manifest, version)
+    assert new is not old and new.version == version > old.version
+    assert shard_view(ranker, manifest, old.version) is old
+    with pytest.raises(StaleShardError):
+        shard_view(ranker, manifest, old.version - 1)
+
+
+def test_search_snippets(nlp, tmp_path):
+    # The snippet shows the part of the content matching the query, with its highlights
+    content = "Les cours ont lieu sur le campus. " * 10 + "Le stage dure six mois."
+    pages_file = tmp_path / "crawled_urls.json"
+    pages_file.write_text(json.dumps([dict(PAGES[0], content=content)]))
+    Indexer(nlp=nlp).run(
+        str(pages_file), str(tmp_path), ["content"], use_pos=True, incremental=True
+    )
+    fields = {"content": {"weight": 1, "index-file": "unused"}}
+    ranker = Ranker(
+        str(pages_file),
+        fields,
+        term_cache=str(tmp_path / "term_cache.json"),
+        nlp=nlp,
+        manifest=str(tmp_path / "manifest.json"),
+        snippet_length=40,
+    )
+    (page,) = ranker.search("stages")
+    assert page["content"].endswith("Le stage dure six mois.")
+    assert "offsets" not in page
+    assert [page["content"][start:end] for start, end in page["highlights"]] == [
+        "stage"
+    ]
+
+
+def test_search_stream(ranker):
+    # The webpages are only fetched as the results are read
+    expected = ranker.search("erreur page", 0, None)
+    to_pages, calls = ranker.to_pages, []
+    ranker.to_pages = lambda ranked, view=None: calls.append(ranked) or to_pages(
+        ranked, view
+    )
+    pages = ranker.search_stream("erreur page")
+    assert calls == []
+    assert next(pages) == expected[0]
+    assert len(calls) == 1
+    assert [expected[0]] + list(pages) == expected
+
+
+def test_term_cache_reload(ranker, index_dir):
+    # The words saved by a new run of the Indexer are highlighted
+    path = index_dir / "term_cache.json"
+    cache = json.loads(path.read_text(encoding="utf-8"))
+    cache["words"].append(["mémoire", "memoir"])
+    path.write_text(json.dumps(cache), encoding="utf-8")
+    assert ranker.snippets.words_of("memoir") == []
+    ranker.term_cache.reload()
+    assert ranker.snippets.words_of("memoir") == ["mémoire"]
+
+
+def test_query_analysis_ignores_model_loading(ranker):
+    # The words seen while indexing are looked up, even once the model is loaded
+    assert ranker.analyzer.loaded
+    ranker.analyzer.word_cache.put("introuvables", "introuv")
+    assert ranker.analyzer.analyze_query("Introuvables") == ["introuv"]
+    assert ranker.analyzer.cache_stats()["word"]["hits"] > 0
+
+
+def test_search_profile(ranker):
+    # A profiled search gets the time of each of its stages
+    token = metrics.profile.set({})
+    try:
+        ranker.search("page introuvable")
+        stages = metrics.profile.get()
+    finally:
+        metrics.profile.reset(token)
+    assert {"analyze", "postings", "score", "docs", "snippets"} <= set(stages)
+
+
+def test_phrase_query(ranker):
+    # Only the pages containing the exact phrase are returned
+    results = ranker.run('erreur "page introuvable"')
+    assert [page["url"] for page in results] == ["https://www.ensai.fr/b"]
+    assert ranker.run('"introuvable page"') == []
+
+
+def test_proximity_boost(ranker):
+    # Page b has "erreur" and "introuvable" 2 positions apart, page c lacks "introuvable"
+    ranker.proximity = 2.0
+    segments = ranker.segments()
+    ranked = ranker.boost_proximity(
+        ["erreur", "introuv"], [(3, 1.5), (2, 1.0)], segments
+    )
+    assert ranked == [(2, 2.0), (3, 1.5)]
+
+
+def test_search_pages_are_cached(ranker):
+    # The pages of results come from a single scoring pass
+    expected = [page["url"] for page in ranker.run("erreur page")]
+    rank_docs, calls = ranker.rank_docs, []
+    ranker.rank_docs = lambda *args: calls.append(args[1]) or rank_docs(*args)
+    ranker.result_window = 2
+    first = ranker.search("erreur page", 0, 1)
+    second = ranker.search("erreur page", 1, 1)
+    assert [page["url"] for page in first + second] == expected
+    assert calls == [2]
+    # Past the window, a larger window is computed, which holds every result
+    assert ranker.search("erreur page", 2, 1) == []
+    assert ranker.search("erreur page", 5, 1) == []
+    assert calls == [2, 4]
+
+
+def test_search_cache_follows_index_version(ranker):
+    ranker.search("étudiants")
+    ranker.indexes["title"].reload()
+    ranker.search("étudiants")
+    assert ranker.results.stats() == {
+        "size": 2,
+        "hits": 0,
+        "misses": 2,
+        "hit_rate": 0,
+    }
+
+
+def test_query_without_model(index_dir):
+    # Words seen while indexing are analyzed without loading the SpaCy model
+    fields = {
+        "title": {"weight": 1, "index-file": str(index_dir / "title.pos_index.seg")}
+    }
+    ranker = Ranker(
+        str(index_dir / "crawled_urls.json"),
+        fields,
+        lem_model="not_installed_model",
+        term_cache=str(index_dir / "term_cache.json"),
+    )
+    results = ranker.run("Erreur de l'page")
+    assert [page["url"] for page in results] == [
+        "https://www.ensai.fr/c",
+        "https://www.ensai.fr/b",
+    ]
+    assert not ranker.analyzer.loaded
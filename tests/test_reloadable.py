@@ -0,0 +1,40 @@
+import json
+import os
+import time
+import pytest
+from utils.reloadable import ReloadableFile
+
+
+@pytest.fixture
+def json_file(tmp_path):
+    path = tmp_path / "index.json"
+    path.write_text(json.dumps({"erreur": {"0": [0]}}), encoding="utf-8")
+    return path
+
+
+def test_preloads_file(json_file):
+    # The file is parsed once at initialization
+    reloadable = ReloadableFile(json_file)
+    assert reloadable.get() == {"erreur": {"0": [0]}}
+
+
+def test_reloads_modified_file(json_file):
+    # A rewritten file is swapped in after a reload
+    reloadable = ReloadableFile(json_file, check_interval=0)
+    json_file.write_text(json.dumps({"ensai": {"1": [2]}}), encoding="utf-8")
+    os.utime(json_file, ns=(time.time_ns(), time.time_ns() + 10**9))
+
+    reloadable.get()
+    for _ in range(100):
+        if reloadable.n_reloads:
+            break
+        time.sleep(0.01)
+    assert reloadable.get() == {"ensai": {"1": [2]}}
+
+
+def test_keeps_value_on_invalid_file(json_file):
+    # A partially written file does not replace the resident value
+    reloadable = ReloadableFile(json_file)
+    json_file.write_text("{", encoding="utf-8")
+    reloadable.reload()
+    assert reloadable.get() == {"erreur": {"0": [0]}}
@@ -0,0 +1,42 @@
+from backend.robots import RobotsCache
+
+
+def test_store_parses_rules():
+    # Rules, crawl delay and sitemaps are read from the file
+    cache = RobotsCache()
+    entry = cache.store(
+        "http://ensai.fr/robots.txt",
+        200,
+        "User-agent: *\nCrawl-delay: 5\nDisallow: /admin\nSitemap: http://ensai.fr/sitemap.xml\n",
+    )
+    assert entry.can_fetch("http://ensai.fr/page")
+    assert not entry.can_fetch("http://ensai.fr/admin/page")
+    assert entry.crawl_delay == 5
+    assert entry.sitemaps == ["http://ensai.fr/sitemap.xml"]
+
+
+def test_status_codes():
+    # Missing files allow everything, forbidden ones and server errors nothing
+    cache = RobotsCache()
+    assert cache.store("http://a.fr/robots.txt", 404, "").can_fetch("http://a.fr/x")
+    assert not cache.store("http://b.fr/robots.txt", 403, "").can_fetch("http://b.fr/x")
+    assert not cache.store("http://c.fr/robots.txt", 503, "").can_fetch("http://c.fr/x")
+
+
+def test_connection_errors_are_retried():
+    # An unreachable host is not blocked, and its file is downloaded again next time
+    cache = RobotsCache()
+    assert cache.store("http://a.fr/robots.txt", None, "").can_fetch("http://a.fr/x")
+    assert cache.lookup("http://a.fr/x") is None
+
+
+def test_lookup_hits_and_expiry():
+    # Cached entries are served until they expire
+    cache = RobotsCache(ttl=0)
+    cache.store("http://ensai.fr/robots.txt", 200, "")
+    assert cache.lookup("http://ensai.fr/page") is None
+
+    cache = RobotsCache(ttl=60)
+    cache.store("http://ensai.fr/robots.txt", 200, "")
+    assert cache.lookup("http://ensai.fr/page") is not None
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,219 @@
+import math
+import numpy as np
+import pytest
+from backend.scoring import Scorer, scatter_add
+from backend.segment import (
+    DictIndex,
+    Segment,
+    SegmentWriter,
+    decode_varints,
+    decode_varints_array,
+    encode_varints,
+    write_segment,
+)
+
+TITLES = {
+    "erreur": {0: [0], 1: [0, 2], 3: [1]},
+    "pag": {1: [1], 2: [0], 3: [0]},
+}
+CONTENTS = {
+    "erreur": {2: [3], 3: [0, 1, 4]},
+    "ensai": {0: [0, 1], 2: [0]},
+}
+TITLE_LENGTHS = [1, 3, 2, 2]
+CONTENT_LENGTHS = [2, 1, 4, 6]
+
+
+@pytest.fixture
+def segments(tmp_path):
+    write_segment(str(tmp_path / "title.seg"), TITLES, TITLE_LENGTHS)
+    write_segment(str(tmp_path / "content.seg"), CONTENTS, CONTENT_LENGTHS)
+    indexes = {
+        "title": Segment(str(tmp_path / "title.seg")),
+        "content": Segment(str(tmp_path / "content.seg")),
+    }
+    yield [(indexes, np.zeros(0, dtype=np.int64))]
+    for index in indexes.values():
+        index.close()
+
+
+def reference_bm25(terms, fields, n_docs, k1=1.2, b=0.75):
+    # Straightforward BM25 summed over the fields, one document at a time
+    scores = {}
+    for field, (index, lengths, weight) in fields.items():
+        avg_length = sum(lengths) / n_docs
+        for term in terms:
+            postings = index.get(term, {})
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, positions in postings.items():
+                tf = len(positions)
+                norm = 1 - b + b * lengths[doc_id] / avg_length
+                score = weight * idf * tf * (k1 + 1) / (tf + k1 * norm)
+                scores[doc_id] = scores.get(doc_id, 0) + score
+    return scores
+
+
+def test_decode_varints_array():
+    # The vectorized decoding matches the scalar one
+    values = [0, 1, 127, 128, 300, 2**20, 2**32 - 1, 5]
+    buf = bytearray()
+    encode_varints(values, buf)
+    decoded = decode_varints_array(bytes(buf) + b"\x07\x80", len(values))
+    assert decoded.tolist() == decode_varints(buf, 0, len(values))[0]
+
+
+def test_postings_array(segments):
+    # Binary and JSON indexes decode the same arrays
+    segment = segments[0][0]["title"]
+    doc_ids, tfs = segment.postings_array("erreur")
+    assert doc_ids.tolist() == [0, 1, 3] and tfs.tolist() == [1, 2, 1]
+    expected = DictIndex({"erreur": {"0": [0], "1": [0, 2], "3": [1]}})
+    assert [a.tolist() for a in expected.postings_array("erreur")] == [
+        [0, 1, 3],
+        [1, 2, 1],
+    ]
+    assert segment.lengths_of(doc_ids).tolist() == [1, 3, 2]
+
+
+def test_bm25_matches_reference(segments):
+    # The vectorized scores are the ones of the textbook formula
+    fields = {"title": {"weight": 2}, "content": {"weight": 1}}
+    scorer = Scorer(fields, "bm25")
+    avg_lengths = {"title": 2, "content": 3.25}
+    doc_ids, scores = scorer.score(["erreur", "pag"], segments, 4, avg_lengths)
+    expected = reference_bm25(
+        ["erreur", "pag"],
+        {
+            "title": (TITLES, TITLE_LENGTHS, 2),
+            "content": (CONTENTS, CONTENT_LENGTHS, 1),
+        },
+        4,
+    )
+    assert doc_ids.tolist() == sorted(expected)
+    assert scores.tolist() == pytest.approx([expected[d] for d in sorted(expected)])
+
+
+def test_bm25f_saturates_across_fields(segments):
+    # A term repeated in every field is saturated once, not once per field
+    fields = {"title": {"weight": 1}, "content": {"weight": 1}}
+    avg_lengths = {"title": 2, "content": 3.25}
+    bm25f = Scorer(fields, "bm25f")
+    doc_ids, scores = bm25f.score(["erreur"], segments, 4, avg_lengths)
+    ranked = bm25f.top(doc_ids, scores)
+    assert [doc_id for doc_id, _ in ranked] == [3, 0, 1, 2]
+    # The document frequency is the highest one of the fields
+    assert all(score < 2.2 * math.log(1 + 1.5 / 3.5) for _, score in ranked)
+
+
+def test_deleted_documents_are_skipped(segments):
+    # Tombstoned documents never get a score
+    indexes, _ = segments[0]
+    scorer = Scorer({"title": {"weight": 1}}, "frequency")
+    doc_ids, scores = scorer.score(["erreur"], [(indexes, np.array([1]))], 4, {})
+    assert doc_ids.tolist() == [0, 3] and scores.tolist() == [1, 1]
+
+
+def test_scatter_add_sorts():
+    # The doc ids are sorted and unique, even from a single contribution
+    ids, values = scatter_add([(np.array([5, 1, 3]), np.array([1, 2, 3]))])
+    assert ids.tolist() == [1, 3, 5] and values.tolist() == [2, 3, 1]
+    ids, values = scatter_add(
+        [(np.array([5, 1]), np.array([1.0, 2.0])), (np.array([3, 1]), np.ones(2))]
+    )
+    assert ids.tolist() == [1, 3, 5] and values.tolist() == [3, 1, 1]
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        Scorer({"title": {"weight": 1}}, "tfidf")
+
+
+def build_corpus(tmp_path, segment_doc_ids):
+    # Segments of random documents with the given doc ids
+    rng = np.random.default_rng(0)
+    vocabulary = ["erreur"] * 20 + ["pag", "ensai", "école", "étudiant", "rennes"]
+    segments = []
+    for rank, doc_ids in enumerate(segment_doc_ids):
+        indexes = {}
+        for field, length in [("title", 4), ("content", 30)]:
+            docs = {d: rng.choice(vocabulary, rng.integers(1, length)) for d in doc_ids}
+            writer = SegmentWriter(str(tmp_path / f"{field}.{rank}.seg"))
+            for term in sorted(set(vocabulary)):
+                postings = [
+                    (d, [p for p, t in enumerate(doc) if t == term])
+                    for d, doc in docs.items()
+                ]
+                writer.add(term, [(d, p) for d, p in postings if p])
+            writer.close([len(doc) for doc in docs.values()], list(doc_ids))
+            indexes[field] = Segment(str(tmp_path / f"{field}.{rank}.seg"))
+        segments.append(indexes)
+    return segments
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    # Two segments of random documents, the second one replacing some of the first
+    segments = build_corpus(tmp_path, [range(0, 600), range(400, 900)])
+    yield [
+        (segments[0], np.arange(400, 600)),
+        (segments[1], np.zeros(0, dtype=np.int64)),
+    ]
+    for indexes in segments:
+        for index in indexes.values():
+            index.close()
+
+
+@pytest.fixture
+def modified_corpus(tmp_path):
+    # Modified documents keep their doc ids in the later segments, before new documents
+    doc_ids = [range(0, 600), list(range(100, 200)) + list(range(600, 700))]
+    segments = build_corpus(tmp_path, doc_ids + [range(300, 350)])
+    yield [
+        (segments[0], np.concatenate([np.arange(100, 200), np.arange(300, 350)])),
+        (segments[1], np.zeros(0, dtype=np.int64)),
+        (segments[2], np.zeros(0, dtype=np.int64)),
+    ]
+    for indexes in segments:
+        for index in indexes.values():
+            index.close()
+
+
+def test_postings_among(corpus):
+    # Decoding only some blocks gives the same postings as decoding them all
+    segment = corpus[0][0]["content"]
+    doc_ids, tfs = segment.postings_array("erreur")
+    among = np.array([3, 150, 151, 399, 599, 1000])
+    ids, frequencies = segment.postings_among("erreur", among)
+    expected = np.isin(doc_ids, among)
+    assert ids.tolist() == doc_ids[expected].tolist()
+    assert frequencies.tolist() == tfs[expected].tolist()
+
+
+@pytest.mark.parametrize("method", ["frequency", "bm25", "bm25f"])
+@pytest.mark.parametrize("n_results", [1, 10, 100])
+def test_top_k_matches_exhaustive(corpus, method, n_results):
+    # Pruning never changes the results
+    fields = {"title": {"weight": 3}, "content": {"weight": 1}}
+    scorer = Scorer(fields, method)
+    avg_lengths = {"title": 2, "content": 15}
+    for query in [["erreur"], ["erreur", "pag"], ["école", "erreur", "rennes"]]:
+        doc_ids, scores = scorer.score(query, corpus, 1100, avg_lengths)
+        expected = scorer.top(doc_ids, scores, n_results)
+        actual = scorer.top_k(query, corpus, 1100, avg_lengths, n_results)
+        assert [d for d, _ in actual] == [d for d, _ in expected]
+        assert [s for _, s in actual] == pytest.approx([s for _, s in expected])
+
+
+@pytest.mark.parametrize("method", ["frequency", "bm25", "bm25f"])
+@pytest.mark.parametrize("n_results", [1, 10, 100])
+def test_top_k_matches_exhaustive_modified(modified_corpus, method, n_results):
+    # The postings of modified documents come after the ones of later doc ids
+    scorer = Scorer({"content": {"weight": 1}}, method)
+    avg_lengths = {"content": 15}
+    for query in [["erreur"], ["erreur", "pag"], ["école", "erreur", "rennes"]]:
+        doc_ids, scores = scorer.score(query, modified_corpus, 700, avg_lengths)
+        assert (np.diff(doc_ids) > 0).all()
+        expected = scorer.top(doc_ids, scores, n_results)
+        actual = scorer.top_k(query, modified_corpus, 700, avg_lengths, n_results)
+        assert [d for d, _ in actual] == [d for d, _ in expected]
+        assert [s for _, s in actual] == pytest.approx([s for _, s in expected])
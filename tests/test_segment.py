@@ -0,0 +1,80 @@
+import pytest
+from backend.segment import (
+    DictIndex,
+    Segment,
+    decode_varints,
+    SegmentWriter,
+    encode_varints,
+    load_index,
+    write_segment,
+)
+
+
+@pytest.fixture
+def pos_index():
+    # {lemma: {doc_id: [positions]}} as built by Indexer.create_index
+    return {
+        "erreur": {0: [0], 1: [0, 3], 2: [5]},
+        "ensai": {1: [1], 300: [0]},
+        "école": {2: [0, 1, 2, 200]},
+    }
+
+
+def test_varints_roundtrip():
+    # Small and large integers survive the encoding
+    values = [0, 1, 127, 128, 300, 2**35]
+    buf = bytearray()
+    encode_varints(values, buf)
+    assert decode_varints(buf, 0, len(values)) == (values, len(buf))
+
+
+def test_segment_roundtrip(tmp_path, pos_index):
+    # The segment holds the same postings as the dictionary index
+    path = str(tmp_path / "title.pos_index.seg")
+    write_segment(path, pos_index, [4, 2, 5] + [0] * 297 + [1])
+    segment = load_index(path)
+    assert isinstance(segment, Segment)
+    assert segment.n_docs == 301 and len(segment) == 3
+    assert list(segment.terms()) == ["ensai", "erreur", "école"]
+    assert segment.postings("erreur") == ([0, 1, 2], [1, 2, 1])
+    assert segment.positions("école") == {2: [0, 1, 2, 200]}
+    assert segment.doc_freq("ensai") == 2
+    assert segment.doc_lengths[1] == 2
+    assert "noodle" not in segment
+    assert segment.postings("noodle") == ([], [])
+    assert segment.to_dict()["ensai"] == {"1": [1], "300": [0]}
+    segment.close()
+
+
+def test_non_positional_segment(tmp_path):
+    # Repeated doc ids of a non-positional index become term frequencies
+    path = str(tmp_path / "title.non_pos_index.seg")
+    write_segment(path, {"erreur": [0, 1, 1, 4]}, [1, 2, 0, 0, 1], positional=False)
+    segment = Segment(path)
+    assert not segment.positional
+    assert segment.postings("erreur") == ([0, 1, 4], [1, 2, 1])
+    assert segment.to_dict() == {"erreur": [0, 1, 1, 4]}
+    segment.close()
+
+
+def test_sparse_doc_ids(tmp_path):
+    # A segment of an incremental run only holds some documents
+    path = str(tmp_path / "title.pos_index.00001.seg")
+    writer = SegmentWriter(path)
+    writer.add("erreur", [(7, [0]), (42, [1, 2])])
+    writer.close([1, 3], [7, 42])
+    segment = Segment(path)
+    assert list(segment.doc_ids) == [7, 42]
+    assert segment.doc_length(42) == 3 and segment.doc_length(8) == 0
+    assert list(segment.items()) == [("erreur", [(7, [0]), (42, [1, 2])])]
+    segment.close()
+
+
+def test_dict_index_matches_segment(tmp_path, pos_index):
+    # The JSON index exposes the same interface as the binary one
+    index = DictIndex(
+        {t: {str(d): p for d, p in v.items()} for t, v in pos_index.items()}
+    )
+    assert index.postings("erreur") == ([0, 1, 2], [1, 2, 1])
+    assert index.positions("ensai") == {1: [1], 300: [0]}
+    assert index.doc_lengths[1] == 3
@@ -0,0 +1,46 @@
+import gzip
+import io
+from backend.sitemap import iter_sitemap, parse_lastmod
+
+URLSET = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+    b"<url><loc>https://www.ensai.fr/a</loc><lastmod>2024-02-14</lastmod></url>"
+    b"<url><loc> https://www.ensai.fr/b </loc></url>"
+    b"</urlset>"
+)
+
+
+def test_iter_urlset():
+    # Pages are read with their lastmod
+    entries = list(iter_sitemap(io.BytesIO(URLSET)))
+    assert entries == [
+        ("url", "https://www.ensai.fr/a", parse_lastmod("2024-02-14")),
+        ("url", "https://www.ensai.fr/b", 0),
+    ]
+
+
+def test_iter_gzipped_sitemap():
+    # Gzipped sitemaps are detected from their content
+    entries = list(iter_sitemap(io.BytesIO(gzip.compress(URLSET))))
+    assert [loc for _, loc, _ in entries] == [
+        "https://www.ensai.fr/a",
+        "https://www.ensai.fr/b",
+    ]
+
+
+def test_iter_sitemap_index():
+    # Nested sitemaps of an index are reported as such
+    index = (
+        b"<sitemapindex><sitemap><loc>https://www.ensai.fr/s1.xml.gz</loc>"
+        b"<lastmod>2024-01-01T10:00:00Z</lastmod></sitemap></sitemapindex>"
+    )
+    kind, loc, lastmod = next(iter_sitemap(io.BytesIO(index)))
+    assert (kind, loc) == ("sitemap", "https://www.ensai.fr/s1.xml.gz")
+    assert lastmod == parse_lastmod("2024-01-01T10:00:00+00:00")
+
+
+def test_parse_lastmod_invalid():
+    # Invalid dates get the lowest priority
+    assert parse_lastmod("yesterday") == 0
+    assert parse_lastmod(None) == 0
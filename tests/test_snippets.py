@@ -0,0 +1,54 @@
+from backend.analyzer import Analyzer
+from backend.snippets import SnippetGenerator, decode_offsets, encode_offsets
+
+TEXT = (
+    "Bienvenue sur le site de l'école. Les étudiants suivent des cours de statistique "
+    "et d'informatique. Le master propose un stage en entreprise aux étudiants, suivi "
+    "d'un mémoire de recherche en statistique."
+)
+
+
+def snippet_generator(length):
+    # The words seen while indexing are in the word cache of the analyzer
+    analyzer = Analyzer(nlp=object())
+    analyzer.word_cache.update(
+        [("étudiants", "etudi"), ("étudiant", "etudi"), ("stage", "stag"), ("le", "")]
+    )
+    return SnippetGenerator(analyzer, length)
+
+
+def test_offsets():
+    starts, ends = decode_offsets(encode_offsets("L'école, 2024 : été"))
+    assert starts.tolist() == [0, 2, 16]
+    assert ends.tolist() == [1, 7, 19]
+    assert len(decode_offsets(encode_offsets(""))[0]) == 0
+
+
+def test_snippet_window():
+    generator = snippet_generator(60)
+    snippet, highlights = generator.snippet(
+        TEXT, encode_offsets(TEXT), ["etudi", "stag"], "étudiant stage"
+    )
+    # The window holding both terms is chosen, cut at word boundaries
+    assert snippet.startswith("...") and snippet.endswith("...")
+    assert len(snippet) <= 60 + 6
+    words = [snippet[start:end] for start, end in highlights]
+    assert words == ["stage", "étudiants"]
+
+
+def test_snippet_without_match():
+    generator = snippet_generator(20)
+    snippet, highlights = generator.snippet(
+        TEXT, encode_offsets(TEXT), ["inconnu"], "inconnu"
+    )
+    assert snippet == "Bienvenue sur le..." and highlights == []
+
+
+def test_snippet_refresh():
+    # The words added to the word cache are highlighted once the generator is refreshed
+    generator = snippet_generator(60)
+    text = "Le mémoire de recherche en statistique."
+    assert generator.snippet(text, encode_offsets(text), ["memoir"], "")[1] == []
+    generator.analyzer.word_cache.put("mémoire", "memoir")
+    generator.refresh()
+    assert generator.snippet(text, encode_offsets(text), ["memoir"], "")[1] == [(3, 10)]
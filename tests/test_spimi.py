@@ -0,0 +1,59 @@
+import io
+import json
+import pytest
+from backend.pages import iter_json_array
+from backend.spimi import SpimiBuilder
+
+DOCS = [
+    ["erreur", "pag", "introuv"],
+    ["accueil", "ensai"],
+    ["erreur", "erreur", "perdu"],
+    ["étudi", "écol", "ensai"],
+]
+
+
+def build(builder):
+    for doc_id, tokens in enumerate(DOCS):
+        builder.add(doc_id, tokens)
+    items = list(builder.merge())
+    n_runs = len(builder.runs)
+    builder.close()
+    return items, n_runs
+
+
+def test_merge_in_memory():
+    # Without flush, the index is sorted by term
+    items, n_runs = build(SpimiBuilder())
+    assert n_runs == 0
+    assert [term for term, _ in items] == sorted({t for doc in DOCS for t in doc})
+    assert dict(items)["erreur"] == [(0, [0]), (2, [0, 1])]
+
+
+def test_merge_runs_matches_in_memory():
+    # A tiny memory budget flushes every document to its own run
+    in_memory, _ = build(SpimiBuilder())
+    merged, n_runs = build(SpimiBuilder(memory_budget=0))
+    assert n_runs == len(DOCS)
+    assert [(t, [list(p) for p in ps]) for t, ps in in_memory] == merged
+
+
+def test_non_positional():
+    # Term frequencies replace the positions
+    items, _ = build(SpimiBuilder(positional=False, memory_budget=0))
+    assert dict(items)["erreur"] == [[0, 1], [2, 2]]
+
+
+def test_iter_json_array():
+    # Elements are decoded one by one across read chunks
+    pages = [{"url": f"https://www.ensai.fr/{i}", "title": "é" * i} for i in range(50)]
+    f = io.StringIO(json.dumps(pages, indent=2, ensure_ascii=False))
+    assert list(iter_json_array(f, chunk_size=7)) == pages
+
+
+def test_iter_json_array_invalid():
+    # Truncated and non-array files are rejected
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('[{"url": "a"}, {"url"')))
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('{"url": "a"}')))
+    assert list(iter_json_array(io.StringIO("[]"))) == []
@@ -0,0 +1,67 @@
+import os
+import sys
+from threading import Lock
+
+
+class Tee:
+    """
+    Text stream writing to several streams, e.g. the console and a log file.
+    """
+
+    def __init__(self, *streams):
+        """
+        Initializes the Tee.
+
+        :param streams: the streams to write to.
+
+        """
+        self.streams = streams
+        self._lock = Lock()
+
+    def write(self, text):
+        with self._lock:
+            for stream in self.streams:
+                stream.write(text)
+        return len(text)
+
+    def flush(self):
+        with self._lock:
+            for stream in self.streams:
+                stream.flush()
+
+    def isatty(self):
+        return False
+
+
+_configured = False
+
+
+def setup_logs(verbose=True, logs=False, logs_file="logs.log"):
+    """
+    This function applies the verbose and logs settings of the global-config to the
+    messages printed by the crawler, the indexer, the ranker and the API. It only applies
+    them once per process, so that the API started by main.py does not apply them again.
+    It replaces sys.stdout, so it is only called by main.py and when the API starts.
+
+    :param bool verbose: whether the messages are printed to the console.
+    :param bool logs: whether the messages are appended to logs_file.
+    :param str logs_file: the path to the log file.
+
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    streams = [sys.stdout] if verbose else []
+    if logs and logs_file:
+        # Line buffered, so that the log can be followed while the crawler runs
+        directory = os.path.dirname(logs_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        streams.append(open(logs_file, "a", encoding="utf-8", buffering=1))
+    if len(streams) == 1:
+        sys.stdout = streams[0]
+    else:
+        # Tee() without streams silences the messages
+        sys.stdout = Tee(*streams)
@@ -0,0 +1,110 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    """
+    Thread-safe bounded cache evicting the least recently used entries, with an optional
+    time-to-live and hit/miss counters.
+    """
+
+    def __init__(self, maxsize=100000, ttl=None):
+        """
+        Initializes the LRUCache.
+
+        :param int maxsize: the maximum number of entries.
+        :param float ttl: the number of seconds an entry is kept, or None to keep it until
+            it is evicted.
+
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # {key: (value, expiration time)}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """
+        Returns the value of a key and marks it as recently used.
+
+        :param key: the key.
+        :param default: the value to return if the key is missing or expired.
+        :return: the cached value or default.
+
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (item[1] is not None and item[1] < time.monotonic()):
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        """
+        Stores the value of a key, evicting the least recently used entry if needed.
+
+        :param key: the key.
+        :param value: the value.
+
+        """
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def update(self, items):
+        """
+        Stores several entries.
+
+        :param iterable items: the (key, value) pairs.
+
+        """
+        for key, value in items:
+            self.put(key, value)
+
+    def items(self):
+        """
+        Returns the entries from the least to the most recently used.
+
+        :return: a list of (key, value) pairs.
+
+        """
+        with self._lock:
+            return [(key, item[0]) for key, item in self._data.items()]
+
+    def clear(self):
+        """
+        Removes every entry.
+
+        """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Returns the usage statistics of the cache.
+
+        :return: a dictionary with the size, hits, misses and hit rate of the cache.
+
+        """
+        n_lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / n_lookups if n_lookups else 0,
+        }
@@ -0,0 +1,303 @@
+import bisect
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from threading import Lock
+
+# Upper bounds in seconds of the buckets of the duration histograms
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Stage durations of the request being profiled, {stage: seconds}, None when the request
+# is not profiled
+profile = ContextVar("profile", default=None)
+_NULL_TIMER = nullcontext()
+
+
+def format_labels(labels):
+    """
+    This function formats labels in the Prometheus text format.
+
+    :param tuple labels: the (name, value) pairs.
+    :return: the labels, e.g. '{stage="fetch"}', or "" without labels.
+
+    """
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = (
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Timer:
+    """
+    Context manager measuring the duration of a block into a histogram, and into the
+    profile of the current request if it is profiled.
+    """
+
+    __slots__ = ("histogram", "labels", "starting_time")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.starting_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.starting_time
+        stages = profile.get()
+        if stages is not None:
+            stage = ".".join(str(value) for _, value in self.labels)
+            stages[stage] = stages.get(stage, 0) + elapsed
+        if self.histogram.registry.enabled:
+            self.histogram.observe_labels(self.labels, elapsed)
+
+
+class Histogram:
+    """
+    Histogram of observations, e.g. durations, with one series per set of labels.
+    """
+
+    def __init__(self, registry, name, description, buckets=DEFAULT_BUCKETS):
+        """
+        Initializes the Histogram.
+
+        :param MetricsRegistry registry: the registry of the histogram.
+        :param str name: the name of the metric.
+        :param str description: the help text of the metric.
+        :param tuple buckets: the sorted upper bounds of the buckets.
+
+        """
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.series = {}  # {labels: [bucket counts, sum, count]}
+        self._lock = Lock()
+
+    def observe(self, value, **labels):
+        """
+        This function records an observation, if the registry is enabled.
+
+        :param float value: the observed value.
+        :param labels: the labels of the series.
+
+        """
+        if self.registry.enabled:
+            self.observe_labels(tuple(sorted(labels.items())), value)
+
+    def observe_labels(self, labels, value):
+        """
+        This function records an observation in the series of its labels.
+
+        :param tuple labels: the sorted (name, value) pairs of the labels of the series.
+        :param float value: the observed value.
+
+        """
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            if i < len(self.buckets):
+                series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """
+        This function measures the duration of a block, which is also added to the profile
+        of the current request, under the values of its labels, if it is profiled. When the
+        registry is disabled and the current request is not profiled, it costs a check.
+
+        :param labels: the labels of the series.
+        :return: a context manager.
+
+        """
+        if not self.registry.enabled and profile.get() is None:
+            return _NULL_TIMER
+        return Timer(self, tuple(sorted(labels.items())))
+
+    def render(self):
+        """
+        This function formats the histogram in the Prometheus text format.
+
+        :return: the lines of the histogram.
+
+        """
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = {
+                labels: (list(c), s, n) for labels, (c, s, n) in self.series.items()
+            }
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = format_labels(labels + (("le", bound),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = format_labels(labels + (("le", "+Inf"),))
+            lines.append(f"{self.name}_bucket{inf_labels} {count}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+class Counter:
+    """
+    Monotonic counter, with one series per set of labels.
+    """
+
+    def __init__(self, registry, name, description):
+        """
+        Initializes the Counter.
+
+        :param MetricsRegistry registry: the registry of the counter.
+        :param str name: the name of the metric.
+        :param str description: the help text of the metric.
+
+        """
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.series = {}  # {labels: value}
+        self._lock = Lock()
+
+    def inc(self, value=1, **labels):
+        """
+        This function increments the counter, if the registry is enabled.
+
+        :param float value: the increment.
+        :param labels: the labels of the series.
+
+        """
+        if not self.registry.enabled:
+            return
+        labels = tuple(sorted(labels.items()))
+        with self._lock:
+            self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self):
+        """
+        This function formats the counter in the Prometheus text format.
+
+        :return: the lines of the counter.
+
+        """
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            series = dict(self.series)
+        for labels, value in sorted(series.items()):
+            lines.append(f"{self.name}{format_labels(labels)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Set of the metrics of the process. The metrics only record observations once the
+    registry is enabled, so that instrumented code runs at full speed otherwise.
+    """
+
+    def __init__(self, enabled=False):
+        """
+        Initializes the MetricsRegistry.
+
+        :param bool enabled: whether the metrics record observations.
+
+        """
+        self.enabled = enabled
+        self.metrics = {}  # {name: metric}
+        self._lock = Lock()
+
+    def _register(self, cls, name, *args):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(self, name, *args)
+            return metric
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS):
+        """
+        This function returns the histogram of a name, creating it if needed.
+
+        :param str name: the name of the metric.
+        :param str description: the help text of the metric.
+        :param tuple buckets: the sorted upper bounds of the buckets.
+        :return: the Histogram.
+
+        """
+        return self._register(Histogram, name, description, buckets)
+
+    def counter(self, name, description):
+        """
+        This function returns the counter of a name, creating it if needed.
+
+        :param str name: the name of the metric.
+        :param str description: the help text of the metric.
+        :return: the Counter.
+
+        """
+        return self._register(Counter, name, description)
+
+    def render(self):
+        """
+        This function formats every metric in the Prometheus text format.
+
+        :return: the text exposition of the metrics.
+
+        """
+        lines = []
+        for name in sorted(self.metrics):
+            lines += self.metrics[name].render()
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        This function summarizes the histograms, e.g. at the end of a crawl.
+
+        :return: one line per series with its count, mean and total.
+
+        """
+        lines = []
+        for name in sorted(self.metrics):
+            metric = self.metrics[name]
+            if not isinstance(metric, Histogram):
+                continue
+            for labels, (_, total, count) in sorted(metric.series.items()):
+                mean = total / count * 1000 if count else 0
+                lines.append(
+                    f"{name}{format_labels(labels)}: {count} x {mean:.3f}ms "
+                    f"= {total:.2f}s"
+                )
+        return "\n".join(lines)
+
+
+# Metrics shared by the crawler, the indexer, the ranker and the API
+registry = MetricsRegistry()
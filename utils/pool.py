@@ -0,0 +1,82 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+
+
+class PoolSaturated(Exception):
+    """
+    Raised when a task is submitted to a BoundedPool whose queue is full.
+    """
+
+
+class BoundedPool:
+    """
+    Thread pool with a bounded number of running and queued tasks. Tasks submitted while
+    the pool is saturated are rejected at once instead of waiting, so that callers can shed
+    the load (e.g. answer 503) rather than pile up requests.
+    """
+
+    def __init__(self, n_threads=4, max_pending=64):
+        """
+        Initializes the BoundedPool.
+
+        :param int n_threads: the number of threads running the tasks.
+        :param int max_pending: the maximum number of tasks running or waiting for a thread.
+
+        """
+        self.n_threads = n_threads
+        self.max_pending = max_pending
+        self.n_rejected = 0
+        self._executor = ThreadPoolExecutor(n_threads, thread_name_prefix="noodle")
+        self._slots = BoundedSemaphore(max_pending)
+
+    def submit(self, function, *args):
+        """
+        Submits a task to the pool. The task runs in a copy of the context of the caller,
+        so that it sees its context variables, e.g. the profile of the current request.
+
+        :param callable function: the function to run.
+        :param args: the arguments of the function.
+        :return: a concurrent.futures.Future of the result.
+        :raises PoolSaturated: if max_pending tasks are already running or waiting.
+
+        """
+        if not self._slots.acquire(blocking=False):
+            self.n_rejected += 1
+            raise PoolSaturated(f"{self.max_pending} tasks are already pending.")
+
+        def task():
+            # The slot is freed before the result is delivered
+            try:
+                return function(*args)
+            finally:
+                self._slots.release()
+
+        context = contextvars.copy_context()
+        try:
+            return self._executor.submit(context.run, task)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def run(self, function, *args):
+        """
+        Runs a task in the pool without blocking the event loop.
+
+        :param callable function: the function to run.
+        :param args: the arguments of the function.
+        :return: the result of the function.
+        :raises PoolSaturated: if max_pending tasks are already running or waiting.
+
+        """
+        return await asyncio.wrap_future(self.submit(function, *args))
+
+    def shutdown(self, wait=True):
+        """
+        Stops the threads of the pool.
+
+        :param bool wait: whether to wait for the pending tasks.
+
+        """
+        self._executor.shutdown(wait=wait)
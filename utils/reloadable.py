@@ -0,0 +1,118 @@
+import json
+import os
+import time
+from threading import Lock, Thread
+
+
+def load_json(path):
+    """
+    This function loads a JSON file.
+
+    :param str path: the path to the JSON file.
+    :return: the parsed content of the file.
+
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ReloadableFile:
+    """
+    Keeps the parsed content of a file resident in memory and reloads it in the
+    background when the file is modified on disk. Readers always get the last
+    successfully loaded value and never wait for a reload to complete.
+    """
+
+    def __init__(self, path, loader=load_json, check_interval=1.0):
+        """
+        This function initializes the ReloadableFile class and loads the file.
+
+        :param str path: the path to the file.
+        :param callable loader: the function used to parse the file, called with the path.
+        :param float check_interval: the minimum number of seconds between two checks of the file.
+
+        """
+        self.path = path
+        self.loader = loader
+        self.check_interval = check_interval
+        self.n_reloads = 0
+
+        self._lock = Lock()
+        self._reloading = False
+        self._signature = self._stat()
+        self._value = self.loader(path)
+        self._last_check = time.monotonic()
+
+    def _stat(self):
+        """
+        This function returns the modification signature of the file.
+
+        :return: a (mtime, size) tuple, or None if the file does not exist.
+
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self):
+        """
+        This function returns the current value and schedules a reload if the file changed.
+
+        :return: the parsed content of the file.
+
+        """
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self.check()
+        return self._value
+
+    def check(self):
+        """
+        This function starts a background reload if the file changed since it was last loaded.
+
+        :return: True if a reload was started.
+
+        """
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return False
+
+        with self._lock:
+            if self._reloading:
+                return False
+            self._reloading = True
+
+        thread = Thread(target=self._reload, args=(signature,), daemon=True)
+        thread.start()
+        return True
+
+    def reload(self):
+        """
+        This function reloads the file synchronously.
+
+        """
+        self._reload(self._stat())
+
+    def _reload(self, signature):
+        """
+        This function loads the file and swaps the resident value.
+
+        :param tuple signature: the signature of the file being loaded.
+
+        """
+        try:
+            value = self.loader(self.path)
+        except (OSError, ValueError) as e:
+            # The file may be in the middle of being rewritten, keep the old
+            # value and try again on the next check
+            print(f"Could not reload {self.path}: {e}")
+        else:
+            self._value = value
+            self._signature = signature
+            self.n_reloads += 1
+        finally:
+            with self._lock:
+                self._reloading = False